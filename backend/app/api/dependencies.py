@@ -1,30 +1,91 @@
 # app/api/dependencies.py
 
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Mapping
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from app.utils.cache import load_cache_backend
+from app.utils.settings import settings
+from app.utils.admission import current_user_id
+import hashlib
+import time
 import jwt
-import os
-import json
+import logging
 
-jwt_secret = os.getenv("JWT_SECRET")
+jwt_secret = settings.jwt_secret
+logger = logging.getLogger(__name__)
 security = HTTPBearer()
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    print(f"Received Token: {token}")  # デバッグ用
-    print(f"JWT Secret: {jwt_secret[:5]}...")  # 最初の5文字のみ表示
+# 検証済みトークンのキャッシュ（トークンのexpを超えて保持しない）
+AUTH_CACHE_MAX_ENTRIES = settings.auth_cache_max_entries
+AUTH_CACHE_TTL = settings.auth_cache_ttl
+_verified_tokens = load_cache_backend(settings.cache_backend, namespace="auth", maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL)
+
+
+def auth_cache_stats() -> dict:
+    """検証済みトークンのキャッシュの統計（/metrics 用）"""
+    return _verified_tokens.stats
+
+
+@dataclass(frozen=True, slots=True)
+class CurrentUser:
+    """検証済みJWTから取り出したログインユーザー"""
+    id: str
+    email: str | None = None
+    user_metadata: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+    claims: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+    exp: float | None = None
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> "CurrentUser":
+        return cls(
+            id=payload["sub"],
+            email=payload.get("email"),
+            user_metadata=MappingProxyType(dict(payload.get("user_metadata") or {})),
+            claims=MappingProxyType(payload),
+            exp=payload.get("exp"),
+        )
+
+
+def _verify_token(token: str) -> CurrentUser:
     try:
         payload = jwt.decode(token, jwt_secret, algorithms=["HS256"], options={"verify_aud": False, "verify_signature": True})
-        print(f"Decoded Payload: {payload}")  # デバッグ用
-        user_id = payload.get('sub')
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return json.dumps(payload)  # ペイロード全体を文字列として返す
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidSignatureError:
-        print("Invalid signature detected")
         raise HTTPException(status_code=401, detail="Invalid token signature")
     except jwt.InvalidTokenError as e:
-        print(f"JWT Error: {e}")  # デバッグ用
+        logger.info("JWT Error: %s", e)
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    if payload.get('sub') is None:
         raise HTTPException(status_code=401, detail="Invalid token")
+    return CurrentUser.from_payload(payload)
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> CurrentUser:
+    user = await _authenticate(credentials.credentials)
+    # 上流のAI呼び出しの待ち行列をユーザーごとに公平にするため、リクエスト中のユーザーを記録する
+    current_user_id.set(user.id)
+    return user
+
+
+async def _authenticate(token: str) -> CurrentUser:
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+
+    # キャッシュには検証済みのペイロードを保存する（ワーカー間で共有する場合もJSONで保存できるように）
+    payload = await _verified_tokens.aget(cache_key)
+    now = time.time()
+    if payload is not None:
+        user = CurrentUser.from_payload(payload)
+        if user.exp is None or user.exp > now:
+            return user
+        await _verified_tokens.adelete(cache_key)
+        raise HTTPException(status_code=401, detail="Token has expired")
+
+    user = _verify_token(token)
+    ttl = AUTH_CACHE_TTL if user.exp is None else min(AUTH_CACHE_TTL, user.exp - now)
+    if ttl > 0:
+        await _verified_tokens.aset(cache_key, dict(user.claims), ttl=ttl)
+    return user
@@ -1,97 +1,404 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import List
-from app.schemas.food import Food, FoodCreate, FoodUpdate, RecipeRequest, RecipeResponse
+from app.schemas.food import (
+    Food, FoodCreate, FoodUpdate, FoodListItem, FoodSummary, RecipeRequest, RecipeResponse,
+    FoodBulkCreateRequest, FoodBulkUpdateRequest, FoodBulkUpdateItem, FoodBulkDeleteRequest, FoodBulkResponse,
+)
+from pydantic import ValidationError
 from app.api import dependencies as deps
-from app.utils.supabase_client import supabase
-from datetime import date
+from app.utils.supabase_async import supabase_async
+from datetime import date, timedelta
+import base64
+import uuid
 import json
-from app.utils.gemini_client import get_recipes_from_gemini
+import logging
+from app.utils.gemini_client import stream_recipe_events, recipe_to_events
+from app.services.recipe_service import recipe_service, recipe_cache_key
+from app.services.foods_cache import foods_cache, etag_matches
+from app.services.category_classifier import category_classifier
+from app.utils.admission import UpstreamBusyError
+from app.utils.settings import settings
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+FOOD_COLUMNS = ("id", "user_id", "name", "expiration_date", "category", "image_url")
+FOODS_DEFAULT_LIMIT = settings.foods_default_limit
+FOODS_MAX_LIMIT = settings.foods_max_limit
+
+def _encode_cursor(row: dict) -> str:
+    raw = f"{row['expiration_date']}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        expiration_date, food_id = raw.split("|", 1)
+        return date.fromisoformat(expiration_date).isoformat(), str(uuid.UUID(food_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursorが不正です")
+
+def _cached_response(entry: dict, if_none_match: str | None) -> Response:
+    """キャッシュエントリのETagがクライアントと一致すれば304を返す。
+
+    本文はDBから取得した行（列を指定して取得しているため response_model と同じ形）なので、
+    FastAPIでの検証・変換を省いてそのままorjsonで返す。
+    """
+    headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache", **entry.get("headers", {})}
+    if etag_matches(if_none_match, entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(entry["body"], headers=headers)
+
+def _parse_fields(fields: str | None) -> list[str]:
+    if not fields:
+        return list(FOOD_COLUMNS)
+    columns = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = set(columns) - set(FOOD_COLUMNS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不明なフィールドです: {', '.join(sorted(unknown))}")
+    # カーソルの生成に必要な列は常に取得する
+    for column in ("id", "expiration_date"):
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+@router.get("/", response_model=List[FoodListItem], response_model_exclude_unset=True)
+async def read_foods(
+    cursor: str | None = Query(None, description="前のページのX-Next-Cursorヘッダーの値"),
+    limit: int = Query(FOODS_DEFAULT_LIMIT, ge=1, le=FOODS_MAX_LIMIT),
+    category: str | None = None,
+    expiring_within_days: int | None = Query(None, ge=0, description="今日からN日以内に期限が切れる食品のみ"),
+    expired: bool | None = Query(None, description="true: 期限切れのみ / false: 期限内のみ"),
+    name_prefix: str | None = None,
+    fields: str | None = Query(None, description="取得する列をカンマ区切りで指定（例: id,name,expiration_date,category）"),
+    include_total: bool = False,
+    if_none_match: str | None = Header(None),
+    current_user: deps.CurrentUser = Depends(deps.get_current_user),
+):
+    columns = _parse_fields(fields)
+    user_id = current_user.id
+    today = date.today()
+    cache_params = {
+        "cursor": cursor, "limit": limit, "category": category, "expiring_within_days": expiring_within_days,
+        "expired": expired, "name_prefix": name_prefix, "fields": fields, "include_total": include_total,
+        "today": today.isoformat(),
+    }
+    cached = await foods_cache.get_list(user_id, cache_params)
+    if cached is not None:
+        return _cached_response(cached, if_none_match)
+
+    try:
+
+        query = supabase_async.table("foods").select(",".join(columns), count="exact" if include_total else None).eq("user_id", user_id)
+        if category:
+            query = query.eq("category", category)
+        if expired is True:
+            query = query.lt("expiration_date", today.isoformat())
+        elif expired is False:
+            query = query.gte("expiration_date", today.isoformat())
+        if expiring_within_days is not None:
+            query = query.gte("expiration_date", today.isoformat()).lte(
+                "expiration_date", (today + timedelta(days=expiring_within_days)).isoformat()
+            )
+        if name_prefix:
+            # PostgRESTのワイルドカード * は取り除き、LIKEの % _ は文字として扱う
+            escaped = name_prefix.replace("*", "").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query = query.ilike("name", f"{escaped}*")
+        if cursor:
+            after_date, after_id = _decode_cursor(cursor)
+            query = query.or_(f"expiration_date.gt.{after_date},and(expiration_date.eq.{after_date},id.gt.{after_id})")
+
+        # 1件多く取得して次のページの有無を判定する
+        result = await query.order("expiration_date").order("id").limit(limit + 1).execute()
+        rows = result.data
+
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers["X-Next-Cursor"] = _encode_cursor(rows[-1])
+        if include_total:
+            headers["X-Total-Count"] = str(result.count)
+
+        if fields:
+            # カーソル用に追加取得した列は、指定されていなければレスポンスから除く
+            requested = {f.strip() for f in fields.split(",")} | {"id"}
+            rows = [{key: value for key, value in row.items() if key in requested} for row in rows]
+
+        entry = await foods_cache.set_list(user_id, cache_params, rows, headers)
+        return _cached_response(entry, if_none_match)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error in read_foods: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _summary_totals(categories: list[dict]) -> dict:
+    buckets = ("expired", "today", "this_week", "later", "total")
+    return {bucket: sum(row[bucket] for row in categories) for bucket in buckets}
+
+# /{food_id} より前に定義する（"summary" がIDとして解釈されないように）
+@router.get("/summary", response_model=FoodSummary)
+async def read_foods_summary(
+    soon_days: int = Query(7, ge=1, le=31, description="this_week に数える日数（明日〜N日後）"),
+    limit: int = Query(5, ge=0, le=50, description="expiring_soon に含める件数"),
+    if_none_match: str | None = Header(None),
+    current_user: deps.CurrentUser = Depends(deps.get_current_user),
+):
+    """ダッシュボード用の集計。件数はカテゴリ数、一覧は limit 件までなので、食品の数によらず一定の大きさになる"""
+    user_id = current_user.id
+    today = date.today()
+    cache_params = {"soon_days": soon_days, "limit": limit, "today": today.isoformat()}
+    cached = await foods_cache.get_summary(user_id, cache_params)
+    if cached is not None:
+        return _cached_response(cached, if_none_match)
 
-@router.get("/", response_model=List[Food])
-async def read_foods(current_user: str = Depends(deps.get_current_user)):
-    print("Entering read_foods function")  # 関数の開始をログ
     try:
-        print(f"Current user: {current_user}")  # 現在のユーザー情報をログ
-        user_payload = json.loads(current_user)
-        user_id = user_payload.get('sub')
-        print(f"User ID: {user_id}")
-        response = supabase.table("foods").select("*").eq("user_id", user_id).execute()
-        print(f"Supabase response: {response}")
-        return response.data
+        # 集計はDB側で (user_id, expiration_date) のインデックスを使って1回で行う
+        result = await supabase_async.rpc("food_summary", {
+            "target_user_id": user_id,
+            "today": today.isoformat(),
+            "soon_days": soon_days,
+            "top_k": limit,
+        }).execute()
     except Exception as e:
-        print(f"Error in read_foods: {str(e)}")
+        logger.error("Error in read_foods_summary: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+    categories = result.data["categories"]
+    summary = {
+        "today": today.isoformat(),
+        "soon_days": soon_days,
+        "totals": _summary_totals(categories),
+        "categories": categories,
+        "expiring_soon": result.data["expiring_soon"],
+    }
+    entry = await foods_cache.set_summary(user_id, cache_params, summary)
+    return _cached_response(entry, if_none_match)
+
 @router.post("/", response_model=Food)
-async def create_food(food: FoodCreate, current_user: str = Depends(deps.get_current_user)):
+async def create_food(food: FoodCreate, current_user: deps.CurrentUser = Depends(deps.get_current_user)):
     try:
-        user_payload = json.loads(current_user)
-        user_id = user_payload.get('sub')
-        print(f"Received food data: {food}")  # デバッグ用ログ
+        user_id = current_user.id
+        logger.debug("Received food data: %s", food)
         food_data = food.dict()
         food_data["user_id"] = user_id
         food_data["expiration_date"] = food_data["expiration_date"].isoformat()  # dateオブジェクトを文字列に変換
         # image_urlがNoneでない場合のみ保存
         if food_data["image_url"]:
             food_data["image_url"] = food_data["image_url"]
-        response = supabase.table("foods").insert(food_data).execute()
+        response = await supabase_async.table("foods").insert(food_data).execute()
+        await foods_cache.on_write(user_id, rows=response.data)
+        # ユーザーが確定したカテゴリを、OCR時のカテゴリ推定に使う
+        category_classifier.learn(user_id, food.name, food.category)
         return response.data[0]
     except Exception as e:
-        print(f"Error creating food: {str(e)}")  # エラーログ
+        logger.error("Error creating food: %s", e)
         raise HTTPException(status_code=422, detail=f"データの処理中にエラーが発生しました: {str(e)}")
 
+def _food_row(food: FoodCreate | FoodUpdate, user_id: str) -> dict:
+    food_data = food.dict()
+    food_data["user_id"] = user_id
+    food_data["expiration_date"] = food_data["expiration_date"].isoformat()
+    return food_data
+
+def _validation_detail(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+
+# 一括処理のルートは /{food_id} より前に定義する（"bulk" がIDとして解釈されないように）
+@router.post("/bulk", response_model=FoodBulkResponse)
+async def bulk_create_foods(request: FoodBulkCreateRequest, current_user: deps.CurrentUser = Depends(deps.get_current_user)):
+    user_id = current_user.id
+
+    results = []
+    rows = []
+    indexes = []
+    for index, item in enumerate(request.items):
+        try:
+            rows.append(_food_row(FoodCreate.model_validate(item), user_id))
+            indexes.append(index)
+        except ValidationError as e:
+            results.append({"index": index, "status": "invalid", "detail": _validation_detail(e)})
+
+    if rows:
+        try:
+            # 検証を通過した要素を1回のINSERTでまとめて登録する
+            response = await supabase_async.table("foods").insert(rows).execute()
+        except Exception as e:
+            logger.error("Error in bulk_create_foods: %s", e)
+            raise HTTPException(status_code=422, detail=f"データの処理中にエラーが発生しました: {str(e)}")
+        await foods_cache.on_write(user_id, rows=response.data)
+        for index, row in zip(indexes, response.data):
+            category_classifier.learn(user_id, row["name"], row["category"])
+            results.append({"index": index, "status": "created", "id": row["id"], "food": row})
+
+    return {"results": sorted(results, key=lambda r: r["index"])}
+
+@router.put("/bulk", response_model=FoodBulkResponse)
+async def bulk_update_foods(request: FoodBulkUpdateRequest, current_user: deps.CurrentUser = Depends(deps.get_current_user)):
+    user_id = current_user.id
+
+    results = []
+    updates: dict[str, tuple[int, dict]] = {}
+    for index, item in enumerate(request.items):
+        try:
+            food = FoodBulkUpdateItem.model_validate(item)
+        except ValidationError as e:
+            results.append({"index": index, "status": "invalid", "detail": _validation_detail(e)})
+            continue
+        row = _food_row(food, user_id)
+        row["id"] = str(food.id)
+        if row["id"] in updates:
+            # 同じIDが複数含まれる場合は最後の要素を採用する
+            results.append({"index": updates[row["id"]][0], "status": "invalid", "id": row["id"], "detail": "同じIDが複数指定されています"})
+        updates[row["id"]] = (index, row)
+
+    if updates:
+        try:
+            # 他のユーザーの行を上書きしないよう、所有している行だけを対象にする
+            owned = await supabase_async.table("foods").select("id").eq("user_id", user_id).in_("id", list(updates)).execute()
+            owned_ids = {row["id"] for row in owned.data}
+            rows = [row for food_id, (_, row) in updates.items() if food_id in owned_ids]
+            response = await supabase_async.table("foods").upsert(rows, on_conflict="id").execute() if rows else None
+        except Exception as e:
+            logger.error("Error in bulk_update_foods: %s", e)
+            raise HTTPException(status_code=422, detail=f"データの更新中にエラーが発生しました: {str(e)}")
+
+        updated = {row["id"]: row for row in response.data} if response else {}
+        await foods_cache.on_write(user_id, rows=list(updated.values()))
+        for food_id, (index, _) in updates.items():
+            if food_id in updated:
+                results.append({"index": index, "status": "updated", "id": food_id, "food": updated[food_id]})
+            else:
+                results.append({"index": index, "status": "not_found", "id": food_id, "detail": "Food not found"})
+
+    return {"results": sorted(results, key=lambda r: r["index"])}
+
+@router.post("/bulk/delete", response_model=FoodBulkResponse)
+async def bulk_delete_foods(request: FoodBulkDeleteRequest, current_user: deps.CurrentUser = Depends(deps.get_current_user)):
+    user_id = current_user.id
+    ids = [str(food_id) for food_id in request.ids]
+    if not ids:
+        return {"results": []}
+
+    try:
+        response = await supabase_async.table("foods").delete().eq("user_id", user_id).in_("id", ids).execute()
+    except Exception as e:
+        logger.error("Error in bulk_delete_foods: %s", e)
+        raise HTTPException(status_code=422, detail=f"データの削除中にエラーが発生しました: {str(e)}")
+
+    deleted = {row["id"]: row for row in response.data}
+    await foods_cache.on_write(user_id, deleted_ids=list(deleted))
+    return {"results": [
+        {"index": index, "status": "deleted", "id": food_id, "food": deleted[food_id]}
+        if food_id in deleted else
+        {"index": index, "status": "not_found", "id": food_id, "detail": "Food not found"}
+        for index, food_id in enumerate(ids)
+    ]}
+
 @router.get("/{food_id}", response_model=Food)
-async def read_food(food_id: str, current_user: str = Depends(deps.get_current_user)):
-    user_payload = json.loads(current_user)
-    user_id = user_payload.get('sub')
-    response = supabase.table("foods").select("*").eq("id", food_id).eq("user_id", user_id).execute()
-    if not response.data:
-        raise HTTPException(status_code=404, detail="Food not found")
-    return response.data[0]
+async def read_food(
+    food_id: str,
+    if_none_match: str | None = Header(None),
+    current_user: deps.CurrentUser = Depends(deps.get_current_user),
+):
+    user_id = current_user.id
+    cached = await foods_cache.get_item(user_id, food_id)
+    if cached is None:
+        result = await supabase_async.table("foods").select(",".join(FOOD_COLUMNS)).eq("id", food_id).eq("user_id", user_id).execute()
+        if not result.data:
+            raise HTTPException(status_code=404, detail="Food not found")
+        cached = await foods_cache.set_item(user_id, result.data[0])
+    return _cached_response(cached, if_none_match)
 
 @router.put("/{food_id}", response_model=Food)
-async def update_food(food_id: str, food: FoodUpdate, current_user: str = Depends(deps.get_current_user)):
+async def update_food(food_id: str, food: FoodUpdate, current_user: deps.CurrentUser = Depends(deps.get_current_user)):
     try:
-        user_payload = json.loads(current_user)
-        user_id = user_payload.get('sub')
+        user_id = current_user.id
         
         # food_dataをdict形式で取得し、expiration_dateを文字列に変換
         food_data = food.dict()
         food_data["expiration_date"] = food_data["expiration_date"].isoformat()
         
-        response = supabase.table("foods").update(food_data).eq("id", food_id).eq("user_id", user_id).execute()
+        response = await supabase_async.table("foods").update(food_data).eq("id", food_id).eq("user_id", user_id).execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Food not found")
+        await foods_cache.on_write(user_id, rows=response.data)
+        if food.category:
+            category_classifier.learn(user_id, food.name, food.category)
         return response.data[0]
     except Exception as e:
-        print(f"Error updating food: {str(e)}")  # エラーログ
+        logger.error("Error updating food: %s", e)
         raise HTTPException(status_code=422, detail=f"データの更新中にエラーが発生しました: {str(e)}")
 
 @router.delete("/{food_id}", response_model=Food)
-async def delete_food(food_id: str, current_user: str = Depends(deps.get_current_user)):
-    user_payload = json.loads(current_user)
-    user_id = user_payload.get('sub')
-    response = supabase.table("foods").delete().eq("id", food_id).eq("user_id", user_id).execute()
+async def delete_food(food_id: str, current_user: deps.CurrentUser = Depends(deps.get_current_user)):
+    user_id = current_user.id
+    response = await supabase_async.table("foods").delete().eq("id", food_id).eq("user_id", user_id).execute()
     if not response.data:
         raise HTTPException(status_code=404, detail="Food not found")
+    await foods_cache.on_write(user_id, deleted_ids=[food_id])
     return response.data[0]
 
 @router.post("/recipes", response_model=RecipeResponse)
-async def get_recipes(request: RecipeRequest, token: str = Depends(deps.get_current_user)):
+async def get_recipes(request: RecipeRequest, current_user: deps.CurrentUser = Depends(deps.get_current_user)):
     try:
         # リクエストの受信をログ
-        print("Received request for /api/foods/recipes")
-        print(f"Request data: {request}")
+        logger.debug("Received request for /api/foods/recipes: %s", request)
         
-        recipes = await get_recipes_from_gemini(request.ingredients)
+        recipes = await recipe_service.get_recipes(
+            request.ingredients, request.cooking_time, request.difficulty, request.variety
+        )
         
         # レシピの取得をログ
-        print(f"Retrieved recipes: {recipes}")
+        logger.debug("Retrieved recipes: %s", recipes)
         
         return {"recipes": recipes}
+    except UpstreamBusyError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="レシピの生成が混み合っています。しばらくしてから再度お試しください",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         # エラーの詳細をログ
-        print(f"Error in get_recipes: {str(e)}")
+        logger.error("Error in get_recipes: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/recipes/stream")
+async def stream_recipes(request: RecipeRequest, current_user: deps.CurrentUser = Depends(deps.get_current_user)):
+    # レシピを解析できた項目から順にServer-Sent Eventsで返す
+    # イベント: name, cooking_time, difficulty, ingredient, step, tip, done, error
+    async def event_stream():
+        try:
+            # キャッシュ済みのレシピはGeminiを呼ばずにイベントとして再生する
+            # （variety の場合はバリアントが揃うまで生成し、生成したレシピは次のバリアントとして保存する）
+            cached = await recipe_service.lookup(
+                request.ingredients, request.cooking_time, request.difficulty, request.variety
+            )
+            if cached:
+                for event, data in recipe_to_events(cached[0]):
+                    yield _sse(event, data)
+                return
+
+            async for event, data in stream_recipe_events(request.ingredients, request.cooking_time, request.difficulty):
+                if event == "done":
+                    await recipe_service.store(
+                        recipe_cache_key(request.ingredients, request.cooking_time, request.difficulty), [data]
+                    )
+                yield _sse(event, data)
+        except UpstreamBusyError as e:
+            # ストリーミングの開始後はステータスコードを変えられないため、イベントで再試行までの秒数を返す
+            yield _sse("error", {"detail": "レシピの生成が混み合っています", "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error("Error in stream_recipes: %s", e)
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,21 +1,80 @@
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
-from google.cloud import vision
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from app.api import dependencies as deps
-from app.services.ocr_service import process_image
-from typing import Dict
+from app.services.ocr_service import process_image, process_images_batch
+from app.services.ocr_executor import OCRQueueFullError, ocr_executor
+from app.utils.admission import UpstreamBusyError
+from app.services.ocr_cache import ocr_cache
+from app.services.model_tiers import ocr_model_tiers
+from app.utils.settings import settings
+from typing import Dict, List
+import json
 
 router = APIRouter()
 
+OCR_BATCH_MAX_IMAGES = settings.ocr_batch_max_images
+
+def queue_full_exception(e: OCRQueueFullError | UpstreamBusyError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="OCR処理が混み合っています。しばらくしてから再度お試しください",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
 @router.post("/ocr")
 async def ocr_image(
     image: UploadFile = File(...),
-    current_user: str = Depends(deps.get_current_user)
-) -> Dict[str, str]:
+    # Falseの場合は商品名・カテゴリが分からなくてもよいものとし、賞味期限を確実に読み取れればGeminiを呼ばない
+    details: bool = Query(True),
+    current_user: deps.CurrentUser = Depends(deps.get_current_user)
+) -> Dict[str, str | bool]:
     if not image.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="アップロードされたファイルは画像ではありません")
 
     try:
-        ocr_result = await process_image(image)
+        ocr_result = await process_image(image, details, current_user.id)
         return ocr_result
+    except (OCRQueueFullError, UpstreamBusyError) as e:
+        raise queue_full_exception(e)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"OCR処理中にエラーが発生しました: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"OCR処理中にエラーが発生しました: {str(e)}")
+
+@router.post("/ocr/batch")
+async def ocr_images_batch(
+    images: List[UploadFile] = File(...),
+    details: bool = Query(True),
+    current_user: deps.CurrentUser = Depends(deps.get_current_user)
+):
+    if len(images) > OCR_BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"一度にアップロードできる画像は{OCR_BATCH_MAX_IMAGES}枚までです")
+    try:
+        ocr_executor.ensure_capacity()
+    except OCRQueueFullError as e:
+        raise queue_full_exception(e)
+
+    # 画像でないファイルはその要素だけエラーとして返す
+    errors = []
+    indexes = []
+    contents = []
+    for index, image in enumerate(images):
+        if not (image.content_type or "").startswith("image/"):
+            errors.append({"index": index, "filename": image.filename, "status": "error", "detail": "アップロードされたファイルは画像ではありません"})
+            continue
+        indexes.append(index)
+        contents.append(await image.read())
+
+    async def stream():
+        for error in errors:
+            yield json.dumps(error, ensure_ascii=False) + "\n"
+        if contents:
+            async for item in process_images_batch(contents, details, current_user.id):
+                index = indexes[item["index"]]
+                item.update(index=index, filename=images[index].filename)
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    # 結果は完了した画像から順にNDJSONで返す
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/ocr/stats")
+async def ocr_stats(current_user: deps.CurrentUser = Depends(deps.get_current_user)):
+    return {"cache": ocr_cache.stats, "executor": ocr_executor.stats, "models": ocr_model_tiers.stats}
@@ -0,0 +1,53 @@
+# app/api/routes/metrics.py
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.api import dependencies as deps
+from app.services.foods_cache import foods_cache
+from app.services.notification_service import notification_service
+from app.services.ocr_cache import ocr_cache
+from app.services.ocr_executor import ocr_executor
+from app.utils.admission import admission
+from app.services.recipe_service import recipe_service
+from app.utils.metrics import registry
+from app.utils.settings import settings
+
+router = APIRouter()
+
+# 設定されている場合は Authorization: Bearer <METRICS_TOKEN> を要求する
+METRICS_TOKEN = settings.metrics_token
+
+CACHES = {
+    "auth": deps.auth_cache_stats,
+    "foods": lambda: foods_cache.stats,
+    "notification_settings": lambda: notification_service.stats,
+    "ocr": lambda: ocr_cache.stats,
+    "recipes": lambda: recipe_service.stats,
+}
+
+
+def _cache_samples(stat: str):
+    for name, get_stats in CACHES.items():
+        stats = get_stats()
+        if stat in stats:
+            yield {"cache": name}, stats[stat]
+
+
+registry.collector("cache_hits_total", "キャッシュのヒット数", "counter", lambda: _cache_samples("hits"))
+registry.collector("cache_misses_total", "キャッシュのミス数", "counter", lambda: _cache_samples("misses"))
+registry.collector("cache_hit_ratio", "キャッシュのヒット率", "gauge", lambda: _cache_samples("hit_rate"))
+registry.collector("cache_lock_timeouts_total", "共有キャッシュのロック待ちが上限を超え、ミス・省略として扱った回数", "counter", lambda: _cache_samples("lock_timeouts"))
+registry.collector("ocr_executor_jobs", "OCR処理の実行中・待機中の件数", "gauge", lambda: [
+    ({"state": "running"}, ocr_executor.stats["running"]),
+    ({"state": "waiting"}, ocr_executor.stats["waiting"]),
+])
+registry.collector("admission_waiting", "上流の呼び出し枠を待っているリクエスト数", "gauge", lambda: [
+    ({"upstream": upstream}, stats["waiting"]) for upstream, stats in admission.stats.items()
+])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics(authorization: str | None = Header(default=None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
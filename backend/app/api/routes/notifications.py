@@ -1,60 +1,56 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException
-from app.api.dependencies import get_current_user
+from app.api.dependencies import CurrentUser, get_current_user
 from app.schemas.notification import NotificationSettings, NotificationUpdate
-from app.services.notification_service import NotificationService
-import json
+from app.services.notification_service import notification_service
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.get("/", response_model=NotificationSettings)
-def get_notification_settings(current_user: str = Depends(get_current_user)):
+async def get_notification_settings(current_user: CurrentUser = Depends(get_current_user)):
     try:
-        user_data = json.loads(current_user)
-        user_id = user_data.get("sub")
+        user_id = current_user.id
         if not user_id:
             raise HTTPException(status_code=400, detail="ユーザーIDが見つかりません")
         
-        notification_service = NotificationService()
-        settings = notification_service.get_settings(user_id)
+        settings = await notification_service.get_settings(user_id)
         return settings
     except Exception as e:
-        print(f"Error in get_notification_settings: {str(e)}")
+        logger.error("Error in get_notification_settings: %s", e)
         raise HTTPException(status_code=500, detail=f"通知設定の取得中にエラーが発生しました: {str(e)}")
 
 @router.put("/", response_model=NotificationSettings)
-def update_notification_settings(
+async def update_notification_settings(
     update: NotificationUpdate,
-    current_user: str = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
+    user_id = current_user.id
+    if not user_id:
+        raise HTTPException(status_code=400, detail="ユーザーIDが見つかりません")
+    
     try:
-        user_data = json.loads(current_user)
-        user_id = user_data.get("sub")
-        if not user_id:
-            raise HTTPException(status_code=400, detail="ユーザーIDが見つかりません")
-        
-        notification_service = NotificationService()
-        try:
-            updated_settings = notification_service.update_settings(user_id, update)
-            return updated_settings
-        except Exception as e:
-            print(f"Error updating settings: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"設定の更新中にエラーが発生しました: {str(e)}")
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="無効なユーザーデータ")
+        updated_settings = await notification_service.update_settings(user_id, update)
+        return updated_settings
+    except Exception as e:
+        logger.error("Error updating settings: %s", e)
+        raise HTTPException(status_code=500, detail=f"設定の更新中にエラーが発生しました: {str(e)}")
 
 @router.post("/send")
-def send_notification(
+async def send_notification(
     food_id: str,
-    current_user: str = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     try:
-        user_data = json.loads(current_user)
-        user_id = user_data.get("sub")
+        user_id = current_user.id
         if not user_id:
             raise HTTPException(status_code=400, detail="ユーザーIDが見つかりません")
         
-        notification_service = NotificationService()
-        result = notification_service.send_notification(user_id, food_id)
+        sent = await notification_service.send_notification(user_id, food_id)
+        if not sent:
+            raise HTTPException(status_code=404, detail="Food not found")
         return {"message": "通知が送信されました", "status": "success"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"通知の送信中にエラーが発生しました: {str(e)}")
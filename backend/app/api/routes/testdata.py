@@ -1,16 +1,20 @@
 # app/api/routes/testdata.py
 
+import logging
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from app.api.dependencies import get_current_user  # 既に作成済みのユーザー認証関数を使用
-from app.utils.supabase_client import supabase
+from app.api.dependencies import CurrentUser, get_current_user  # 既に作成済みのユーザー認証関数を使用
+from app.utils.supabase_async import supabase_async
+from app.services.foods_cache import foods_cache
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.post("/api/testdata")
-def create_test_data(user_id: str = Depends(get_current_user)):
+async def create_test_data(current_user: CurrentUser = Depends(get_current_user)):
     try:
-        print("create_test_data called")
+        user_id = current_user.id
+        logger.debug("create_test_data called")
         # カラム名を 'expiry_date' から 'expiration_date' に修正
         test_data = [
             { "user_id": user_id, "name": "りんご", "expiration_date": "2024-09-25","category":"果物"},
@@ -22,12 +26,10 @@ def create_test_data(user_id: str = Depends(get_current_user)):
             { "user_id": user_id, "name": "チョコレート", "expiration_date": "2024-09-20","category":"菓子"},
         ]
         # 'expiration_date' を使用してデータを挿入
-        response = supabase.from_("foods").insert(test_data).execute()
-        if response.get("error"):
-            print(f"Error inserting data: {response['error']}")  # デバッグ用ログ
-            return {"error": response["error"]}
-        print("Test data inserted successfully")  # デバッグ用ログ
+        response = await supabase_async.table("foods").insert(test_data).execute()
+        await foods_cache.on_write(user_id, rows=response.data)
+        logger.info("Test data inserted successfully")
         return {"message": "テストデータが追加されました"}
     except Exception as e:
-        print(f"Error: {e}")  # 例外が発生した場合のログ出力
+        logger.error("Error: %s", e)
         return {"error": str(e)}
@@ -1,16 +1,63 @@
 # app/main.py
 
-import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import foods, images, user, notifications, test, testdata
+from fastapi.responses import ORJSONResponse
+from app.api.routes import foods, images, user, notifications, test, testdata, metrics
 from app.api.routes import test
 from app.api.routes import testdata  # testdataのルートをインポート
+from app.services.ocr_executor import ocr_executor
+from app.utils.ai_clients import ai_clients
+from app.services.notification_scheduler import notification_scheduler
+from app.utils.supabase_async import supabase_async
+from app.utils.log import setup_logging, shutdown_logging
+from app.utils.compression import CompressionMiddleware
+from app.utils.settings import settings
+from app.utils.metrics import http_requests, http_request_duration, http_in_flight
 
-load_dotenv()
+setup_logging()
+logger = logging.getLogger(__name__)
+access_logger = logging.getLogger("app.access")
 
-app = FastAPI()
+async def preload_ai_clients():
+    """Vision / Gemini のSDKとクライアントを読み込み、gRPCチャネルを事前接続しておく"""
+    try:
+        await ocr_executor.run(ai_clients.start)
+        if settings.ai_clients_warmup:
+            await ocr_executor.run(ai_clients.warm_up)
+    except Exception as e:
+        # 認証情報がなくても食品のCRUDなどは使えるようにする（OCR・レシピは初回利用時にエラーになる）
+        logger.warning("AIクライアントの事前読み込みに失敗しました: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # PostgREST / Storage の接続プールを作成
+    supabase_async.start()
+    # 重いSDKの読み込みは既定ではバックグラウンドで行い、起動（リクエストの受付開始）を待たせない
+    preload = None
+    if settings.ai_clients_preload == "startup":
+        await preload_ai_clients()
+    elif settings.ai_clients_preload == "background":
+        preload = asyncio.create_task(preload_ai_clients())
+    # 賞味期限通知のスケジューラ（複数ワーカー構成では1プロセスだけで有効にする）
+    if settings.notification_scheduler_enabled:
+        notification_scheduler.start()
+    yield
+    if preload is not None and not preload.done():
+        preload.cancel()
+    await notification_scheduler.stop()
+    # OCR用スレッドプールを停止
+    ocr_executor.shutdown()
+    ai_clients.close()
+    await supabase_async.close()
+    shutdown_logging()
+
+# JSONの組み立てはorjsonで行う（標準のjsonより速く、UUID・日付もそのまま扱える）
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORSの設定
 app.add_middleware(
@@ -19,9 +66,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*", "Authorization"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Total-Count"],
+)
+
+# 大きいJSONレスポンス（食品一覧・OCR結果など）の圧縮
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression_min_size,
+    gzip_level=settings.compression_gzip_level,
+    brotli_quality=settings.compression_brotli_quality,
 )
 
 # ルーターの追加
+app.include_router(metrics.router)
 app.include_router(test.router)
 app.include_router(testdata.router)
 app.include_router(foods.router, prefix="/api/foods", tags=["foods"])
@@ -33,10 +90,54 @@ app.include_router(notifications.router, prefix="/api/notifications", tags=["not
 def read_root():
     return {"message": "Hello, World!"}
 
+def _record_request(request: Request, status: int, start: float):
+    # ルートのテンプレート（/api/foods/{food_id} など）単位で集計し、未定義のパスは1つにまとめる
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else "unmatched"
+    duration = time.perf_counter() - start
+    http_in_flight.dec()
+    http_requests.inc(method=request.method, route=route_path, status=status)
+    http_request_duration.observe(duration, method=request.method, route=route_path)
+    access_logger.debug("request", extra={"fields": {
+        "method": request.method,
+        "route": route_path,
+        "status": status,
+        "duration_ms": round(duration * 1000, 1),
+        "origin": request.headers.get("origin"),
+    }})
+
+class _RecordOnSent:
+    """レスポンスの送信が終わった時点で on_sent を呼ぶ。
+
+    ストリーミングレスポンス（NDJSON / SSE）は本文を送り終えた時点で記録する。
+    本文の送信前の切断や送信時のエラーでは本文のイテレータが開始されないことがあるため、
+    送信処理全体を try/finally で囲む。
+    """
+
+    def __init__(self, response, on_sent):
+        self.response = response
+        self.on_sent = on_sent
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.response(scope, receive, send)
+        finally:
+            self.on_sent()
+
 @app.middleware("http")
-async def log_requests(request: Request, call_next):
-    print(f"Received request from origin: {request.headers.get('origin')}")
-    response = await call_next(request)
-    return response
+async def instrument_requests(request: Request, call_next):
+    start = time.perf_counter()
+    http_in_flight.inc()
+    try:
+        response = await call_next(request)
+    except Exception:
+        _record_request(request, 500, start)
+        raise
+    except asyncio.CancelledError:
+        # 応答を返す前にクライアントが切断した（nginxに合わせて499として数える）
+        _record_request(request, 499, start)
+        raise
+
+    return _RecordOnSent(response, lambda: _record_request(request, response.status_code, start))
 
 
@@ -1,7 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import date
 from uuid import UUID
-from typing import List
+from typing import Any, Dict, List
+from app.utils.settings import settings
 
 class FoodBase(BaseModel):
     name: str
@@ -22,9 +23,63 @@ class Food(FoodBase):
     class Config:
         from_attributes = True  # 'orm_mode'の代わりにこれを使用
 
+class FoodListItem(BaseModel):
+    """一覧表示用。fieldsで指定されなかった列はレスポンスに含めない"""
+    id: UUID
+    user_id: UUID | None = None
+    name: str | None = None
+    expiration_date: date | None = None
+    category: str | None = None
+    image_url: str | None = None
+
+class FoodSummaryCounts(BaseModel):
+    """期限の区分ごとの件数（this_week は明日〜soon_days日後）"""
+    expired: int = 0
+    today: int = 0
+    this_week: int = 0
+    later: int = 0
+    total: int = 0
+
+class FoodCategorySummary(FoodSummaryCounts):
+    category: str | None = None
+
+class FoodSummary(BaseModel):
+    today: date
+    soon_days: int
+    totals: FoodSummaryCounts
+    categories: List[FoodCategorySummary]
+    expiring_soon: List[FoodListItem]  # 今日以降で期限が近い順
+
+class FoodBulkUpdateItem(FoodUpdate):
+    id: UUID
+
+# 一括処理では要素ごとに検証するため、itemsは辞書のまま受け取る
+# 件数の上限はリクエストの解析時に検証し、上限を超える要素まで読み進めない
+class FoodBulkCreateRequest(BaseModel):
+    items: List[Dict[str, Any]] = Field(max_length=settings.foods_bulk_max_items)
+
+class FoodBulkUpdateRequest(BaseModel):
+    items: List[Dict[str, Any]] = Field(max_length=settings.foods_bulk_max_items)
+
+class FoodBulkDeleteRequest(BaseModel):
+    ids: List[UUID] = Field(max_length=settings.foods_bulk_max_items)
+
+class FoodBulkItemResult(BaseModel):
+    index: int
+    status: str  # created / updated / deleted / invalid / not_found / error
+    id: UUID | None = None
+    food: Food | None = None
+    detail: str | None = None
+
+class FoodBulkResponse(BaseModel):
+    results: List[FoodBulkItemResult]
+
 # 必要に応じて以下のようにRecipeRequestを定義
 class RecipeRequest(BaseModel):
     ingredients: List[str]
+    cooking_time: str = "medium"
+    difficulty: str = "medium"
+    variety: bool = False  # Trueの場合、同じ食材でも毎回同じレシピにならないようにする
 
 class RecipeResponse(BaseModel):
     recipes: List[dict]  # レシピのリストを格納するためのフィールド
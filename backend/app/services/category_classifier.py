@@ -0,0 +1,237 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, List, Set, Tuple
+from app.utils.settings import Settings, settings
+
+CATEGORIES = ("野菜", "果物", "乳製品", "肉類", "魚介類", "穀物", "調味料", "飲料", "冷凍食品", "卵", "その他")
+
+# カテゴリごとのキーワードと重み（カタカナ・ひらがなの違いは正規化で吸収する）
+SEED_KEYWORDS: Dict[str, Dict[str, float]] = {
+    "野菜": {
+        "野菜": 1.0, "キャベツ": 1.0, "にんじん": 1.0, "人参": 1.0, "玉ねぎ": 1.0, "たまねぎ": 1.0, "トマト": 1.0,
+        "きゅうり": 1.0, "レタス": 1.0, "ほうれん草": 1.0, "小松菜": 1.0, "ピーマン": 1.0, "じゃがいも": 1.0,
+        "さつまいも": 1.0, "大根": 1.0, "ねぎ": 0.8, "もやし": 1.0, "ブロッコリー": 1.0, "なす": 0.8, "白菜": 1.0,
+        "しいたけ": 1.0, "しめじ": 1.0, "えのき": 1.0, "まいたけ": 1.0, "きのこ": 1.0, "ごぼう": 1.0, "れんこん": 1.0,
+        "かぼちゃ": 1.0, "アスパラ": 1.0, "オクラ": 1.0, "ズッキーニ": 1.0, "パプリカ": 1.0, "水菜": 1.0, "豆苗": 1.0,
+        "サラダ": 0.6, "カット野菜": 1.5,
+    },
+    "果物": {
+        "果物": 1.0, "フルーツ": 1.0, "りんご": 1.0, "バナナ": 1.0, "みかん": 1.0, "いちご": 1.0, "ぶどう": 1.0,
+        "もも": 0.6, "梨": 0.8, "レモン": 0.8, "キウイ": 1.0, "メロン": 1.0, "すいか": 1.0, "オレンジ": 0.8,
+        "グレープフルーツ": 1.0, "パイナップル": 1.0, "マンゴー": 1.0, "さくらんぼ": 1.0, "ブルーベリー": 0.8, "柿": 0.8,
+    },
+    "乳製品": {
+        "乳製品": 1.0, "牛乳": 1.0, "ミルク": 0.8, "ヨーグルト": 1.0, "チーズ": 1.0, "バター": 1.0, "生クリーム": 1.0,
+        "乳酸菌": 0.6, "種類別牛乳": 1.5, "発酵乳": 1.5, "成分無調整": 1.0, "低脂肪": 0.6, "加工乳": 1.5, "乳飲料": 1.0,
+    },
+    "肉類": {
+        "肉": 0.6, "牛肉": 1.0, "豚肉": 1.0, "鶏肉": 1.0, "ひき肉": 1.0, "挽肉": 1.0, "合挽": 1.0, "豚バラ": 1.0,
+        "豚ロース": 1.0, "牛ロース": 1.0, "もも肉": 1.0, "むね肉": 1.0, "ささみ": 1.0, "手羽": 1.0, "こま切れ": 1.0,
+        "切り落とし": 0.8, "ハム": 1.0, "ベーコン": 1.0, "ソーセージ": 1.0, "ウインナー": 1.0, "若鶏": 1.0, "国産牛": 1.0,
+        "和牛": 1.0, "豚": 0.6, "鶏": 0.4,
+    },
+    "魚介類": {
+        "魚": 0.6, "鮮魚": 1.0, "鮭": 1.0, "さけ": 0.8, "サーモン": 1.0, "まぐろ": 1.0, "マグロ": 1.0, "さば": 1.0,
+        "いわし": 1.0, "さんま": 1.0, "ぶり": 0.8, "たら": 0.8, "えび": 1.0, "いか": 0.6, "たこ": 0.6,
+        "あさり": 1.0, "しじみ": 1.0, "ほたて": 1.0, "刺身": 1.0, "切身": 1.0, "しらす": 1.0, "明太子": 1.0,
+        "たらこ": 1.0, "ちくわ": 1.0, "かまぼこ": 1.0, "水産": 0.6,
+    },
+    "穀物": {
+        "米": 0.8, "精米": 1.5, "無洗米": 1.5, "玄米": 1.0, "パン": 0.8, "食パン": 1.5, "うどん": 1.0, "そば": 0.8,
+        "パスタ": 1.0, "スパゲッティ": 1.0, "ラーメン": 1.0, "中華麺": 1.0, "小麦粉": 1.0, "薄力粉": 1.0,
+        "強力粉": 1.0, "シリアル": 1.0, "オートミール": 1.0, "もち": 0.8, "麺": 0.6,
+    },
+    "調味料": {
+        "調味料": 1.0, "しょうゆ": 1.0, "醤油": 1.0, "みそ": 1.0, "味噌": 1.0, "食塩": 0.8, "砂糖": 0.8, "酢": 0.6,
+        "マヨネーズ": 1.0, "ケチャップ": 1.0, "ソース": 0.8, "ドレッシング": 1.0, "みりん": 1.0, "料理酒": 1.0,
+        "だし": 0.6, "コンソメ": 1.0, "ポン酢": 1.0, "めんつゆ": 1.5, "焼肉のたれ": 1.5, "たれ": 0.6, "ごま油": 1.0,
+        "サラダ油": 1.0, "オリーブオイル": 1.0, "こしょう": 1.0, "胡椒": 1.0, "わさび": 0.8, "からし": 0.8, "スパイス": 1.0,
+    },
+    "飲料": {
+        "飲料": 1.0, "清涼飲料水": 1.5, "お茶": 1.0, "緑茶": 1.0, "麦茶": 1.0, "紅茶": 1.0, "ウーロン茶": 1.0,
+        "コーヒー": 1.0, "ジュース": 1.0, "オレンジジュース": 1.5, "りんごジュース": 1.5, "果汁": 0.6, "炭酸": 0.8, "サイダー": 1.0, "コーラ": 1.0, "ミネラルウォーター": 1.5,
+        "天然水": 1.5, "ビール": 1.0, "豆乳": 1.0, "スポーツドリンク": 1.5, "ドリンク": 0.8,
+    },
+    "冷凍食品": {
+        "冷凍食品": 2.0, "冷凍": 1.5, "-18℃以下": 1.5, "アイス": 1.0, "冷凍餃子": 2.0, "冷凍うどん": 2.0,
+    },
+    "卵": {
+        "卵": 1.0, "たまご": 1.0, "玉子": 1.0, "鶏卵": 1.5, "生食用": 0.6, "Mサイズ": 0.6, "Lサイズ": 0.6,
+    },
+    "その他": {
+        "豆腐": 1.0, "納豆": 1.0, "キムチ": 1.5, "こんにゃく": 1.0, "チョコレート": 1.0, "ポテトチップス": 1.5,
+        "スナック": 1.0, "菓子": 1.0, "ゼリー": 1.0, "惣菜": 1.0, "弁当": 1.0,
+    },
+}
+
+# 他のキーワードを含むが、カテゴリの手がかりにならない語（最長一致で短いキーワードを打ち消す）
+NEUTRAL_KEYWORDS = (
+    "炭水化物", "食塩相当量", "水産物", "冷凍保存", "冷凍しないで", "果糖", "ぶどう糖", "乳化剤", "乳糖", "卵白",
+    "卵黄", "乳成分", "食塩不使用", "小麦・卵・乳", "一部に", "肉厚", "魚沼", "ジャパン", "保存方法", "豆板醤",
+)
+
+# この見出し以降（原材料・栄養成分表示）に出てくる語は、商品自体のカテゴリを表さないことが多い
+DETAILS_MARKER = re.compile(r"原材料|栄養成分|アレルゲン|アレルギー")
+DETAILS_WEIGHT = 0.3
+
+# 学習した商品名1件のカテゴリあたりの重み（確認された回数に比例し、上限を設ける）
+LEARNED_WEIGHT = 1.0
+LEARNED_MAX_WEIGHT = 3.0
+# 他のユーザーの推定にも使う商品名の重み（商品名そのものは返さない）
+SHARED_WEIGHT = 1.0
+
+# 最高スコアがこの値に満たない場合は確信度を下げる（手がかりが弱い）
+STRONG_SCORE = 1.0
+
+
+def normalize(text: str) -> str:
+    """全角・半角、大文字・小文字、カタカナ・ひらがなの違いをなくす"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in text)
+
+
+@dataclass
+class _Entry:
+    """トライの終端に持たせる情報"""
+    weights: Dict[str, float] = field(default_factory=dict)
+    # 学習した商品名の場合は、ユーザーが登録した表記
+    name: str | None = None
+
+
+@dataclass(frozen=True)
+class Classification:
+    category: str
+    confidence: float
+    # テキストに含まれていた、以前に登録された商品名
+    name: str | None
+    scores: Dict[str, float]
+
+
+class CategoryClassifier:
+    """商品名・OCRテキストからカテゴリを推定する。
+
+    キーワードのトライで最長一致した語の重みをカテゴリごとに合計し、最もスコアの高いカテゴリを返す。
+    ユーザーが登録時に確定したカテゴリを learn() で受け取り、その商品名をそのユーザーのキーワードとして使う。
+    同じ商品名・カテゴリを min_shared_users 人以上が登録した場合は、他のユーザーの推定にも重みだけを使う。
+    シードのキーワードは学習で変更しない。
+    """
+
+    def __init__(self, max_learned: int = 10000, min_shared_users: int = 3):
+        self._root: dict = {}
+        # ユーザーごとの学習した商品名と、複数のユーザーが一致した商品名（重みのみ）
+        self._user_roots: Dict[str, dict] = {}
+        self._shared_root: dict = {}
+        self._votes: Dict[Tuple[str, str], Set[str]] = {}
+        self.max_learned = max_learned
+        self.min_shared_users = min_shared_users
+        self._learned = 0
+        for category, keywords in SEED_KEYWORDS.items():
+            for keyword, weight in keywords.items():
+                self._entry(self._root, keyword).weights[category] = weight
+        for keyword in NEUTRAL_KEYWORDS:
+            self._entry(self._root, keyword)
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "CategoryClassifier":
+        return cls(max_learned=settings.category_learned_max_entries, min_shared_users=settings.category_shared_min_users)
+
+    @staticmethod
+    def _entry(root: dict, keyword: str, create: bool = True) -> _Entry | None:
+        node = root
+        for char in normalize(keyword):
+            if char not in node:
+                if not create:
+                    return None
+                node[char] = {}
+            node = node[char]
+        if None not in node and create:
+            node[None] = _Entry()
+        return node.get(None)
+
+    def _matches(self, text: str, roots: List[dict]) -> List[Tuple[int, _Entry]]:
+        """テキスト中のキーワードを、長い語を優先して重ならないように探す（同じ語は各トライの重みを合わせる）"""
+        found = []
+        for root in roots:
+            for i in range(len(text)):
+                node = root
+                longest = None
+                j = i
+                while j < len(text) and text[j] in node:
+                    node = node[text[j]]
+                    j += 1
+                    if None in node:
+                        longest = (i, j, node[None])
+                if longest is not None:
+                    found.append(longest)
+
+        # 語の境界はテキストから分からないため、長い語を優先する（「あらびきウインナー」の「キウイ」を拾わない）
+        taken = bytearray(len(text))
+        spans = set()
+        matches = []
+        for start, end, entry in sorted(found, key=lambda match: match[0] - match[1]):
+            if (start, end) in spans or not any(taken[start:end]):
+                taken[start:end] = b"\x01" * (end - start)
+                spans.add((start, end))
+                matches.append((start, entry))
+        return matches
+
+    def classify(self, text: str, user_id: str | None = None) -> Classification:
+        """user_id を渡すと、そのユーザーが登録した商品名も使う（name はそのユーザーの商品名だけから返す）"""
+        text = normalize(text)
+        roots = [self._root, self._shared_root]
+        if user_id is not None and user_id in self._user_roots:
+            roots.append(self._user_roots[user_id])
+        marker = DETAILS_MARKER.search(text)
+        details_start = marker.start() if marker else len(text)
+
+        scores: Dict[str, float] = {}
+        name = None
+        for position, entry in self._matches(text, roots):
+            factor = 1.0 if position < details_start else DETAILS_WEIGHT
+            for category, weight in entry.weights.items():
+                scores[category] = scores.get(category, 0.0) + weight * factor
+            if entry.name and (name is None or len(entry.name) > len(name)) and position < details_start:
+                name = entry.name
+
+        if not scores:
+            return Classification("その他", 0.0, name, scores)
+
+        category, best = max(scores.items(), key=lambda item: item[1])
+        # 他のカテゴリとの差が小さい・手がかりが弱いほど確信度を下げる
+        confidence = best / sum(scores.values()) * min(1.0, best / STRONG_SCORE)
+        return Classification(category, round(confidence, 2), name, scores)
+
+    def learn(self, user_id: str, name: str, category: str):
+        """ユーザーが確定した商品名とカテゴリを、そのユーザーの分として記録する"""
+        if category not in CATEGORIES or len(normalize(name)) < 2:
+            return
+        root = self._user_roots.get(user_id)
+        entry = None if root is None else self._entry(root, name, create=False)
+        if entry is None:
+            # 新しい商品名（上限に達したら、既知の商品名の学習だけを続ける）
+            if self._learned >= self.max_learned:
+                return
+            entry = self._entry(self._user_roots.setdefault(user_id, {}), name)
+            entry.name = name
+            self._learned += 1
+        entry.weights[category] = min(LEARNED_MAX_WEIGHT, entry.weights.get(category, 0.0) + LEARNED_WEIGHT)
+        self._vote(user_id, name, category)
+
+    def _vote(self, user_id: str, name: str, category: str):
+        """別々のユーザーが同じ商品名・カテゴリを登録した数を数え、min_shared_users 人に達したら共有する"""
+        key = (normalize(name), category)
+        voters = self._votes.get(key)
+        if voters is None:
+            if len(self._votes) >= self.max_learned:
+                return
+            voters = self._votes[key] = set()
+        if len(voters) >= self.min_shared_users or user_id in voters:
+            return
+        voters.add(user_id)
+        if len(voters) == self.min_shared_users:
+            # 共有するのは重みだけで、ユーザーが入力した表記（name）は他のユーザーに返さない
+            self._entry(self._shared_root, name).weights[category] = SHARED_WEIGHT
+
+
+category_classifier = CategoryClassifier.from_settings(settings)
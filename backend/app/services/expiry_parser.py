@@ -0,0 +1,119 @@
+import re
+import unicodedata
+from dataclasses import dataclass
+from datetime import date
+from typing import List
+
+# 令和元年 = 2019年
+REIWA_OFFSET = 2018
+
+# 日付の書式ごとの基本スコア（西暦4桁・和暦は誤認が少なく、数字8桁は製造番号などと紛れやすい）
+FORMAT_SCORES = {"full": 0.75, "era": 0.75, "short": 0.6, "compact": 0.5}
+
+# 日付の直前（この文字数以内）に期限の表示があれば、その日付を期限とみなす
+LABEL_WINDOW = 16
+
+_DATE_SEP = r"\s*[./\-年]\s*"
+_MONTH_SEP = r"\s*[./\-月]\s*"
+
+PATTERNS = {
+    # 2024.09.20 / 2024/9/20 / 2024年9月20日
+    "full": re.compile(rf"(?<!\d)(?P<year>20\d{{2}}){_DATE_SEP}(?P<month>\d{{1,2}}){_MONTH_SEP}(?P<day>\d{{1,2}})(?!\d)"),
+    # R6.9.20 / 令和6年9月20日 / 令和元年9月20日
+    "era": re.compile(rf"(?:令和|R\.?)\s*(?P<year>元|\d{{1,2}}){_DATE_SEP}(?P<month>\d{{1,2}}){_MONTH_SEP}(?P<day>\d{{1,2}})(?!\d)"),
+    # 24.9.20 / 24/09/20
+    "short": re.compile(r"(?<![\d.])(?P<year>\d{2})\s*([./])\s*(?P<month>\d{1,2})\s*\2\s*(?P<day>\d{1,2})(?![\d.])"),
+    # 20240920
+    "compact": re.compile(r"(?<!\d)(?P<year>20\d{2})(?P<month>\d{2})(?P<day>\d{2})(?!\d)"),
+}
+
+EXPIRY_LABEL = re.compile(r"賞味期限|消費期限|品質保持期限|期限|BEST\s*BEFORE|EXP", re.IGNORECASE)
+# 製造日などの期限ではない日付の表示
+OTHER_LABEL = re.compile(r"製造|加工|包装|袋詰|採卵|入荷")
+
+
+@dataclass(frozen=True)
+class ExpiryDate:
+    date: date
+    confidence: float
+    format: str
+
+    def isoformat(self) -> str:
+        return self.date.isoformat()
+
+
+@dataclass
+class _Candidate:
+    date: date
+    format: str
+    start: int
+    labelled: bool = False
+
+
+def _to_date(fmt: str, match: re.Match) -> date | None:
+    year = match.group("year")
+    if fmt == "era":
+        year = REIWA_OFFSET + (1 if year == "元" else int(year))
+    elif fmt == "short":
+        year = 2000 + int(year)
+    try:
+        return date(int(year), int(match.group("month")), int(match.group("day")))
+    except ValueError:
+        return None
+
+
+def _nearest_label(text: str, start: int) -> re.Match | None:
+    """日付の直前にある表示（期限・製造日など）のうち、最も日付に近いもの"""
+    window = text[max(0, start - LABEL_WINDOW):start]
+    labels = list(EXPIRY_LABEL.finditer(window)) + list(OTHER_LABEL.finditer(window))
+    return max(labels, key=lambda label: label.end(), default=None)
+
+
+def _candidates(text: str, today: date) -> List[_Candidate]:
+    found = []
+    for fmt, pattern in PATTERNS.items():
+        for match in pattern.finditer(text):
+            parsed = _to_date(fmt, match)
+            # 期限として現実的な範囲の日付だけを候補にする
+            if parsed is None or not (today.year - 1 <= parsed.year <= today.year + 10):
+                continue
+            label = _nearest_label(text, match.start())
+            # 製造日などの表示が付いた日付は期限ではない
+            if label is not None and label.re is OTHER_LABEL:
+                continue
+            found.append(_Candidate(parsed, fmt, match.start(), labelled=label is not None))
+    return found
+
+
+def extract_expiration_date(text: str, today: date | None = None) -> ExpiryDate | None:
+    """OCRで読み取ったテキストから賞味期限・消費期限を抽出し、確信度（0〜1）と共に返す。
+
+    日付が見つからない場合はNoneを返す。
+    """
+    today = today or date.today()
+    # 全角数字・記号（２０２４．９．２０ など）を半角に揃える
+    text = unicodedata.normalize("NFKC", text)
+    candidates = _candidates(text, today)
+    if not candidates:
+        return None
+
+    has_label = EXPIRY_LABEL.search(text) is not None
+    distinct = {c.date for c in candidates}
+    labelled = {c.date for c in candidates if c.labelled}
+
+    def score(candidate: _Candidate) -> float:
+        value = FORMAT_SCORES[candidate.format]
+        if candidate.labelled:
+            value += 0.2
+        elif has_label:
+            value += 0.1
+        if len(distinct) == 1:
+            value += 0.05
+        elif not (candidate.labelled and len(labelled) == 1):
+            # 期限の候補が複数あり、表示からも決められない
+            value -= 0.15
+        return max(0.0, min(1.0, value))
+
+    # 同点の場合は遅い日付（製造日より期限の方が後）を選ぶ
+    best = max(candidates, key=lambda c: (score(c), c.date))
+    return ExpiryDate(best.date, round(score(best), 2), best.format)
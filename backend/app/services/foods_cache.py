@@ -0,0 +1,100 @@
+import json
+import hashlib
+import orjson
+from typing import Any, Dict, List
+from app.schemas.food import Food
+from app.utils.cache import CacheBackend, load_cache_backend
+from app.utils.settings import Settings, settings
+
+
+# 個別食品のエントリは検証せずにそのまま返すため、Food の列だけを保存する
+ITEM_COLUMNS = tuple(Food.model_fields)
+
+
+def make_etag(data: Any) -> str:
+    """レスポンス本文から強いETagを作成する"""
+    body = orjson.dumps(data, option=orjson.OPT_SORT_KEYS, default=str)
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match は弱い比較で判定する（圧縮したレスポンスには W/ 付きのETagを返すため）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+class FoodsCache:
+    """ユーザーごとの食品一覧・個別食品のキャッシュ。
+
+    一覧はクエリ条件ごとに "foods:list:{user_id}:" の下に保存し、
+    作成・更新・削除時はこの名前空間ごと削除して一覧をまとめて無効化する。
+    個別食品のエントリはその場で更新または削除する。
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float = 300):
+        self.backend = backend
+        self.ttl = ttl
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "FoodsCache":
+        backend = load_cache_backend(
+            settings.foods_cache_backend,
+            namespace="foods",
+            maxsize=settings.foods_cache_max_entries,
+            ttl=settings.foods_cache_ttl,
+        )
+        return cls(backend, settings.foods_cache_ttl)
+
+    def _list_key(self, user_id: str, params: Dict[str, Any]) -> str:
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:32]
+        return f"foods:list:{user_id}:{digest}"
+
+    async def get_list(self, user_id: str, params: Dict[str, Any]) -> Dict[str, Any] | None:
+        return await self.backend.aget(self._list_key(user_id, params))
+
+    async def set_list(self, user_id: str, params: Dict[str, Any], rows: List[dict], headers: Dict[str, str]) -> Dict[str, Any]:
+        entry = {"body": rows, "headers": headers, "etag": make_etag(rows)}
+        await self.backend.aset(self._list_key(user_id, params), entry, ttl=self.ttl)
+        return entry
+
+    async def get_summary(self, user_id: str, params: Dict[str, Any]) -> Dict[str, Any] | None:
+        return await self.backend.aget(self._list_key(user_id, {"summary": True, **params}))
+
+    async def set_summary(self, user_id: str, params: Dict[str, Any], summary: dict) -> Dict[str, Any]:
+        # 集計も一覧と同じ名前空間に置き、書き込み時にまとめて無効化する
+        entry = {"body": summary, "etag": make_etag(summary)}
+        await self.backend.aset(self._list_key(user_id, {"summary": True, **params}), entry, ttl=self.ttl)
+        return entry
+
+    async def get_item(self, user_id: str, food_id: str) -> Dict[str, Any] | None:
+        return await self.backend.aget(f"foods:item:{user_id}:{food_id}")
+
+    async def set_item(self, user_id: str, row: dict) -> Dict[str, Any]:
+        row = {column: row[column] for column in ITEM_COLUMNS if column in row}
+        entry = {"body": row, "etag": make_etag(row)}
+        await self.backend.aset(f"foods:item:{user_id}:{row['id']}", entry, ttl=self.ttl)
+        return entry
+
+    async def delete_item(self, user_id: str, food_id: str):
+        await self.backend.adelete(f"foods:item:{user_id}:{food_id}")
+
+    async def invalidate_lists(self, user_id: str):
+        await self.backend.adelete_prefix(f"foods:list:{user_id}:")
+
+    async def on_write(self, user_id: str, rows: List[dict] | None = None, deleted_ids: List[str] | None = None):
+        """書き込み後に呼び出し、キャッシュの整合性を保つ"""
+        for row in rows or []:
+            await self.set_item(user_id, row)
+        for food_id in deleted_ids or []:
+            await self.delete_item(user_id, food_id)
+        await self.invalidate_lists(user_id)
+
+    @property
+    def stats(self) -> dict:
+        return self.backend.stats
+
+
+foods_cache = FoodsCache.from_settings(settings)
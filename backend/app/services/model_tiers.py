@@ -0,0 +1,116 @@
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterable
+from app.utils.metrics import model_tier_results, gemini_hedges
+from app.utils.settings import Settings, settings
+
+
+class LatencyTracker:
+    """直近 window 件の所要時間から分位点を求める"""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelTiers:
+    """速いモデルから順に試すモデルの段階（tier）と、遅い呼び出しのヘッジ。
+
+    hedge=True の場合、呼び出しがそのモデルの直近の p95 を超えても終わらなければ
+    同じ呼び出しをもう1つ送り、先に成功した方の結果を使う。
+    """
+
+    def __init__(self, models: Iterable[str], hedge: bool = True, hedge_quantile: float = 0.95, hedge_min_samples: int = 20):
+        self.models = tuple(models)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self._latency: Dict[str, LatencyTracker] = {model: LatencyTracker() for model in self.models}
+        self._results: Dict[str, Dict[str, int]] = {model: {} for model in self.models}
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ModelTiers":
+        return cls(
+            models=settings.ocr_model_tiers,
+            hedge=settings.ocr_hedge,
+            hedge_quantile=settings.ocr_hedge_quantile,
+            hedge_min_samples=settings.ocr_hedge_min_samples,
+        )
+
+    def hedge_delay(self, model: str) -> float | None:
+        """ヘッジを送るまでの秒数（無効・計測が足りない場合はNone）"""
+        tracker = self._latency[model]
+        if not self.hedge or len(tracker) < self.hedge_min_samples:
+            return None
+        return tracker.quantile(self.hedge_quantile)
+
+    async def call(self, model: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """func() を実行し、hedge_delay を超えたら同じ呼び出しをもう1つ送る"""
+
+        async def timed():
+            start = time.perf_counter()
+            result = await func()
+            self._latency[model].add(time.perf_counter() - start)
+            return result
+
+        primary = asyncio.ensure_future(timed())
+        tasks = [primary]
+        try:
+            delay = self.hedge_delay(model)
+            if delay is not None:
+                await asyncio.wait(tasks, timeout=delay)
+                if not primary.done():
+                    tasks.append(asyncio.ensure_future(timed()))
+
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1:
+                            gemini_hedges.inc(model=model, winner="primary" if task is primary else "hedge")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # スレッドプールで実行中の呼び出しは止められないため、結果を使わないだけになる
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def record(self, model: str, outcome: str):
+        """tierの結果（accepted: 採用 / escalated: 次のtierへ / deadline: 期限切れ）を記録する"""
+        model_tier_results.inc(model=model, outcome=outcome)
+        counts = self._results[model]
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+    @property
+    def stats(self) -> dict:
+        stats = {}
+        for model in self.models:
+            counts = self._results[model]
+            total = sum(counts.values())
+            p50, p95 = self._latency[model].quantile(0.5), self._latency[model].quantile(0.95)
+            stats[model] = {
+                **counts,
+                "win_rate": round(counts.get("accepted", 0) / total, 3) if total else None,
+                "p50_ms": round(p50 * 1000) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            }
+        return stats
+
+
+ocr_model_tiers = ModelTiers.from_settings(settings)
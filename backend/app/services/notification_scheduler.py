@@ -0,0 +1,256 @@
+import heapq
+import asyncio
+import logging
+import importlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import List
+from app.utils.supabase_async import supabase_async
+from app.utils.settings import Settings, settings
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_HOUR = settings.notification_hour
+NOTIFY_TZ = settings.notification_tz
+
+TIMING_LABELS = {
+    "on_expiry_date": "今日",
+    "one_day_before": "明日",
+    "three_days_before": "3日後",
+}
+
+
+@dataclass(order=True, frozen=True)
+class DueNotification:
+    notify_at: datetime
+    user_id: str = field(compare=False)
+    food_id: str = field(compare=False)
+    name: str = field(compare=False)
+    category: str | None = field(default=None, compare=False)
+    expiration_date: str | None = field(default=None, compare=False)
+    timing: str = field(default="on_expiry_date", compare=False)
+    voice_enabled: bool = field(default=True, compare=False)
+
+    @classmethod
+    def from_row(cls, row: dict) -> "DueNotification":
+        return cls(
+            notify_at=datetime.fromisoformat(row["notify_at"]),
+            user_id=row["user_id"],
+            food_id=row["food_id"],
+            name=row["name"],
+            category=row.get("category"),
+            expiration_date=row.get("expiration_date"),
+            timing=row.get("timing") or "on_expiry_date",
+            voice_enabled=row.get("voice_enabled", True),
+        )
+
+    @property
+    def message(self) -> str:
+        return f"「{self.name}」の賞味期限は{TIMING_LABELS.get(self.timing, '今日')}です"
+
+
+class NotificationSender:
+    """通知の送信先。プッシュ通知やメールなどはこのクラスを継承して実装する"""
+
+    async def send_batch(self, notifications: List[DueNotification]):
+        raise NotImplementedError
+
+
+class LoggingNotificationSender(NotificationSender):
+    """送信先が設定されていない場合のデフォルト（ログに出力するだけ）"""
+
+    async def send_batch(self, notifications: List[DueNotification]):
+        for notification in notifications:
+            logger.info("通知: user_id=%s %s", notification.user_id, notification.message)
+
+
+class FakeNotificationSender(NotificationSender):
+    """テスト・ローカル確認用。送信した通知をメモリ上に保持する"""
+
+    def __init__(self):
+        self.batches: List[List[DueNotification]] = []
+
+    async def send_batch(self, notifications: List[DueNotification]):
+        self.batches.append(list(notifications))
+
+    @property
+    def sent(self) -> List[DueNotification]:
+        return [n for batch in self.batches for n in batch]
+
+
+def load_notification_sender(spec: str | None) -> NotificationSender:
+    """spec が空の場合はログ出力のみ、"fake" の場合はFakeNotificationSender、それ以外は "module:ClassName" から生成する"""
+    if not spec:
+        return LoggingNotificationSender()
+    if spec == "fake":
+        return FakeNotificationSender()
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+async def fetch_due_notifications(window_start: datetime, window_end: datetime) -> List[DueNotification]:
+    """通知時刻が [window_start, window_end) に入る食品を1回のクエリでまとめて取得する"""
+    result = await supabase_async.rpc("due_expiry_notifications", {
+        "window_start": window_start.isoformat(),
+        "window_end": window_end.isoformat(),
+        "notify_hour": NOTIFY_HOUR,
+        "tz": NOTIFY_TZ,
+    }).execute()
+    return [DueNotification.from_row(row) for row in result.data]
+
+
+class SupabaseWatermark:
+    """送信済みの位置（これより前の通知時刻の通知はすべて送信済み）を notification_scheduler_state に保存する"""
+
+    def __init__(self, name: str = "expiry_notifications"):
+        self.name = name
+
+    async def load(self) -> datetime | None:
+        result = await supabase_async.table("notification_scheduler_state").select("delivered_until").eq("name", self.name).execute()
+        return datetime.fromisoformat(result.data[0]["delivered_until"]) if result.data else None
+
+    async def save(self, delivered_until: datetime):
+        await supabase_async.table("notification_scheduler_state").upsert({
+            "name": self.name,
+            "delivered_until": delivered_until.isoformat(),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }, on_conflict="name").execute()
+
+
+class ExpiryNotificationScheduler:
+    """賞味期限の通知を時間窓ごとにまとめて取得し、時刻が来たものをバッチで送信する。
+
+    tick() ごとに「前回取得した時刻〜現在+interval」の窓を1回だけ問い合わせ、
+    結果を通知時刻順のヒープに積む。ヒープの先頭から通知時刻を過ぎたものを取り出し、
+    batch_size 件ずつ sender に渡す。送信に失敗したバッチはヒープに戻し、次の tick で送り直す。
+
+    最初の tick は watermark に保存した送信済みの位置から取得を始め、停止中に通知時刻を過ぎた分も送る。
+    送り直すのは通知時刻から lookback 秒以内の通知だけとする（長時間の停止後に古い通知をまとめて送らない）。
+    """
+
+    def __init__(
+        self,
+        sender: NotificationSender,
+        interval: float = 60,
+        batch_size: int = 500,
+        lookback: float = 0,
+        fetch=fetch_due_notifications,
+        watermark: SupabaseWatermark | None = None,
+    ):
+        self.sender = sender
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lookback = timedelta(seconds=lookback)
+        self._fetch = fetch
+        self._watermark = watermark
+        self._delivered_until: datetime | None = None
+        self._heap: List[DueNotification] = []
+        self._scanned_until: datetime | None = None
+        self._task: asyncio.Task | None = None
+        self.sent_count = 0
+        self.failed_count = 0
+        self.expired_count = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ExpiryNotificationScheduler":
+        return cls(
+            sender=load_notification_sender(settings.notification_sender),
+            interval=settings.notification_tick_seconds,
+            batch_size=settings.notification_batch_size,
+            lookback=settings.notification_lookback_seconds,
+            watermark=SupabaseWatermark(),
+        )
+
+    async def _resume_from(self, now: datetime) -> datetime:
+        """最初の tick の取得開始位置（保存した送信済みの位置。なければ now - lookback）"""
+        earliest = now - self.lookback
+        delivered_until = await self._watermark.load() if self._watermark is not None else None
+        return max(delivered_until, earliest) if delivered_until is not None else earliest
+
+    async def tick(self, now: datetime | None = None) -> int:
+        now = now or datetime.now(timezone.utc)
+        if self._scanned_until is None:
+            self._scanned_until = await self._resume_from(now)
+        window_start = self._scanned_until
+        window_end = now + timedelta(seconds=self.interval)
+
+        if window_end > window_start:
+            due = await self._fetch(window_start, window_end)
+            for notification in due:
+                heapq.heappush(self._heap, notification)
+            self._scanned_until = window_end
+
+        ready = []
+        expired = 0
+        while self._heap and self._heap[0].notify_at <= now:
+            notification = heapq.heappop(self._heap)
+            # 送り直しを繰り返して lookback を過ぎた通知は諦める
+            if notification.notify_at < now - self.lookback:
+                expired += 1
+            else:
+                ready.append(notification)
+        if expired:
+            self.expired_count += expired
+            logger.error("通知時刻から %.0f 秒以上送信できなかった通知を破棄しました (%d件)", self.lookback.total_seconds(), expired)
+
+        failed = []
+        for start in range(0, len(ready), self.batch_size):
+            batch = ready[start:start + self.batch_size]
+            try:
+                await self.sender.send_batch(batch)
+                self.sent_count += len(batch)
+            except Exception as e:
+                logger.error("通知の送信に失敗しました。次の実行で送り直します (%d件): %s", len(batch), e)
+                failed.extend(batch)
+        for notification in failed:
+            heapq.heappush(self._heap, notification)
+        self.failed_count += len(failed)
+
+        await self._save_watermark(now)
+        return len(ready) - len(failed)
+
+    async def _save_watermark(self, now: datetime):
+        # 送り直し待ちの通知があればその通知時刻まで、なければ now までを送信済みとする。
+        # 再起動後は同じ通知時刻の通知をまとめて取得し直すため、送り直し待ちと同時刻の送信済みの通知も再送されうる
+        delivered_until = min(self._heap[0].notify_at, now) if self._heap else now
+        if self._watermark is None or delivered_until == self._delivered_until:
+            return
+        try:
+            await self._watermark.save(delivered_until)
+            self._delivered_until = delivered_until
+        except Exception as e:
+            logger.warning("通知スケジューラの送信済みの位置を保存できませんでした: %s", e)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error("通知スケジューラでエラーが発生しました: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._heap),
+            "sent": self.sent_count,
+            "failed": self.failed_count,
+            "expired": self.expired_count,
+            "scanned_until": self._scanned_until.isoformat() if self._scanned_until else None,
+        }
+
+
+notification_scheduler = ExpiryNotificationScheduler.from_settings(settings)
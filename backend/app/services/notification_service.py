@@ -1,66 +1,134 @@
 from app.schemas.notification import NotificationSettings, NotificationUpdate
-from app.utils.supabase_client import supabase
-from datetime import datetime
+from app.utils.supabase_async import supabase_async
+from app.services.notification_scheduler import DueNotification, notification_scheduler
+from app.utils.cache import CacheBackend, load_cache_backend
+from app.utils.settings import settings
+from datetime import datetime, timezone
+from typing import Dict, List
 import uuid
-import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 設定のキャッシュ（更新時は書き込み結果で置き換える）
+SETTINGS_CACHE_MAX_ENTRIES = settings.notification_settings_cache_max_entries
+SETTINGS_CACHE_TTL = settings.notification_settings_cache_ttl
+# in_() に渡すIDの数（URLが長くなりすぎないように分割する）
+SETTINGS_BULK_CHUNK = 200
+
+def _to_settings(data: dict) -> NotificationSettings:
+    data = dict(data)
+    data["user_id"] = uuid.UUID(str(data["user_id"]))
+    return NotificationSettings(**data)
+
+def _default_settings(user_id: str) -> NotificationSettings:
+    return NotificationSettings(
+        user_id=uuid.UUID(user_id),
+        enabled=True,
+        timing="on_expiry_date",
+        voice_enabled=True,
+        created_at=datetime.now(),
+        updated_at=datetime.now()
+    )
 
 class NotificationService:
-    def get_settings(self, user_id: str) -> NotificationSettings:
-        print(f"Getting settings for user_id: {user_id}")
-        result = supabase.table("notification_settings").select("*").eq("user_id", user_id).execute()
-        if result.data:
-            data = result.data[0]
-            data["user_id"] = uuid.UUID(data["user_id"])
-            return NotificationSettings(**data)
-        return NotificationSettings(
-            user_id=uuid.UUID(user_id),
-            enabled=True,
-            timing="on_expiry_date",
-            voice_enabled=True,
-            created_at=datetime.now(),
-            updated_at=datetime.now()
+    """通知設定の取得・更新。プロセス全体で1つのインスタンス（notification_service）を共有する"""
+
+    def __init__(self, cache: CacheBackend | None = None):
+        self._settings_cache = cache or load_cache_backend(
+            settings.cache_backend, namespace="notification_settings", maxsize=SETTINGS_CACHE_MAX_ENTRIES, ttl=SETTINGS_CACHE_TTL
         )
 
-    def update_settings(self, user_id: str, update: NotificationUpdate) -> NotificationSettings:
-        print(f"Updating settings for user_id: {user_id}")
-        print(f"Update data: {update.dict()}")
-        
-        # 既存の設定を取得
-        current_settings = self.get_settings(user_id)
-        
-        # 更新するフィールドのみを含む辞書を作成
-        update_dict = update.dict(exclude_unset=True)
-        print(f"Update dict: {update_dict}")
-        
-        # 現在の設定をベースに更新
+    async def _cached(self, user_id: str) -> NotificationSettings | None:
+        # 共有キャッシュにはJSONで保存するため、取り出すたびにモデルに戻す
+        cached = await self._settings_cache.aget(user_id)
+        return NotificationSettings.model_validate(cached) if cached is not None else None
+
+    async def _store(self, user_id: str, settings: NotificationSettings):
+        await self._settings_cache.aset(user_id, settings.model_dump(mode="json"))
+
+    async def get_settings(self, user_id: str) -> NotificationSettings:
+        cached = await self._cached(user_id)
+        if cached is not None:
+            return cached
+
+        result = await supabase_async.table("notification_settings").select("*").eq("user_id", user_id).execute()
+        settings = _to_settings(result.data[0]) if result.data else _default_settings(user_id)
+        await self._store(user_id, settings)
+        return settings
+
+    async def get_settings_bulk(self, user_ids: List[str]) -> Dict[str, NotificationSettings]:
+        """複数ユーザーの設定を取得する。キャッシュにないユーザーの分は1回のクエリでまとめて読み込む"""
+        settings = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            cached = await self._cached(user_id)
+            if cached is not None:
+                settings[user_id] = cached
+            else:
+                missing.append(user_id)
+
+        for start in range(0, len(missing), SETTINGS_BULK_CHUNK):
+            chunk = missing[start:start + SETTINGS_BULK_CHUNK]
+            result = await supabase_async.table("notification_settings").select("*").in_("user_id", chunk).execute()
+            rows = {row["user_id"]: row for row in result.data}
+            for user_id in chunk:
+                settings[user_id] = _to_settings(rows[user_id]) if user_id in rows else _default_settings(user_id)
+                await self._store(user_id, settings[user_id])
+        return settings
+
+    async def update_settings(self, user_id: str, update: NotificationUpdate) -> NotificationSettings:
+        # 指定されたフィールドだけをupsertする（1往復）。
+        # 新規作成時の未指定フィールドと created_at はテーブルのデフォルト値が使われる
         values = {
             "user_id": user_id,
-            "enabled": update_dict.get("enabled", current_settings.enabled),
-            "timing": update_dict.get("timing", current_settings.timing),
-            "voice_enabled": update_dict.get("voice_enabled", current_settings.voice_enabled),
+            **update.dict(exclude_unset=True),
             "updated_at": datetime.now().isoformat(),
-            "created_at": current_settings.created_at.isoformat()
         }
-        
-        print(f"Final values to be sent to Supabase: {values}")
-        
+
         try:
-            result = supabase.table("notification_settings").upsert(values).execute()
-            print(f"Supabase response: {result.data}")
-            
-            if not result.data:
-                raise ValueError("設定の更新に失敗しました")
-            
-            response_data = result.data[0]
-            response_data["user_id"] = uuid.UUID(response_data["user_id"])
-            
-            return NotificationSettings(**response_data)
-            
+            result = await supabase_async.table("notification_settings").upsert(
+                values, on_conflict="user_id", default_to_null=False
+            ).execute()
         except Exception as e:
-            print(f"Error updating settings: {str(e)}")
+            await self._settings_cache.adelete(user_id)
+            logger.error("Error updating settings: %s", e)
             raise
 
-    def send_notification(self, user_id: str, food_id: str) -> bool:
-        # ここに通知送信のロジックを実装します
-        # 例：プッシュ通知の送信、メール送信など
+        if not result.data:
+            await self._settings_cache.adelete(user_id)
+            raise ValueError("設定の更新に失敗しました")
+
+        settings = _to_settings(result.data[0])
+        await self._store(user_id, settings)
+        return settings
+
+    async def invalidate(self, user_id: str):
+        await self._settings_cache.adelete(user_id)
+
+    @property
+    def stats(self) -> dict:
+        return self._settings_cache.stats
+
+    async def send_notification(self, user_id: str, food_id: str) -> bool:
+        # 指定された食品の通知をスケジューラと同じ送信先から即時に送る
+        result = await supabase_async.table("foods").select("id,name,category,expiration_date").eq("id", food_id).eq("user_id", user_id).execute()
+        if not result.data:
+            return False
+        food = result.data[0]
+        settings = await self.get_settings(user_id)
+        notification = DueNotification(
+            notify_at=datetime.now(timezone.utc),
+            user_id=user_id,
+            food_id=food["id"],
+            name=food["name"],
+            category=food.get("category"),
+            expiration_date=food.get("expiration_date"),
+            timing=settings.timing,
+            voice_enabled=settings.voice_enabled,
+        )
+        await notification_scheduler.sender.send_batch([notification])
         return True
+
+
+notification_service = NotificationService()
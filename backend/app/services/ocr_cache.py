@@ -0,0 +1,77 @@
+import os
+import hashlib
+from typing import Dict
+from app.utils.cache import CacheBackend, SQLiteCacheBackend, TTLLRUCache, load_cache_backend
+from app.utils.settings import Settings, settings
+
+
+def image_digest(content: bytes) -> str:
+    """画像バイト列のSHA-256（キャッシュキー）"""
+    return hashlib.sha256(content).hexdigest()
+
+
+class OCRResultCache:
+    """画像の内容をキーにしたOCR結果キャッシュ。
+
+    メモリ上のLRUを一次キャッシュとし、共有のキャッシュ（OCR_CACHE_BACKEND、
+    未設定で OCR_CACHE_DIR がある場合はそのディレクトリのSQLiteファイル）を二次キャッシュとして併用する。
+    OCR結果は画像ごとに変わらないため、一次キャッシュはワーカーごとに持ったままでよい。
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 7 * 24 * 3600, shared: CacheBackend | None = None):
+        self.ttl = ttl
+        self.memory = TTLLRUCache(maxsize=maxsize, ttl=ttl)
+        self.shared = shared
+        self.shared_hits = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "OCRResultCache":
+        shared = None
+        if settings.ocr_cache_backend and settings.ocr_cache_backend != "memory":
+            shared = load_cache_backend(
+                settings.ocr_cache_backend, namespace="ocr", maxsize=settings.ocr_cache_disk_max_entries, ttl=settings.ocr_cache_ttl
+            )
+        elif settings.ocr_cache_dir:
+            shared = SQLiteCacheBackend(
+                os.path.join(settings.ocr_cache_dir, "ocr.sqlite3"), namespace="ocr", maxsize=settings.ocr_cache_disk_max_entries, ttl=settings.ocr_cache_ttl
+            )
+        return cls(maxsize=settings.ocr_cache_max_entries, ttl=settings.ocr_cache_ttl, shared=shared)
+
+    async def get(self, key: str) -> Dict[str, str] | None:
+        result = self.memory.get(key)
+        if result is not None:
+            return dict(result)
+        if self.shared is None:
+            return None
+        # 共有キャッシュの読み書きは短いI/Oのため、OCRの実行枠ではなくキャッシュ用のスレッドで行う
+        result = await self.shared.aget(key)
+        if result is not None:
+            self.shared_hits += 1
+            self.memory.set(key, result)
+            return dict(result)
+        return None
+
+    async def set(self, key: str, result: Dict[str, str]):
+        self.memory.set(key, dict(result))
+        if self.shared is not None:
+            await self.shared.aset(key, result)
+
+    @property
+    def stats(self) -> dict:
+        memory_stats = self.memory.stats
+        hits = memory_stats["hits"] + self.shared_hits
+        # 共有キャッシュでヒットした分はメモリのミスとして数えられているため差し引く
+        misses = memory_stats["misses"] - self.shared_hits
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "memory_hits": memory_stats["hits"],
+            "shared_hits": self.shared_hits,
+            "hit_rate": hits / total if total else 0.0,
+            "memory_size": memory_stats["size"],
+            "shared_enabled": self.shared is not None,
+        }
+
+
+ocr_cache = OCRResultCache.from_settings(settings)
@@ -0,0 +1,96 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable
+from app.utils.settings import Settings, settings
+
+
+class OCRQueueFullError(Exception):
+    """OCRの待ち行列が上限に達したときに送出される"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("OCR処理が混み合っています")
+        self.retry_after = retry_after
+
+
+class OCRExecutor:
+    """Vision / Gemini / Storage の同期SDK呼び出しをイベントループ外で実行する。
+
+    同時に処理するOCRリクエスト数を max_concurrency に制限し、
+    空きを待つリクエストが max_queue を超えた場合は即座に OCRQueueFullError を返す。
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 16, pool_size: int | None = None, retry_after: int = 5):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        # 1リクエスト内で複数の呼び出しが並行する場合に備えて余裕を持たせる
+        self.pool_size = pool_size or max_concurrency * 2
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.pool_size,
+            thread_name_prefix="ocr",
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._running = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "OCRExecutor":
+        return cls(
+            max_concurrency=settings.ocr_max_concurrency,
+            max_queue=settings.ocr_max_queue,
+            pool_size=settings.ocr_thread_pool_size,
+            retry_after=settings.ocr_retry_after,
+        )
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
+
+    @property
+    def threads_per_slot(self) -> int:
+        """実行枠1つ（OCRリクエスト1件）が同時に使ってよいスレッド数。
+
+        複数の処理を並行させるリクエスト（バッチ）は、この数を超えて run を同時に呼ばないようにする。
+        """
+        return max(1, self.pool_size // self.max_concurrency)
+
+    def ensure_capacity(self):
+        """待ち行列が上限に達している場合は OCRQueueFullError を送出する"""
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            raise OCRQueueFullError(self.retry_after)
+
+    @asynccontextmanager
+    async def slot(self):
+        """OCRリクエスト1件分の実行枠を確保する"""
+        self.ensure_capacity()
+
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._running += 1
+        try:
+            yield
+        finally:
+            self._running -= 1
+            self._semaphore.release()
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """同期関数をスレッドプール上で実行し、結果を待つ"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+ocr_executor = OCRExecutor.from_settings(settings)
@@ -1,95 +1,243 @@
-import os
-import json
-from dotenv import load_dotenv
-import tempfile
-from google.cloud import vision
-import io
-from typing import Dict
-from datetime import datetime
+import asyncio
+from typing import Any, AsyncIterator, Dict, List
+from datetime import date
 import re
-import google.generativeai as genai
-from PIL import Image
-from app.utils.supabase_client import supabase
+import logging
+from app.utils.supabase_async import supabase_async
+from app.utils.ai_clients import ai_clients
+from app.services.ocr_executor import OCRQueueFullError, ocr_executor
+from app.utils.admission import UpstreamBusyError, admission, estimate_tokens
+from app.services.ocr_cache import ocr_cache, image_digest
+from app.services.image_preprocess import preprocess_image
+from app.services.expiry_parser import extract_expiration_date
+from app.services.category_classifier import CATEGORIES, category_classifier
+from app.services.model_tiers import ocr_model_tiers
+from app.utils.metrics import track_upstream, record_gemini_usage, ocr_local_date, ocr_local_category
+from app.utils.stage_graph import StageGraph
+from app.utils.settings import settings
 import uuid
 
-# .envファイルから環境変数を読み込む
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-def setup_google_credentials():
-    google_credentials_json = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS_JSON')
-    if google_credentials_json:
-        try:
-            credentials_dict = json.loads(google_credentials_json, strict=False)
-            
-            # 一時ファイルを作成
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as temp_file:
-                json.dump(credentials_dict, temp_file, indent=2)
-                temp_credentials_path = temp_file.name
-
-            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = temp_credentials_path
-            print(f"GOOGLE_APPLICATION_CREDENTIALS_JSONを使用して認証設定しました。パス: {temp_credentials_path}")
-            
-            return temp_credentials_path  # 一時ファイルのパスを返す
-        except json.JSONDecodeError as e:
-            print(f"GOOGLE_APPLICATION_CREDENTIALS_JSONの解析に失敗しました: {e}")
-            print(f"JSON内容: {google_credentials_json[:1000]}...") # 最初の1000文字を表示
-        except Exception as e:
-            print(f"認証情報の設定中にエラーが発生しました: {e}")
+EMPTY_RESULT = {"text": "", "expiration_date": "", "name": "", "category": "", "image_url": ""}
 
-    # 下記はローカル環境開発用にいれている処理
-    credentials_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
-    if credentials_path:
-        if os.path.exists(credentials_path):
-            print(f"GOOGLE_APPLICATION_CREDENTIALSを使用して認証設定しました: {credentials_path}")
-        else:
-            print(f"警告: クレデンシャルファイルが見つかりません: {credentials_path}")
-    else:
-        print("警告: Google Cloud認証情報が設定されていません。")
-        raise ValueError("Google Cloud認証情報が設定されていません")
+# Visionのbatch_annotate_imagesに1回で渡す画像数と、バッチ時のGemini同時呼び出し数
+VISION_BATCH_SIZE = 16
+BATCH_GEMINI_CONCURRENCY = settings.ocr_batch_gemini_concurrency
+LOCAL_DATE_MIN_CONFIDENCE = settings.ocr_local_date_min_confidence
+LOCAL_CATEGORY_MIN_CONFIDENCE = settings.ocr_local_category_min_confidence
+OCR_LATENCY_BUDGET = settings.ocr_latency_budget
+
+def _detect_text(content: bytes):
+    from google.cloud import vision
+
+    client = ai_clients.vision_client
+
+    image = vision.Image(content=content)
+
+    with track_upstream("vision"):
+        response = client.text_detection(image=image)
+    return response.text_annotations
+
+def _generate_with_gemini(model_name: str, prompt: str, img) -> str:
+    model = ai_clients.model(model_name)
+    with track_upstream(model_name):
+        gemini_response = model.generate_content([prompt, img])
+    record_gemini_usage(model_name, gemini_response)
+    return gemini_response.text
+
+# 失敗時に削除するアップロード済み画像の削除処理（完了まで参照を保持する）
+_cleanup_tasks: set = set()
+
+async def _upload_image(data: bytes, content_type: str, uploaded: List[str]) -> str:
+    """画像をアップロードして公開URLを返す。ファイル名はアップロード前に uploaded に追加する（失敗時の削除用）"""
+    file_name = f"{uuid.uuid4()}.jpg"
+    bucket = supabase_async.storage.from_("food-images")
+
+    uploaded.append(file_name)
+    await bucket.upload(file_name, data, file_options={"content-type": content_type})
+
+    # 画像のURLを取得
+    return await bucket.get_public_url(file_name)
+
+async def _upload_if_text(texts, renditions, uploaded: List[str], image_url: str = "") -> str:
+    """Visionがテキストを検出した場合だけ保存用画像をアップロードする（検出されなければ結果に使わないため保存しない）。
+
+    同じ画像をアップロード済み（image_url）の場合はアップロードせずにそのURLを返す。
+    """
+    if not texts:
+        return ""
+    if image_url:
+        return image_url
+    return await _upload_image(renditions.stored, renditions.content_type, uploaded)
+
+async def _remove_images(file_names: List[str]):
+    try:
+        await supabase_async.storage.from_("food-images").remove(file_names)
+    except Exception as e:
+        logger.warning("アップロード済みの画像を削除できませんでした %s: %s", file_names, e)
 
+def _discard_uploads(uploaded: List[str]):
+    """解析が失敗・中断した場合に、結果を返さない画像を削除する。
+
+    中断（キャンセル）中の呼び出し元を待たせないよう、削除は別のタスクで行う。
+    """
+    if not uploaded:
+        return
+    task = asyncio.ensure_future(_remove_images(list(uploaded)))
+    _cleanup_tasks.add(task)
+    task.add_done_callback(_cleanup_tasks.discard)
+
+def _cache_keys(digest: str, details: bool) -> List[str]:
+    """キャッシュを探すキーの一覧。最後のキーに結果を保存する。
+
+    商品名・カテゴリを省略した結果は別のキーに保存し、完全な結果があればそちらを返す。
+    """
+    return [digest] if details else [digest, f"{digest}-date"]
+
+async def _uploaded_image_url(digest: str, details: bool) -> str:
+    """完全な結果（details=True）がキャッシュにない画像について、賞味期限だけの結果でアップロード済みの画像URLを返す。
+
+    同じ画像を details=False → details=True の順に送った場合に、画像を重複してアップロードしないようにする。
+    """
+    if not details:
+        return ""
+    cached = await ocr_cache.get(_cache_keys(digest, False)[-1])
+    return cached.get("image_url", "") if cached is not None else ""
+
+async def _cached_result(keys: List[str]) -> Dict[str, str] | None:
+    for key in keys:
+        cached = await ocr_cache.get(key)
+        if cached is not None:
+            return cached
     return None
 
-# 認証情報のセットアップを実行
-temp_credentials_path = setup_google_credentials()
+async def process_image(image_file, details: bool = True, user_id: str | None = None) -> Dict[str, Any]:
+    """画像からテキスト・賞味期限・商品名・カテゴリを読み取る。
+
+    賞味期限・カテゴリ・商品名（user_id のユーザーが以前に登録した商品名）をOCRテキストから確実に読み取れればGeminiを呼ばない。
+    details=False の場合は商品名・カテゴリが分からなくてもよいものとし、賞味期限だけで判断する。
+    """
+    # 画像ファイルの内容を一度だけ読み取る
+    content = await image_file.read()
+
+    # 同じ画像が再アップロードされた場合はキャッシュから返す（上流APIもアップロードも行わない）
+    # ハッシュは数MBでも数msのため、OCRの実行枠を待たずにその場で計算する
+    digest = image_digest(content)
+    cache_keys = _cache_keys(digest, details)
+    cached = await _cached_result(cache_keys)
+    if cached is not None:
+        return cached
+    image_url = await _uploaded_image_url(digest, details)
+
+    # 解析はリクエストの受付から OCR_LATENCY_BUDGET 秒までに打ち切る
+    deadline = asyncio.get_running_loop().time() + OCR_LATENCY_BUDGET
+
+    # 同時実行数を制限し、混雑時はOCRQueueFullErrorを送出する
+    async with ocr_executor.slot():
+        result = await _process_image(content, details, deadline, user_id, image_url)
 
-# Gemini APIの設定
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
+    # ユーザーが登録した商品名を使った結果は、同じ画像を送った他のユーザーに返さないようキャッシュしない
+    personal = result.pop("personal", False)
+    # 期限切れで一部だけの結果はキャッシュしない
+    if not result.get("partial") and not personal:
+        await ocr_cache.set(cache_keys[-1], result)
+    return result
+
+async def _process_image(content: bytes, details: bool = True, deadline: float | None = None, user_id: str | None = None, image_url: str = "") -> Dict[str, Any]:
+    # Visionがテキストを検出した後、保存用画像のアップロードをGeminiの解析と並行して行う
+    #   preprocess ─ vision ─┬─ gemini
+    #                        └─ upload
+    uploaded: List[str] = []
+    graph = StageGraph("ocr")
+    graph.add("preprocess", lambda: ocr_executor.run(preprocess_image, content))
+    # Google Cloud Vision APIを使用したOCR処理（ブロッキング呼び出しはスレッドプールで実行）
+    graph.add("vision", lambda renditions: _run_vision(_detect_text, renditions.ocr), after=("preprocess",))
+    graph.add("gemini", lambda texts, renditions: _analyze_texts(texts, renditions, details, deadline, user_id), after=("vision", "preprocess"))
+    # 画像をSupabaseストレージにアップロード
+    graph.add("upload", lambda texts, renditions: _upload_if_text(texts, renditions, uploaded, image_url), after=("vision", "preprocess"))
 
-async def process_image(image_file) -> Dict[str, str]:
-    temp_credentials_path = None
     try:
-        # 認証情報のセットアップを実行
-        temp_credentials_path = setup_google_credentials()
+        results = await graph.run()
+    except Exception as e:
+        logger.exception("OCR処理でエラー発生: %s", e)
+        _discard_uploads(uploaded)
+        raise
+    except asyncio.CancelledError:
+        # クライアントの切断などで中断した場合も、アップロード済みの画像を残さない
+        _discard_uploads(uploaded)
+        raise
+    finally:
+        logger.debug("OCRステージの所要時間(ms)", extra={"fields": graph.timings_ms})
 
-        # 画像ファイルの内容を一度だけ読み取る
-        content = await image_file.read()
-        
-        # Google Cloud Vision APIを使用したOCR処理
-        client = vision.ImageAnnotatorClient()
-        print("クライアント作成成功")
+    # テキストが検出されなかった場合は画像を保存しない
+    if results["gemini"] is None:
+        return dict(EMPTY_RESULT)
 
-        image = vision.Image(content=content)
-        print("Vision Image作成成功")
+    return {
+        "text": results["vision"][0].description,
+        **results["gemini"],
+        "image_url": results["upload"]  # 画像URLを追加
+    }
 
-        response = client.text_detection(image=image)
-        print("テキスト検出成功")
+async def _analyze_texts(texts, renditions, details: bool = True, deadline: float | None = None, user_id: str | None = None) -> Dict[str, Any] | None:
+    """Visionの検出結果を解析する。テキストがなければNoneを返す。
+
+    deadline（イベントループの時刻）までにGeminiの結果が揃わなければ、
+    それまでに読み取れた分に "partial": True を付けて返す。
+    user_id のユーザーが登録した商品名を使った場合は "personal": True を付ける（キャッシュの判断に使い、呼び出し側で取り除く）。
+    """
+    if not texts:
+        return None
+
+    full_text = texts[0].description
+    logger.debug("full_text: %s", full_text)
+
+    # まずOCRテキストから賞味期限・カテゴリを読み取る
+    local_date = extract_expiration_date(full_text)
+    confident = local_date is not None and local_date.confidence >= LOCAL_DATE_MIN_CONFIDENCE
+    local_category = category_classifier.classify(full_text, user_id)
+    category = local_category.category if local_category.confidence >= LOCAL_CATEGORY_MIN_CONFIDENCE else ""
+    ocr_local_category.inc(outcome="confident" if category else "unsure")
 
-        texts = response.text_annotations
+    # 商品名はテキストに以前に登録された商品名が含まれる場合だけ分かるため、それ以外はGeminiで補完する
+    if confident and (not details or (category and local_category.name)):
+        ocr_local_date.inc(outcome="skipped")
+        return {
+            "gemini_result": "", "name": local_category.name or "", "expiration_date": local_date.isoformat(), "category": category,
+            "personal": local_category.name is not None,
+        }
+    ocr_local_date.inc(outcome="confident" if confident else "unsure" if local_date else "none")
 
-        if not texts:
-            return {"text": "", "expiration_date": "", "name": "", "category": "", "image_url": ""}
+    # ローカルで読み取れなかった項目は、Geminiの結果に必ず含まれている必要がある
+    required = [] if confident else ["expiration_date"]
+    if details:
+        required += [field for field, known in (("category", category), ("name", local_category.name)) if not known]
 
-        full_text = texts[0].description
-        print(f"full_text: {full_text}")
+    # Gemini APIを使用した画像解析
+    attempts: List[Dict[str, str]] = []
+    try:
+        async with asyncio.timeout_at(deadline):
+            gemini_info = await _analyze_with_gemini(full_text, renditions.gemini, required, attempts)
+    except TimeoutError:
+        logger.warning("OCRの解析が期限内に終わらなかったため、読み取れた分だけを返します")
+        gemini_info = {"gemini_result": "", "name": "", "expiration_date": "", "category": "", **(attempts[-1] if attempts else {}), "partial": True}
 
-        # Gemini APIを使用した画像解析
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        img = Image.open(io.BytesIO(content))
-        
-        prompt = f"""この画像に写っている商品とカテゴリと賞味期限の情報を抜き出してください。
+    # 確実に読み取れた日付はGeminiの結果より優先し、Geminiが日付を返さなかった場合は候補を補う
+    if local_date is not None and (confident or not gemini_info["expiration_date"]):
+        gemini_info["expiration_date"] = local_date.isoformat()
+    # カテゴリは画像も見ているGeminiの結果を優先し、一覧にないカテゴリが返った場合だけ推定結果で補う
+    if gemini_info["category"] not in CATEGORIES and category:
+        gemini_info["category"] = category
+    if not gemini_info["name"] and local_category.name:
+        gemini_info["name"] = local_category.name
+        gemini_info["personal"] = True
+    return gemini_info
+
+def _build_prompt(full_text: str) -> str:
+    return f"""この画像に写っている商品とカテゴリと賞味期限の情報を抜き出してください。
             賞味期限の表示は必ずYYYY-MM-DDの形式で出力してください。
-            カテゴリはこの中から選択してください。野菜,果物,乳製品,肉類,魚介類,穀物,調味料,飲料,冷凍食品,卵,その他
+            カテゴリはこの中から選択してください。{",".join(CATEGORIES)}
 
             画像から抽出されたテキスト:
             {full_text}
@@ -102,52 +250,190 @@ async def process_image(image_file) -> Dict[str, str]:
             賞味期限:YYYY-MM-DD
             カテゴリ:
             """
-        gemini_response = model.generate_content([prompt, img])
-        gemini_result = gemini_response.text
 
-        # Gemini APIの結果から情報を抽出
-        name = extract_info(gemini_result, r'商品名:\s*(.+)')
-        expiration_date = extract_info(gemini_result, r'賞味期限:\s*(\d{4}-\d{2}-\d{2})')
-        category = extract_info(gemini_result, r'カテゴリ:\s*(.+)')
+async def _run_vision(func, content):
+    # 流量制御の枠を確保してからスレッドプールで実行し、クォータ超過などは再試行する
+    return await admission.call("vision", lambda: ocr_executor.run(func, content))
 
-        print(f"商品名: {name}")
-        print(f"賞味期限: {expiration_date}")
-        print(f"カテゴリ: {category}")
+def _is_valid(field: str, value: str) -> bool:
+    if field == "expiration_date":
+        try:
+            date.fromisoformat(value)
+            return True
+        except ValueError:
+            return False
+    if field == "category":
+        return value in CATEGORIES
+    return bool(value)
 
-        # 画像をSupabaseストレージにアップロード
-        file_name = f"{uuid.uuid4()}.jpg"
-        bucket_name = "food-images"
-        
-        # 画像をJPEGとして保存
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='JPEG')
-        img_byte_arr = img_byte_arr.getvalue()
+async def _analyze_with_gemini(full_text: str, img, required: List[str], attempts: List[Dict[str, str]]) -> Dict[str, str]:
+    """速いモデルから順に試し、required の項目が正しく読み取れなければ次のモデルに切り替える。
 
-        supabase.storage.from_(bucket_name).upload(file_name, img_byte_arr, file_options={"content-type": "image/jpeg"})
+    各モデルの結果は attempts に追加する（期限切れ時に途中の結果を使うため）。
+    """
+    prompt = _build_prompt(full_text)
+    tokens = estimate_tokens(prompt, images=1, output=100)
 
-        # 画像のURLを取得
-        image_url = supabase.storage.from_(bucket_name).get_public_url(file_name)
+    for tier, model in enumerate(ocr_model_tiers.models):
+        try:
+            gemini_result = await ocr_model_tiers.call(model, lambda: admission.call(
+                model, lambda: ocr_executor.run(_generate_with_gemini, model, prompt, img), tokens=tokens,
+            ))
+        except asyncio.CancelledError:
+            # 期限切れ（またはリクエストの中断）
+            ocr_model_tiers.record(model, "deadline")
+            raise
 
-        return {
-            "text": full_text,
+        # Gemini APIの結果から情報を抽出
+        info = {
             "gemini_result": gemini_result,
-            "name": name,
-            "expiration_date": expiration_date,
-            "category": category,
-            "image_url": image_url  # 画像URLを追加
+            "name": extract_info(gemini_result, r'商品名:\s*(.+)'),
+            "expiration_date": extract_info(gemini_result, r'賞味期限:\s*(\d{4}-\d{2}-\d{2})'),
+            "category": extract_info(gemini_result, r'カテゴリ:\s*(.+)'),
         }
-    except Exception as e:
-        print(f"エラー発生: {str(e)}")
-        print(f"エラーの詳細: {type(e).__name__}, {e.args}")
-        raise
+        attempts.append(info)
+        logger.debug("Gemini解析結果", extra={"fields": {"model": model, **{key: info[key] for key in ("name", "expiration_date", "category")}}})
+
+        missing = [field for field in required if not _is_valid(field, info[field])]
+        if not missing:
+            ocr_model_tiers.record(model, "accepted")
+            return info
+        if tier == len(ocr_model_tiers.models) - 1:
+            # 最後のモデルでも読み取れなかった項目は空のまま返す
+            ocr_model_tiers.record(model, "incomplete")
+            return info
+        ocr_model_tiers.record(model, "escalated")
+        logger.debug("%s の結果に不足があるため次のモデルで解析します: %s", model, missing)
+
+def _batch_detect_text(contents: List[bytes]) -> list:
+    """複数画像のテキスト検出をVisionのバッチAPIでまとめて行う"""
+    from google.cloud import vision
+
+    client = ai_clients.vision_client
+    feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+    responses = []
+    # batch_annotate_imagesは1リクエストあたりの画像数に上限がある
+    for start in range(0, len(contents), VISION_BATCH_SIZE):
+        requests = [
+            vision.AnnotateImageRequest(image=vision.Image(content=content), features=[feature])
+            for content in contents[start:start + VISION_BATCH_SIZE]
+        ]
+        with track_upstream("vision"):
+            batch = client.batch_annotate_images(requests=requests)
+        responses.extend(batch.responses)
+    return responses
+
+async def process_images_batch(contents: List[bytes], details: bool = True, user_id: str | None = None) -> AsyncIterator[Dict[str, Any]]:
+    """複数画像をまとめてOCR処理し、完了した順に1件ずつ結果を返す。
+
+    各要素は {"index", "status": "ok" | "error", "result" | "detail"} の形式で、
+    一部の画像が失敗しても他の画像の処理は継続する。details, user_id は process_image と同じ。
+    """
+    digests = [image_digest(content) for content in contents]
+    cache_keys = [_cache_keys(digest, details) for digest in digests]
+
+    pending = []
+    image_urls = {}
+    for index, keys in enumerate(cache_keys):
+        cached = await _cached_result(keys)
+        if cached is not None:
+            yield {"index": index, "status": "ok", "result": cached}
+        else:
+            pending.append(index)
+            image_urls[index] = await _uploaded_image_url(digests[index], details)
+
+    if not pending:
+        return
+
+    try:
+        async with ocr_executor.slot():
+            async for item in _process_pending_batch(contents, cache_keys, image_urls, pending, details, user_id):
+                yield item
+    except OCRQueueFullError:
+        for index in pending:
+            yield {"index": index, "status": "error", "detail": "OCR処理が混み合っています"}
+
+async def _process_pending_batch(contents: List[bytes], cache_keys: List[List[str]], image_urls: Dict[int, str], pending: List[int], details: bool, user_id: str | None) -> AsyncIterator[Dict[str, Any]]:
+    # バッチ全体で実行枠は1つのため、スレッドプールを同時に使うのは実行枠1つ分（threads_per_slot）までにする。
+    # そうしないと、最大 OCR_BATCH_MAX_IMAGES 件の前処理・Gemini呼び出しがプールを占有し、単発の /ocr が待たされる
+    threads_per_slot = ocr_executor.threads_per_slot
+    preprocess_semaphore = asyncio.Semaphore(threads_per_slot)
+
+    async def preprocess(index: int):
+        async with preprocess_semaphore:
+            return await ocr_executor.run(preprocess_image, contents[index])
+
+    # 前処理は画像ごとに並列で行い、失敗した画像だけをエラーにする
+    preprocessed = await asyncio.gather(*(preprocess(index) for index in pending), return_exceptions=True)
+    renditions = {}
+    for index, item in zip(pending, preprocessed):
+        if isinstance(item, Exception):
+            yield {"index": index, "status": "error", "detail": f"画像の読み込みに失敗しました: {item}"}
+        else:
+            renditions[index] = item
+
+    if not renditions:
+        return
+
+    indexes = list(renditions)
+    # Visionのバッチ呼び出しは全画像で1つにまとめ、各画像のグラフからはその結果を共有して参照する
+    batch_vision = asyncio.ensure_future(_run_vision(_batch_detect_text, [renditions[index].ocr for index in indexes]))
+
+    # Geminiへの同時リクエスト数を制限する（実行枠1つ分のスレッド数を超えないようにする）
+    gemini_semaphore = asyncio.Semaphore(min(BATCH_GEMINI_CONCURRENCY, threads_per_slot))
+
+    async def vision(position: int):
+        # 1枚の画像の失敗で共有しているバッチ呼び出しがキャンセルされないようにする
+        response = (await asyncio.shield(batch_vision))[position]
+        if response.error.message:
+            raise RuntimeError(response.error.message)
+        return response.text_annotations
+
+    async def analyze(texts, item):
+        async with gemini_semaphore:
+            # バッチでは画像ごとに、解析を始めてから OCR_LATENCY_BUDGET 秒までに打ち切る
+            deadline = asyncio.get_running_loop().time() + OCR_LATENCY_BUDGET
+            return await _analyze_texts(texts, item, details, deadline, user_id)
+
+    async def handle(index: int, position: int) -> Dict[str, Any]:
+        item = renditions[index]
+        # アップロードはテキストが検出された画像だけ、Geminiの解析と並行して行う
+        uploaded: List[str] = []
+        graph = StageGraph("ocr_batch")
+        graph.add("vision", lambda: vision(position))
+        graph.add("gemini", lambda texts: analyze(texts, item), after=("vision",))
+        graph.add("upload", lambda texts: _upload_if_text(texts, item, uploaded, image_urls[index]), after=("vision",))
+        try:
+            results = await graph.run()
+        except UpstreamBusyError as e:
+            _discard_uploads(uploaded)
+            return {"index": index, "status": "error", "detail": "OCR処理が混み合っています", "retry_after": e.retry_after}
+        except Exception as e:
+            logger.error("バッチOCRでエラー発生 (index=%d): %s", index, e)
+            _discard_uploads(uploaded)
+            return {"index": index, "status": "error", "detail": f"OCR処理中にエラーが発生しました: {e}"}
+        except asyncio.CancelledError:
+            _discard_uploads(uploaded)
+            raise
+
+        if results["gemini"] is None:
+            result = dict(EMPTY_RESULT)
+        else:
+            result = {"text": results["vision"][0].description, **results["gemini"], "image_url": results["upload"]}
+        personal = result.pop("personal", False)
+        if not result.get("partial") and not personal:
+            await ocr_cache.set(cache_keys[index][-1], result)
+        return {"index": index, "status": "ok", "result": result}
+
+    tasks = [asyncio.ensure_future(handle(index, position)) for position, index in enumerate(indexes)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
     finally:
-        # 一時ファイルを削除
-        if temp_credentials_path and os.path.exists(temp_credentials_path):
-            try:
-                os.remove(temp_credentials_path)
-                print(f"一時認証ファイルを削除しました: {temp_credentials_path}")
-            except Exception as e:
-                print(f"一時認証ファイルの削除中にエラーが発生しました: {e}")
+        # クライアントの切断などで途中終了した場合も、画像ごとの処理とバッチ呼び出しを残さない
+        for task in (*tasks, batch_vision):
+            task.cancel()
+        await asyncio.gather(*tasks, batch_vision, return_exceptions=True)
 
 def extract_info(text: str, pattern: str) -> str:
     match = re.search(pattern, text)
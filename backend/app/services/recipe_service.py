@@ -0,0 +1,108 @@
+import re
+import json
+import hashlib
+import unicodedata
+import itertools
+from typing import List
+from app.utils.cache import CacheBackend, load_cache_backend
+from app.utils.gemini_client import get_recipes_from_gemini
+from app.utils.settings import settings
+
+RECIPE_CACHE_MAX_ENTRIES = settings.recipe_cache_max_entries
+RECIPE_CACHE_TTL = settings.recipe_cache_ttl
+# variety モードで食材の組み合わせごとに保持するレシピの種類数
+RECIPE_MAX_VARIANTS = settings.recipe_max_variants
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _katakana_to_hiragana(text: str) -> str:
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in text)
+
+
+def normalize_ingredient(ingredient: str) -> str:
+    """全角・半角、空白、カタカナ・ひらがなの違いを吸収する（例: ﾀﾏﾈｷﾞ → たまねぎ）"""
+    text = unicodedata.normalize("NFKC", ingredient)
+    text = _WHITESPACE.sub(" ", text).strip().lower()
+    return _katakana_to_hiragana(text)
+
+
+def recipe_cache_key(ingredients: List[str], cooking_time: str, difficulty: str) -> str:
+    """食材の順序や表記ゆれに依存しないキャッシュキー"""
+    normalized = sorted(set(filter(None, (normalize_ingredient(i) for i in ingredients))))
+    raw = json.dumps([normalized, normalize_ingredient(cooking_time), normalize_ingredient(difficulty)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+class RecipeService:
+    """get_recipes_from_gemini の前段に置くレシピキャッシュ。
+
+    バリアントごとに "{key}:{n}" に保存し、同じバリアントの同時リクエストは
+    get_or_compute で（共有キャッシュの場合はワーカーをまたいで）1回のGemini呼び出しにまとめる。
+    variety=True の場合は、最大 RECIPE_MAX_VARIANTS 種類まで新しいレシピを生成し、
+    それ以降はキャッシュ済みのレシピを順番に返す。
+    """
+
+    def __init__(self, maxsize: int = RECIPE_CACHE_MAX_ENTRIES, ttl: float = RECIPE_CACHE_TTL, max_variants: int = RECIPE_MAX_VARIANTS, cache: CacheBackend | None = None):
+        self.cache = cache or load_cache_backend(settings.cache_backend, namespace="recipes", maxsize=maxsize, ttl=ttl)
+        self.maxsize = maxsize
+        self.max_variants = max_variants
+        self._rotation: dict[str, itertools.count] = {}
+
+    async def _variants(self, key: str) -> List[List[dict]]:
+        variants = []
+        for index in range(self.max_variants):
+            recipes = await self.cache.aget(f"{key}:{index}")
+            if recipes is None:
+                break
+            variants.append(recipes)
+        return variants
+
+    def _rotate(self, key: str, variants: List[List[dict]]) -> List[dict]:
+        counter = self._rotation.setdefault(key, itertools.count())
+        if len(self._rotation) > self.maxsize:
+            self._rotation.clear()
+        return variants[next(counter) % len(variants)]
+
+    async def get_recipes(self, ingredients: List[str], cooking_time: str = "medium", difficulty: str = "medium", variety: bool = False) -> List[dict]:
+        key = recipe_cache_key(ingredients, cooking_time, difficulty)
+        if not variety:
+            return await self.cache.get_or_compute(
+                f"{key}:0", lambda: get_recipes_from_gemini(ingredients, cooking_time, difficulty)
+            )
+
+        variants = await self._variants(key)
+        if len(variants) >= self.max_variants:
+            return self._rotate(key, variants)
+
+        # 生成中の同じバリアントがあれば、その結果を共有する
+        return await self.cache.get_or_compute(
+            f"{key}:{len(variants)}", lambda: get_recipes_from_gemini(ingredients, cooking_time, difficulty)
+        )
+
+    async def store(self, key: str, recipes: List[dict]):
+        """ストリーミングで生成したレシピを、空いている次のバリアントとして保存する"""
+        variants = await self._variants(key)
+        if len(variants) < self.max_variants:
+            await self.cache.aadd(f"{key}:{len(variants)}", recipes)
+
+    async def lookup(self, ingredients: List[str], cooking_time: str = "medium", difficulty: str = "medium", variety: bool = False) -> List[dict] | None:
+        """キャッシュ済みのレシピを返す（Geminiは呼ばない）。
+
+        variety=True の場合は get_recipes と同じく、バリアントが揃うまでは None（新しく生成する）を返し、
+        揃った後はキャッシュ済みのレシピを順番に返す。
+        """
+        key = recipe_cache_key(ingredients, cooking_time, difficulty)
+        if not variety:
+            return await self.cache.aget(f"{key}:0")
+        variants = await self._variants(key)
+        if len(variants) >= self.max_variants:
+            return self._rotate(key, variants)
+        return None
+
+    @property
+    def stats(self) -> dict:
+        return {**self.cache.stats, "inflight": self.cache.inflight}
+
+
+recipe_service = RecipeService()
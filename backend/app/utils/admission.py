@@ -0,0 +1,267 @@
+import math
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict
+from app.utils.metrics import admission_wait, admission_rejected, upstream_retries
+from app.utils.settings import Settings, settings
+
+logger = logging.getLogger(__name__)
+
+# リクエストを送ったユーザー（公平な待ち行列に使う。get_current_user で設定される）
+current_user_id: ContextVar[str] = ContextVar("current_user_id", default="anonymous")
+
+# トークンバケットに貯められる量（この秒数分の呼び出しまでは一度に通す）
+BURST_SECONDS = 10
+
+
+class UpstreamBusyError(Exception):
+    """上流サービスの呼び出し枠を確保できなかったときに送出される"""
+
+    def __init__(self, upstream: str, retry_after: int):
+        super().__init__(f"{upstream} の呼び出しが混み合っています")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def is_retryable(error: BaseException) -> bool:
+    """クォータ超過・一時的な障害など、時間をおけば成功する可能性があるエラーか"""
+    from google.api_core import exceptions
+
+    return isinstance(error, (
+        exceptions.TooManyRequests,
+        exceptions.ResourceExhausted,
+        exceptions.ServiceUnavailable,
+        exceptions.DeadlineExceeded,
+        exceptions.InternalServerError,
+    ))
+
+
+def is_quota_error(error: BaseException) -> bool:
+    from google.api_core import exceptions
+
+    return isinstance(error, (exceptions.TooManyRequests, exceptions.ResourceExhausted))
+
+
+class TokenBucket:
+    """1分あたり per_minute の割合で補充されるトークンバケット"""
+
+    def __init__(self, per_minute: float, burst_seconds: float = BURST_SECONDS):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount を取り出せるようになるまでの秒数（取り出せる場合は0）"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self._tokens >= amount else (amount - self._tokens) / self.rate
+
+    def take(self, amount: float):
+        self._tokens -= min(amount, self.capacity)
+
+    def drain(self):
+        """上流からクォータ超過が返った場合に、貯まっている分を使い切ったものとする"""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future
+    tokens: int
+
+
+class UpstreamLimiter:
+    """上流サービス（モデル）1つ分の呼び出し枠。
+
+    リクエスト数・トークン数のトークンバケットに空きがなければ待ち行列に入り、
+    ユーザーごとの待ち行列から順番に（ラウンドロビンで）枠を割り当てる。
+    """
+
+    def __init__(self, name: str, rpm: float, tpm: float | None = None, max_queue: int = 32,
+                 max_queue_per_user: int = 8, max_wait: float = 10):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        self.waiting = 0
+        self._queues: "OrderedDict[str, deque[_Waiter]]" = OrderedDict()
+        self._pump_task: asyncio.Task | None = None
+
+    def _try_take(self, tokens: int) -> float:
+        wait = self.requests.wait_time(1)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        if wait == 0:
+            self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+        return wait
+
+    def retry_after(self) -> int:
+        """待ち行列がはけるまでのおおよその秒数"""
+        return max(1, math.ceil((self.waiting + 1) / self.requests.rate))
+
+    def throttle(self):
+        self.requests.drain()
+        if self.tokens is not None:
+            self.tokens.drain()
+
+    async def acquire(self, user: str, tokens: int = 0):
+        if not self._queues and self._try_take(tokens) == 0:
+            admission_wait.observe(0, upstream=self.name)
+            return
+
+        if self.waiting >= self.max_queue or len(self._queues.get(user, ())) >= self.max_queue_per_user:
+            admission_rejected.inc(upstream=self.name, reason="queue_full")
+            raise UpstreamBusyError(self.name, self.retry_after())
+
+        start = time.perf_counter()
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tokens)
+        self._queues.setdefault(user, deque()).append(waiter)
+        self.waiting += 1
+        if self._pump_task is None:
+            self._pump_task = asyncio.create_task(self._pump())
+        try:
+            await asyncio.wait_for(waiter.future, self.max_wait)
+        except asyncio.TimeoutError:
+            admission_rejected.inc(upstream=self.name, reason="timeout")
+            raise UpstreamBusyError(self.name, self.retry_after()) from None
+        finally:
+            self.waiting -= 1
+        admission_wait.observe(time.perf_counter() - start, upstream=self.name)
+
+    def _pop(self, user: str):
+        queue = self._queues[user]
+        queue.popleft()
+        if queue:
+            # 次は別のユーザーの順番にする
+            self._queues.move_to_end(user)
+        else:
+            del self._queues[user]
+
+    async def _pump(self):
+        """バケットに空きができ次第、ユーザーを順に回って待っている呼び出しを通す"""
+        try:
+            while self._queues:
+                user, queue = next(iter(self._queues.items()))
+                waiter = queue[0]
+                if waiter.future.done():
+                    # 待ち時間の上限を超えた・キャンセルされた呼び出し
+                    self._pop(user)
+                    continue
+                wait = self._try_take(waiter.tokens)
+                if wait:
+                    await asyncio.sleep(wait)
+                    continue
+                self._pop(user)
+                waiter.future.set_result(None)
+        finally:
+            self._pump_task = None
+
+    @property
+    def stats(self) -> dict:
+        return {"waiting": self.waiting, "users": len(self._queues)}
+
+
+class AdmissionController:
+    """Gemini・Visionなど上流のAI呼び出しの前段に置く流量制御。
+
+    モデルごとに1分あたりのリクエスト数・トークン数を制限し、枠が空くまで公平な待ち行列で待たせる。
+    待ち行列が一杯・待ち時間の上限を超えた場合は UpstreamBusyError（Retry-After付きの503）で即座に返す。
+    クォータ超過などの一時的なエラーは、ジッター付きの指数バックオフで再試行する。
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, float]], max_queue: int = 32, max_queue_per_user: int = 8,
+                 max_wait: float = 10, retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8):
+        self.limits = limits
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._limiters: Dict[str, UpstreamLimiter] = {}
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "AdmissionController":
+        return cls(
+            limits=settings.upstream_limits,
+            max_queue=settings.admission_max_queue,
+            max_queue_per_user=settings.admission_max_queue_per_user,
+            max_wait=settings.admission_max_wait,
+            retries=settings.admission_retries,
+            backoff_base=settings.admission_backoff_base,
+            backoff_max=settings.admission_backoff_max,
+        )
+
+    def limiter(self, upstream: str) -> UpstreamLimiter | None:
+        """上流サービスの呼び出し枠（制限が設定されていなければNone）"""
+        if upstream not in self._limiters and upstream in self.limits:
+            limit = self.limits[upstream]
+            self._limiters[upstream] = UpstreamLimiter(
+                upstream, limit["rpm"], limit.get("tpm"),
+                max_queue=self.max_queue, max_queue_per_user=self.max_queue_per_user, max_wait=self.max_wait,
+            )
+        return self._limiters.get(upstream)
+
+    async def acquire(self, upstream: str, tokens: int = 0):
+        limiter = self.limiter(upstream)
+        if limiter is not None:
+            await limiter.acquire(current_user_id.get(), tokens)
+
+    def backoff(self, attempt: int) -> float:
+        """attempt回目の再試行までの待ち時間（full jitter）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def on_error(self, upstream: str, error: BaseException, attempt: int):
+        """再試行できるエラーならバックオフして戻り、できなければ例外を送出する"""
+        if not is_retryable(error):
+            raise error
+        limiter = self.limiter(upstream)
+        if is_quota_error(error) and limiter is not None:
+            # 上流のクォータを使い切っているため、他のリクエストも含めて補充を待つ
+            limiter.throttle()
+        if attempt >= self.retries:
+            admission_rejected.inc(upstream=upstream, reason="retries_exhausted")
+            retry_after = limiter.retry_after() if limiter is not None else math.ceil(self.backoff_max)
+            raise UpstreamBusyError(upstream, retry_after) from error
+        upstream_retries.inc(upstream=upstream)
+        logger.warning("%s の呼び出しに失敗したため再試行します (%d回目): %s", upstream, attempt + 1, error)
+        await asyncio.sleep(self.backoff(attempt))
+
+    async def call(self, upstream: str, func: Callable[[], Awaitable[Any]], tokens: int = 0) -> Any:
+        """呼び出し枠を確保して func() を実行し、一時的なエラーは再試行する"""
+        attempt = 0
+        while True:
+            await self.acquire(upstream, tokens)
+            try:
+                return await func()
+            except Exception as e:
+                await self.on_error(upstream, e, attempt)
+            attempt += 1
+
+    @property
+    def stats(self) -> dict:
+        return {name: limiter.stats for name, limiter in self._limiters.items()}
+
+
+def estimate_tokens(prompt: str, images: int = 0, output: int = 0) -> int:
+    """呼び出し前にトークン数を見積もる（日本語はおおよそ1文字1トークン、画像は1枚258トークン）"""
+    return len(prompt) + images * 258 + output
+
+
+admission = AdmissionController.from_settings(settings)
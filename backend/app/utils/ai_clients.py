@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import os
+import json
+import asyncio
+import logging
+import threading
+from typing import TYPE_CHECKING
+from app.utils.settings import settings
+
+# gRPC・Vision・GeminiのSDKは読み込みに時間がかかるため、初めて使うときに読み込む
+if TYPE_CHECKING:
+    import google.generativeai as genai
+    from google.cloud import vision
+
+logger = logging.getLogger(__name__)
+
+# gRPCチャネルのキープアライブ設定（アイドル中の接続切断を防ぐ）
+GRPC_CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.max_receive_message_length", 32 * 1024 * 1024),
+    ("grpc.max_send_message_length", 32 * 1024 * 1024),
+]
+
+VISION_DEFAULT_ENDPOINT = "vision.googleapis.com:443"
+
+
+def load_google_credentials():
+    """Google Cloudの認証情報をメモリ上に読み込む（一時ファイルは作成しない）"""
+    from google.oauth2 import service_account
+    from google.cloud.vision_v1.services.image_annotator.transports import ImageAnnotatorGrpcTransport
+
+    google_credentials_json = settings.google_credentials_json
+    if google_credentials_json:
+        try:
+            credentials_dict = json.loads(google_credentials_json, strict=False)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"GOOGLE_APPLICATION_CREDENTIALS_JSONの解析に失敗しました: {e}") from e
+        return service_account.Credentials.from_service_account_info(
+            credentials_dict, scopes=ImageAnnotatorGrpcTransport.AUTH_SCOPES
+        )
+
+    # 下記はローカル環境開発用にいれている処理
+    credentials_path = settings.google_credentials_path
+    if credentials_path:
+        if not os.path.exists(credentials_path):
+            raise ValueError(f"クレデンシャルファイルが見つかりません: {credentials_path}")
+        return service_account.Credentials.from_service_account_file(
+            credentials_path, scopes=ImageAnnotatorGrpcTransport.AUTH_SCOPES
+        )
+
+    raise ValueError("Google Cloud認証情報が設定されていません")
+
+
+class AIClientRegistry:
+    """Vision / Gemini のクライアントをプロセス全体で共有するレジストリ。
+
+    認証情報の読み込み・gRPCチャネルの作成・モデルの生成は初回のみ行い、
+    以降のリクエストでは同じインスタンスを再利用する。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._credentials = None
+        self._vision_channel = None
+        self._vision_client = None
+        self._models: dict[str, genai.GenerativeModel] = {}
+        self._gemini_configured = False
+
+    @property
+    def credentials(self):
+        if self._credentials is None:
+            with self._lock:
+                if self._credentials is None:
+                    self._credentials = load_google_credentials()
+        return self._credentials
+
+    @property
+    def vision_client(self) -> vision.ImageAnnotatorClient:
+        if self._vision_client is None:
+            with self._lock:
+                if self._vision_client is None:
+                    self._vision_client = self._create_vision_client()
+        return self._vision_client
+
+    def _create_vision_client(self) -> vision.ImageAnnotatorClient:
+        import grpc
+        from google.cloud import vision
+        from google.cloud.vision_v1.services.image_annotator.transports import ImageAnnotatorGrpcTransport
+
+        endpoint = settings.vision_api_endpoint
+        if endpoint and settings.vision_api_insecure:
+            # ローカルのフェイクVisionサーバー向け（TLS・認証なし）
+            channel = grpc.insecure_channel(endpoint, options=GRPC_CHANNEL_OPTIONS)
+        else:
+            channel = ImageAnnotatorGrpcTransport.create_channel(
+                endpoint or VISION_DEFAULT_ENDPOINT,
+                credentials=self.credentials,
+                options=GRPC_CHANNEL_OPTIONS,
+            )
+        self._vision_channel = channel
+        return vision.ImageAnnotatorClient(transport=ImageAnnotatorGrpcTransport(channel=channel))
+
+    def model(self, name: str) -> genai.GenerativeModel:
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                import google.generativeai as genai
+
+                if not self._gemini_configured:
+                    genai.configure(api_key=settings.gemini_api_key)
+                    self._gemini_configured = True
+                model = self._models.get(name)
+                if model is None:
+                    model = genai.GenerativeModel(name)
+                    self._models[name] = model
+        if settings.gemini_api_endpoint and settings.gemini_api_insecure:
+            self._attach_insecure_gemini_clients(model)
+        return model
+
+    def _attach_insecure_gemini_clients(self, model: genai.GenerativeModel):
+        """ローカルのフェイクGeminiサーバー向け（TLS・認証なし）のクライアントをモデルに設定する"""
+        import grpc
+        from google.ai import generativelanguage as glm
+        from google.ai.generativelanguage_v1beta.services.generative_service.transports import (
+            GenerativeServiceGrpcTransport,
+            GenerativeServiceGrpcAsyncIOTransport,
+        )
+
+        endpoint = settings.gemini_api_endpoint
+        if model._client is None:
+            channel = grpc.insecure_channel(endpoint, options=GRPC_CHANNEL_OPTIONS)
+            model._client = glm.GenerativeServiceClient(transport=GenerativeServiceGrpcTransport(channel=channel))
+        if model._async_client is None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                # grpc.aioのチャネルは使用するイベントループ上で作成する必要がある
+                return
+            channel = grpc.aio.insecure_channel(endpoint, options=GRPC_CHANNEL_OPTIONS)
+            model._async_client = glm.GenerativeServiceAsyncClient(transport=GenerativeServiceGrpcAsyncIOTransport(channel=channel))
+
+    def start(self):
+        """起動時に認証情報とクライアントを準備する"""
+        self.vision_client
+        self.model("gemini-1.5-pro")
+        self.model("gemini-1.5-flash")
+
+    def warm_up(self, timeout: float = 10.0):
+        """gRPCチャネルを事前に接続しておき、デプロイ直後の初回OCRが遅くならないようにする"""
+        import grpc
+
+        self.vision_client
+        try:
+            grpc.channel_ready_future(self._vision_channel).result(timeout=timeout)
+            logger.info("Vision gRPCチャネルのウォームアップが完了しました")
+        except grpc.FutureTimeoutError:
+            logger.warning("Vision gRPCチャネルのウォームアップがタイムアウトしました")
+
+    def close(self):
+        with self._lock:
+            if self._vision_client is not None:
+                self._vision_client.transport.close()
+            self._vision_client = None
+            self._vision_channel = None
+            self._models.clear()
+
+
+ai_clients = AIClientRegistry()
@@ -0,0 +1,419 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import importlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Hashable
+from app.utils.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# ファイルやネットワークに読み書きするキャッシュの呼び出しを、イベントループを止めずに実行するスレッド
+_io_pool = ThreadPoolExecutor(max_workers=settings.cache_threads, thread_name_prefix="cache")
+
+
+class TTLLRUCache:
+    """TTL付きのスレッドセーフなLRUキャッシュ。
+
+    maxsize を超えると最も長く参照されていないエントリから削除する。
+    ttl は秒単位で、None の場合は期限切れにならない。
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float | None, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key: Hashable, value: Any, ttl: float | None = None) -> bool:
+        """key が存在しない（または期限切れの）場合だけ保存し、保存したかどうかを返す"""
+        ttl = self.ttl if ttl is None else ttl
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (item[0] is None or item[0] > now):
+                return False
+            self._data[key] = (now + ttl if ttl is not None else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def pop_prefix(self, prefix: str) -> int:
+        """prefix で始まる文字列キーをすべて削除し、削除した件数を返す"""
+        with self._lock:
+            keys = [key for key in self._data if isinstance(key, str) and key.startswith(prefix)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class SingleFlight:
+    """同じキーに対する同時実行中の非同期処理を1回にまとめる。
+
+    実行中のキーに対して do() が呼ばれた場合は新たに処理を開始せず、
+    先行する処理の結果（または例外）を共有する。処理は独立したタスクとして実行するため、
+    最初の呼び出し元がキャンセルされても他の待機者には影響しない。
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # 待機者が全員キャンセルされた場合でも例外を回収しておく
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+class CacheBackend:
+    """キャッシュの保存先のインターフェース。
+
+    実装は get / set / add / delete / delete_prefix を持つ。キーは文字列、値はJSONに変換できるオブジェクトとする。
+    非同期の処理からは aget / aset / aadd / adelete / adelete_prefix を使う。
+    blocking が真の実装（ファイル・ネットワーク）ではキャッシュ用のスレッドで実行し、イベントループを止めない。
+    get_or_compute は add によるロックで、同じキーの計算をワーカーをまたいで1回にまとめる。
+    独自の実装は "module.path:ClassName" の形式で環境変数に指定する（load_cache_backend参照）。
+    """
+
+    # 呼び出しがI/Oを伴うか（偽の場合は非同期のメソッドからもその場で呼び出す）
+    blocking = True
+
+    # get_or_compute で他のワーカーの計算を待つ上限と、結果を確認する間隔（秒）
+    lock_timeout = 30.0
+    lock_poll_interval = 0.05
+
+    def __init__(self):
+        self._singleflight = SingleFlight()
+
+    def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        """key が存在しない場合だけ保存する（アトミック）。保存した場合はTrue"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str):
+        """prefix で始まるキーをまとめて削除する（名前空間ごとの無効化）"""
+        raise NotImplementedError
+
+    async def _run(self, func: Callable, *args, **kwargs) -> Any:
+        if not self.blocking:
+            return func(*args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(_io_pool, lambda: func(*args, **kwargs))
+
+    async def aget(self, key: str) -> Any:
+        return await self._run(self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl: float | None = None):
+        await self._run(self.set, key, value, ttl=ttl)
+
+    async def aadd(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        return await self._run(self.add, key, value, ttl=ttl)
+
+    async def adelete(self, key: str):
+        await self._run(self.delete, key)
+
+    async def adelete_prefix(self, prefix: str):
+        await self._run(self.delete_prefix, prefix)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: float | None = None) -> Any:
+        """キャッシュになければ compute() の結果を保存して返す。
+
+        プロセス内の同時呼び出しは SingleFlight で、他のワーカーとは "{key}:lock" のロックでまとめる。
+        ロックを取れなかった場合は、結果が保存されるかロックが期限切れになるまで待つ。
+        compute() が None を返した場合は保存しない。
+        """
+        value = await self.aget(key)
+        if value is not None:
+            return value
+        return await self._singleflight.do(key, lambda: self._compute(key, compute, ttl))
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: float | None) -> Any:
+        lock_key = f"{key}:lock"
+        locked = await self.aadd(lock_key, os.getpid(), ttl=self.lock_timeout)
+        deadline = time.monotonic() + self.lock_timeout
+        while not locked and time.monotonic() < deadline:
+            await asyncio.sleep(self.lock_poll_interval)
+            value = await self.aget(key)
+            if value is not None:
+                return value
+            locked = await self.aadd(lock_key, os.getpid(), ttl=self.lock_timeout)
+        try:
+            value = await compute()
+            if value is not None:
+                await self.aset(key, value, ttl=ttl)
+            return value
+        finally:
+            if locked:
+                await self.adelete(lock_key)
+
+    @property
+    def inflight(self) -> int:
+        """このプロセスで get_or_compute の計算中のキーの数"""
+        return len(self._singleflight)
+
+    @property
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """プロセス内のLRUキャッシュ（単一ワーカー向け）。namespace はワーカー間で共有しないため使わない"""
+
+    blocking = False
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None, namespace: str | None = None):
+        super().__init__()
+        self._cache = TTLLRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key: str) -> Any:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        self._cache.set(key, value, ttl=ttl)
+
+    def add(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        return self._cache.add(key, value, ttl=ttl)
+
+    def delete(self, key: str):
+        self._cache.pop(key)
+
+    def delete_prefix(self, prefix: str):
+        self._cache.pop_prefix(prefix)
+
+    @property
+    def stats(self) -> dict:
+        return self._cache.stats
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """同じホストのワーカー間で共有するSQLiteファイルのキャッシュ。
+
+    namespace ごとにテーブルを分け、値はJSONで保存する。WALモードのため読み込みは書き込みを待たず、
+    mmapで読み込んだページはワーカー間でOSのページキャッシュを共有する。
+    期限は実時刻で管理し、maxsize を超えた分は期限の近いものから削除する（厳密なLRUではない）。
+    書き込みが集中してロックを busy_timeout 秒以内に取れない場合、読み込みはミス、書き込みは省略として扱う。
+    削除（無効化）は省略すると古い値を返し続けるため、invalidate_timeout 秒まで待つ。
+    """
+
+    # この回数の書き込みごとに期限切れ・上限超過のエントリを削除する
+    evict_every = 64
+    mmap_size = 64 * 2**20
+    invalidate_timeout = 5.0
+
+    def __init__(self, path: str, namespace: str = "default", maxsize: int = 1024, ttl: float | None = None, busy_timeout: float | None = None):
+        super().__init__()
+        if not re.fullmatch(r"[A-Za-z0-9_]+", namespace):
+            raise ValueError(f"namespace に使えない文字が含まれています: {namespace}")
+        self.path = path
+        self.table = f"cache_{namespace}"
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.busy_timeout = settings.cache_busy_timeout if busy_timeout is None else busy_timeout
+        self.hits = 0
+        self.misses = 0
+        self.lock_timeouts = 0
+        self._writes = 0
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn()
+
+    def _conn(self) -> sqlite3.Connection:
+        # 接続はスレッドごと。fork後の子プロセスでは親の接続を使わない
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("pragma journal_mode=wal")
+        conn.execute("pragma synchronous=normal")
+        conn.execute(f"pragma mmap_size={self.mmap_size}")
+        conn.execute(f"create table if not exists {self.table} (key text primary key, value text not null, expires_at real)")
+        conn.execute(f"create index if not exists {self.table}_expires_at on {self.table} (expires_at)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _expires_at(self, ttl: float | None) -> float | None:
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() + ttl if ttl is not None else None
+
+    @contextmanager
+    def _busy(self, action: str, key: str):
+        """ロックの待ち時間切れ（database is locked）を記録して抑止する。それ以外のエラーはそのまま送出する"""
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            self.lock_timeouts += 1
+            logger.debug("SQLite cache %s skipped (%s): %s", action, self.table, key)
+
+    def get(self, key: str) -> Any:
+        row = None
+        with self._busy("get", key):
+            row = self._conn().execute(f"select value, expires_at from {self.table} where key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float | None = None):
+        with self._busy("set", key):
+            self._conn().execute(
+                f"insert or replace into {self.table} (key, value, expires_at) values (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False, default=str), self._expires_at(ttl)),
+            )
+            self._after_write()
+
+    def add(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        # 期限切れの行は上書きし、有効な行があれば何もしない（1文で判定するためアトミック）。
+        # ロックを取れなかった場合は保存しなかったものとして扱う（get_or_compute は結果の保存を待つ）
+        rowcount = 0
+        with self._busy("add", key):
+            rowcount = self._conn().execute(
+                f"insert into {self.table} (key, value, expires_at) values (?, ?, ?) "
+                f"on conflict (key) do update set value = excluded.value, expires_at = excluded.expires_at "
+                f"where {self.table}.expires_at is not null and {self.table}.expires_at <= ?",
+                (key, json.dumps(value, ensure_ascii=False, default=str), self._expires_at(ttl), time.time()),
+            ).rowcount
+            if rowcount:
+                self._after_write()
+        return rowcount > 0
+
+    def _invalidate(self, sql: str, params: tuple):
+        conn = self._conn()
+        conn.execute(f"pragma busy_timeout={int(self.invalidate_timeout * 1000)}")
+        try:
+            conn.execute(sql, params)
+        finally:
+            conn.execute(f"pragma busy_timeout={int(self.busy_timeout * 1000)}")
+
+    def delete(self, key: str):
+        self._invalidate(f"delete from {self.table} where key = ?", (key,))
+
+    def delete_prefix(self, prefix: str):
+        # 主キーの範囲で削除する（LIKEのエスケープが不要で、インデックスを使える）
+        self._invalidate(f"delete from {self.table} where key >= ? and key < ?", (prefix, prefix + "\U0010ffff"))
+
+    def _after_write(self):
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            with self._busy("evict", "*"):
+                self.evict()
+
+    def evict(self):
+        conn = self._conn()
+        conn.execute(f"delete from {self.table} where expires_at <= ?", (time.time(),))
+        overflow = conn.execute(f"select count(*) from {self.table}").fetchone()[0] - self.maxsize
+        if overflow > 0:
+            conn.execute(
+                f"delete from {self.table} where key in "
+                f"(select key from {self.table} order by expires_at is null, expires_at limit ?)",
+                (overflow,),
+            )
+
+    def __len__(self) -> int:
+        return self._conn().execute(f"select count(*) from {self.table}").fetchone()[0]
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "lock_timeouts": self.lock_timeouts,
+        }
+
+
+def load_cache_backend(spec: str | None, namespace: str, **kwargs) -> CacheBackend:
+    """キャッシュの保存先を生成する。
+
+    spec が空または "memory" の場合はプロセス内LRU、"sqlite" の場合は CACHE_PATH のSQLiteファイル、
+    それ以外は "module:ClassName" から namespace / maxsize / ttl を渡して生成する。
+    """
+    if not spec or spec == "memory":
+        return MemoryCacheBackend(namespace=namespace, **kwargs)
+    if spec == "sqlite":
+        return SQLiteCacheBackend(settings.cache_path, namespace=namespace, **kwargs)
+    module_name, _, attr = spec.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr)
+    return factory(namespace=namespace, **kwargs)
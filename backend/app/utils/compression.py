@@ -0,0 +1,119 @@
+import gzip
+import functools
+from typing import Dict, Iterable
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotliは任意。ない場合はgzipだけを使う
+    brotli = None
+
+# 圧縮する Content-Type（NDJSON / SSE は逐次届ける必要があるため対象外）
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv")
+# この大きさ以上の本文はイベントループを止めないようスレッドで圧縮する
+THREAD_THRESHOLD = 256 * 1024
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding を {エンコーディング: q値} にする"""
+    accepted = {}
+    for item in header.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def negotiate_encoding(header: str | None, available: Iterable[str]) -> str | None:
+    """available（優先順）のうち、クライアントが受け付けるq値が最も高いものを返す"""
+    if not header:
+        return None
+    accepted = _accepted_encodings(header)
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """Content-Length が minimum_size 以上のJSON・テキストの本文を br / gzip で圧縮する。
+
+    本文を一度に組み立てられるレスポンスだけを対象にし、ストリーミング（NDJSON / SSE）はそのまま流す。
+    圧縮した場合、ETagはエンコーディングごとにバイト列が異なるため弱いETag（W/）にする。
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 5, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compressors = {}
+        if brotli is not None:
+            self.compressors["br"] = functools.partial(brotli.compress, quality=brotli_quality)
+        self.compressors["gzip"] = functools.partial(gzip.compress, compresslevel=gzip_level, mtime=0)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"), self.compressors)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        chunks: list[bytes] = []
+
+        async def send_compressed(message: Message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                if self._should_compress(Headers(raw=message["headers"])):
+                    start = message
+                else:
+                    await send(message)
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = await self._compress(encoding, b"".join(chunks))
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _should_compress(self, headers: Headers) -> bool:
+        length = headers.get("content-length")
+        return (
+            "content-encoding" not in headers
+            and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            and length is not None
+            and int(length) >= self.minimum_size
+        )
+
+    async def _compress(self, encoding: str, body: bytes) -> bytes:
+        compress = self.compressors[encoding]
+        if len(body) >= THREAD_THRESHOLD:
+            return await anyio.to_thread.run_sync(compress, body)
+        return compress(body)
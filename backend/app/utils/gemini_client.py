@@ -1,14 +1,18 @@
-import os
 import logging
-import google.generativeai as genai
+from typing import AsyncIterator, Tuple
+from app.utils.ai_clients import ai_clients
+from app.utils.metrics import track_upstream, record_gemini_usage
+from app.utils.admission import admission, estimate_tokens
 
-# 環境変数からAPIキーを取得
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
+logger = logging.getLogger(__name__)
 
-async def get_recipes_from_gemini(ingredients, cooking_time="medium", difficulty="medium"):
+RECIPE_MODEL = "gemini-1.5-flash"
+# 流量制御で見積もるレシピ1件分の出力トークン数
+RECIPE_OUTPUT_TOKENS = 800
+
+def build_recipe_prompt(ingredients, cooking_time="medium", difficulty="medium") -> str:
     # 日本語でのプロンプトを設定
-    prompt = (
+    return (
         f"次の食材を使ってレシピを作成してください: {', '.join(ingredients)}。\n"
         f"調理時間は{cooking_time}、難易度は{difficulty}です。\n\n"
         "以下の形式で厳密に出力してください。各セクションは改行で区切り、箇条書きには必ず番号または'-'を使用してください：\n\n"
@@ -32,87 +36,151 @@ async def get_recipes_from_gemini(ingredients, cooking_time="medium", difficulty
         "- 余分な装飾（##など）は使用しないでください"
     )
 
-    # Gemini APIを使用してコンテンツを生成
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    response = model.generate_content(prompt)
-    
-    print(f"Received response: {response.text}")
-
-    # レスポンスのテキストを行ごとに分割
-    lines = [line.strip() for line in response.text.split('\n') if line.strip()]
-    
-    # 各セクションの内容を格納する辞書
-    recipe_data = {
-        'name': '',
-        'cooking_time': '',
-        'difficulty': '',
-        'ingredients': [],
-        'steps': [],
-        'tips': []
-    }
-    
-    current_section = None
-    
-    # レスポンスを解析
-    for line in lines:
+class RecipeStreamParser:
+    """Geminiのレシピ出力を行単位で逐次解析し、(イベント名, 値) を返す。
+
+    チャンクは行の途中で区切られることがあるため、改行までをバッファしてから解析する。
+    """
+
+    def __init__(self, cooking_time="medium", difficulty="medium"):
+        self.default_cooking_time = cooking_time
+        self.default_difficulty = difficulty
+        self.recipe_data = {
+            'name': '',
+            'cooking_time': '',
+            'difficulty': '',
+            'ingredients': [],
+            'steps': [],
+            'tips': []
+        }
+        self._current_section = None
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[Tuple[str, object]]:
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        events = []
+        for line in lines:
+            event = self._parse_line(line.strip())
+            if event:
+                events.append(event)
+        return events
+
+    def close(self) -> list[Tuple[str, object]]:
+        events = self.feed('\n')
+        return events + [("done", self.recipe())]
+
+    def _parse_line(self, line: str) -> Tuple[str, object] | None:
+        if not line:
+            return None
+
         # 基本情報の処理
-        if line.startswith('name:'):
-            recipe_data['name'] = line.replace('name:', '').strip()
-            continue
-            
-        if line.startswith('cooking_time:'):
-            recipe_data['cooking_time'] = line.replace('cooking_time:', '').strip()
-            continue
-            
-        if line.startswith('difficulty:'):
-            recipe_data['difficulty'] = line.replace('difficulty:', '').strip()
-            continue
-            
+        for key in ('name', 'cooking_time', 'difficulty'):
+            if line.startswith(f'{key}:'):
+                self.recipe_data[key] = line.replace(f'{key}:', '').strip()
+                return (key, self.recipe_data[key])
+
         # セクション開始の検出
-        if line == 'ingredients:':
-            current_section = 'ingredients'
-            continue
-        elif line == 'steps:':
-            current_section = 'steps'
-            continue
-        elif line == 'tips:':
-            current_section = 'tips'
-            continue
-            
+        if line in ('ingredients:', 'steps:', 'tips:'):
+            self._current_section = line[:-1]
+            return None
+
         # 各セクションの内容処理
-        if current_section:
-            if current_section == 'ingredients' and line.startswith('-'):
-                # 材料の処理
-                ingredient = line.replace('-', '').strip()
-                recipe_data['ingredients'].append(ingredient)
-                
-            elif current_section == 'steps' and line[0].isdigit():
-                # 手順の処理
-                step = line.split('.', 1)[1].strip() if '.' in line else line
-                recipe_data['steps'].append(step)
-                
-            elif current_section == 'tips' and line.startswith('-'):
-                # コツの処理
-                tip = line.replace('-', '').strip()
-                recipe_data['tips'].append(tip)
-
-    # デフォルト値の設定
-    if not recipe_data['cooking_time']:
-        recipe_data['cooking_time'] = cooking_time
-    if not recipe_data['difficulty']:
-        recipe_data['difficulty'] = difficulty
+        if self._current_section == 'ingredients' and line.startswith('-'):
+            # 材料の処理
+            ingredient = line.replace('-', '').strip()
+            self.recipe_data['ingredients'].append(ingredient)
+            return ("ingredient", ingredient)
+
+        if self._current_section == 'steps' and line[0].isdigit():
+            # 手順の処理
+            step = line.split('.', 1)[1].strip() if '.' in line else line
+            self.recipe_data['steps'].append(step)
+            return ("step", step)
+
+        if self._current_section == 'tips' and line.startswith('-'):
+            # コツの処理
+            tip = line.replace('-', '').strip()
+            self.recipe_data['tips'].append(tip)
+            return ("tip", tip)
+
+        return None
+
+    def recipe(self) -> dict:
+        # デフォルト値の設定
+        return {
+            "name": self.recipe_data['name'],
+            "cooking_time": self.recipe_data['cooking_time'] or self.default_cooking_time,
+            "difficulty": self.recipe_data['difficulty'] or self.default_difficulty,
+            "ingredients": list(self.recipe_data['ingredients']),
+            "steps": list(self.recipe_data['steps']),
+            "tips": list(self.recipe_data['tips'])
+        }
+
+def recipe_to_events(recipe: dict) -> list[Tuple[str, object]]:
+    """解析済みのレシピをストリーミング時と同じイベント列に変換する"""
+    events = [(key, recipe[key]) for key in ('name', 'cooking_time', 'difficulty') if recipe.get(key)]
+    events += [("ingredient", item) for item in recipe.get('ingredients', [])]
+    events += [("step", item) for item in recipe.get('steps', [])]
+    events += [("tip", item) for item in recipe.get('tips', [])]
+    return events + [("done", recipe)]
+
+def parse_recipe_text(text: str, cooking_time="medium", difficulty="medium") -> dict:
+    parser = RecipeStreamParser(cooking_time, difficulty)
+    parser.feed(text)
+    return parser.close()[-1][1]
+
+async def get_recipes_from_gemini(ingredients, cooking_time="medium", difficulty="medium"):
+    prompt = build_recipe_prompt(ingredients, cooking_time, difficulty)
+
+    # Gemini APIを使用してコンテンツを生成（非同期APIでイベントループをブロックしない）
+    model = ai_clients.model(RECIPE_MODEL)
+
+    async def generate():
+        with track_upstream(RECIPE_MODEL):
+            return await model.generate_content_async(prompt)
+
+    # 流量制御の枠を確保してから呼び出し、クォータ超過などは再試行する
+    response = await admission.call(RECIPE_MODEL, generate, tokens=estimate_tokens(prompt, output=RECIPE_OUTPUT_TOKENS))
+    record_gemini_usage(RECIPE_MODEL, response)
+
+    logger.debug("Received response: %s", response.text)
 
     # 最終的なレシピデータの作成
-    recipes = [{
-        "name": recipe_data['name'],
-        "cooking_time": recipe_data['cooking_time'],
-        "difficulty": recipe_data['difficulty'],
-        "ingredients": recipe_data['ingredients'],
-        "steps": recipe_data['steps'],
-        "tips": recipe_data['tips']
-    }]
-    
+    recipes = [parse_recipe_text(response.text, cooking_time, difficulty)]
+
     # レスポンスをログに出力
-    logging.info(f"Retrieved recipes: {recipes}")
-    
-    return recipes
\ No newline at end of file
+    logger.debug("Retrieved recipes: %s", recipes)
+
+    return recipes
+
+async def stream_recipe_events(ingredients, cooking_time="medium", difficulty="medium") -> AsyncIterator[Tuple[str, object]]:
+    """Geminiのストリーミング生成を使い、解析できた項目から順にイベントを返す"""
+    prompt = build_recipe_prompt(ingredients, cooking_time, difficulty)
+    model = ai_clients.model(RECIPE_MODEL)
+    tokens = estimate_tokens(prompt, output=RECIPE_OUTPUT_TOKENS)
+
+    attempt = 0
+    while True:
+        await admission.acquire(RECIPE_MODEL, tokens)
+        parser = RecipeStreamParser(cooking_time, difficulty)
+        emitted = False
+        try:
+            with track_upstream(RECIPE_MODEL):
+                response = await model.generate_content_async(prompt, stream=True)
+                async for chunk in response:
+                    for event in parser.feed(chunk.text):
+                        emitted = True
+                        yield event
+            break
+        except Exception as e:
+            # イベントを返し始めた後は、再試行すると内容が重複するため再試行しない
+            if emitted:
+                raise
+            await admission.on_error(RECIPE_MODEL, e, attempt)
+            attempt += 1
+    # ストリーミング時は全チャンクを受信した後に合計のトークン数が入る
+    record_gemini_usage(RECIPE_MODEL, response)
+
+    for event in parser.close():
+        yield event
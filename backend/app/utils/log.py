@@ -0,0 +1,78 @@
+import sys
+import json
+import queue
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from app.utils.settings import settings
+
+LOG_LEVEL = settings.log_level
+# DEBUGログ（リクエストごとのログや上流のレスポンスなど）を出力する割合
+LOG_DEBUG_SAMPLE_RATE = settings.log_debug_sample_rate
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+class SamplingFilter(logging.Filter):
+    """INFO以上はすべて通し、DEBUGは sample_rate の割合だけ通す"""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+
+class JsonFormatter(logging.Formatter):
+    """1行1件のJSONでログを出力する。extra={"fields": {...}} の内容もそのまま含める"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging():
+    """app.* のロガーをキュー経由の非同期出力に切り替える。
+
+    ログの書き込みはQueueListenerのスレッドで行うため、
+    イベントループがstdoutへの書き込みで止まらない。
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+
+    logger = logging.getLogger("app")
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream)
+    _listener.start()
+
+
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,233 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# レイテンシ用のバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"'
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    @property
+    def exposed_name(self) -> str:
+        """HELP / TYPE の行に使う名前（サンプルの名前と揃える）"""
+        return self.name
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    @property
+    def exposed_name(self) -> str:
+        # テキスト形式 0.0.4 では TYPE の行もサンプルと同じ _total 付きの名前にする
+        return f"{self.name}_total"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [(f"{self.name}_total", self._labels(key), value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [各バケットの件数..., 合計, 件数]
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        for key, entry in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, entry[-1]))
+            samples.append((f"{self.name}_sum", labels, entry[-2]))
+            samples.append((f"{self.name}_count", labels, entry[-1]))
+        return samples
+
+
+class Registry:
+    """メトリクスの登録先。render() でPrometheusのテキスト形式を返す"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Tuple[str, str, str, Callable[[], Iterable[Tuple[Dict[str, str], float]]]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        metric = Gauge(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets=buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, name: str, documentation: str, kind: str, func: Callable[[], Iterable[Tuple[Dict[str, str], float]]]):
+        """出力時に値を取得するメトリクス（キャッシュの統計など）を登録する"""
+        self._collectors.append((name, documentation, kind, func))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.exposed_name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.exposed_name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for name, documentation, kind, func in self._collectors:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in func():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# HTTPリクエスト
+http_requests = registry.counter("http_requests", "HTTPリクエスト数", ("method", "route", "status"))
+http_request_duration = registry.histogram("http_request_duration_seconds", "HTTPリクエストの処理時間", ("method", "route"))
+http_in_flight = registry.gauge("http_requests_in_flight", "処理中のHTTPリクエスト数")
+
+# 上流サービス（vision, gemini-1.5-pro, gemini-1.5-flash, postgrest, storage）
+upstream_requests = registry.counter("upstream_requests", "上流サービスの呼び出し回数", ("upstream", "outcome"))
+upstream_duration = registry.histogram("upstream_request_duration_seconds", "上流サービスの呼び出し時間", ("upstream",))
+gemini_tokens = registry.counter("gemini_tokens", "Geminiのトークン数", ("model", "kind"))
+upstream_retries = registry.counter("upstream_retries", "上流サービスの呼び出しの再試行回数", ("upstream",))
+
+# 上流のAI呼び出しの流量制御（reason: queue_full / timeout / retries_exhausted）
+admission_wait = registry.histogram("admission_wait_seconds", "上流の呼び出し枠を待った時間", ("upstream",))
+admission_rejected = registry.counter("admission_rejected", "上流の呼び出し枠を確保できずに返したリクエスト数", ("upstream", "reason"))
+
+# OCRテキストからの賞味期限の読み取り結果（skipped: Geminiを呼ばなかった / confident / unsure / none）
+ocr_local_date = registry.counter("ocr_local_date", "OCRテキストからの賞味期限の読み取り結果", ("outcome",))
+# OCRのGemini解析のモデルごとの結果（accepted / escalated / incomplete / deadline）と、ヘッジでどちらが勝ったか
+model_tier_results = registry.counter("model_tier_results", "モデルの段階ごとの解析結果", ("model", "outcome"))
+gemini_hedges = registry.counter("gemini_hedges", "ヘッジした呼び出しで先に成功した方", ("model", "winner"))
+# OCRテキストからのカテゴリの推定結果（confident / unsure）
+ocr_local_category = registry.counter("ocr_local_category", "OCRテキストからのカテゴリの推定結果", ("outcome",))
+
+# 処理パイプライン（OCRなど）のステージごとの所要時間
+pipeline_stage_duration = registry.histogram("pipeline_stage_duration_seconds", "パイプラインの各ステージの処理時間", ("pipeline", "stage"))
+
+
+@contextmanager
+def track_upstream(upstream: str):
+    """上流サービスの呼び出し時間と成否を記録する"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        upstream_duration.observe(time.perf_counter() - start, upstream=upstream)
+        upstream_requests.inc(upstream=upstream, outcome=outcome)
+
+
+def record_gemini_usage(model: str, response):
+    """Geminiのレスポンスに含まれるトークン数を記録する"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    gemini_tokens.inc(getattr(usage, "prompt_token_count", 0) or 0, model=model, kind="prompt")
+    gemini_tokens.inc(getattr(usage, "candidates_token_count", 0) or 0, model=model, kind="completion")
@@ -0,0 +1,250 @@
+# app/utils/settings.py
+
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, Tuple
+from dotenv import load_dotenv
+
+
+def _str(name: str, default: str | None = None) -> str | None:
+    return os.environ.get(name) or default
+
+
+def _int(name: str, default: int) -> int:
+    return int(os.environ.get(name) or default)
+
+
+def _optional_int(name: str) -> int | None:
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+def _float(name: str, default: float) -> float:
+    return float(os.environ.get(name) or default)
+
+
+def _flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    return default if not value else value == "1"
+
+
+def _limits(name: str, default: str) -> Dict[str, Dict[str, float]]:
+    """"gemini-1.5-pro=rpm:360,tpm:4000000;vision=rpm:1800" の形式を {上流: {"rpm": ..., "tpm": ...}} にする"""
+    limits = {}
+    for entry in filter(None, (os.environ.get(name) or default).split(";")):
+        upstream, _, values = entry.partition("=")
+        limits[upstream.strip()] = {
+            key.strip(): float(value)
+            for key, value in (item.split(":") for item in values.split(","))
+        }
+    return limits
+
+
+@dataclass(frozen=True)
+class Settings:
+    """アプリ全体の設定。環境変数（と.env）から一度だけ読み込む"""
+
+    # Supabase
+    supabase_url: str | None
+    supabase_service_key: str | None
+    supabase_pool_size: int
+    supabase_timeout: float
+    supabase_connect_timeout: float
+    supabase_keepalive_expiry: float
+    supabase_http2: bool
+
+    # キャッシュの保存先（memory: ワーカーごと / sqlite: cache_path のファイルをワーカー間で共有 / module:ClassName）
+    cache_backend: str | None
+    cache_path: str
+    # 共有キャッシュの読み書きを行うスレッド数と、SQLiteのロックを待つ上限（秒。超えた場合は読み込みをミス、書き込みを省略として扱う）
+    cache_threads: int
+    cache_busy_timeout: float
+
+    # 認証
+    jwt_secret: str | None
+    auth_cache_max_entries: int
+    auth_cache_ttl: float
+
+    # Google Cloud / Gemini
+    google_credentials_json: str | None
+    google_credentials_path: str | None
+    vision_api_endpoint: str | None
+    vision_api_insecure: bool
+    gemini_api_key: str | None
+    gemini_api_endpoint: str | None
+    gemini_api_insecure: bool
+    # "background": 起動後にバックグラウンドで読み込む / "startup": 起動時に読み込む / "off": 初回利用時に読み込む
+    ai_clients_preload: str
+    ai_clients_warmup: bool
+
+    # 上流のAI呼び出しの流量制御（1分あたりのリクエスト数・トークン数、待ち行列、再試行）
+    upstream_limits: Dict[str, Dict[str, float]]
+    admission_max_queue: int
+    admission_max_queue_per_user: int
+    admission_max_wait: float
+    admission_retries: int
+    admission_backoff_base: float
+    admission_backoff_max: float
+
+    # OCR
+    ocr_max_concurrency: int
+    ocr_max_queue: int
+    ocr_thread_pool_size: int | None
+    ocr_retry_after: int
+    ocr_batch_max_images: int
+    ocr_batch_gemini_concurrency: int
+    ocr_cache_max_entries: int
+    ocr_cache_ttl: float
+    ocr_cache_dir: str | None
+    ocr_cache_backend: str | None
+    ocr_cache_disk_max_entries: int
+    # OCRテキストから読み取った賞味期限をGeminiより優先する確信度の下限
+    ocr_local_date_min_confidence: float
+    # OCRテキストから推定したカテゴリを使う確信度の下限と、学習する商品名の上限
+    ocr_local_category_min_confidence: float
+    category_learned_max_entries: int
+    # 学習した商品名を他のユーザーの推定にも使うのに必要な、同じカテゴリで登録したユーザー数
+    category_shared_min_users: int
+    # OCRのGemini解析: 速い順に試すモデル、遅い呼び出しのヘッジ、リクエストあたりの時間の上限（秒）
+    ocr_model_tiers: Tuple[str, ...]
+    ocr_hedge: bool
+    ocr_hedge_quantile: float
+    ocr_hedge_min_samples: int
+    ocr_latency_budget: float
+
+    # 画像の前処理（最大辺px・JPEG品質）
+    ocr_image_max_edge: int
+    gemini_image_max_edge: int
+    stored_image_max_edge: int
+    ocr_jpeg_quality: int
+    stored_jpeg_quality: int
+    image_passthrough_max_bytes: int
+
+    # 食品
+    foods_default_limit: int
+    foods_max_limit: int
+    foods_bulk_max_items: int
+    foods_cache_backend: str | None
+    foods_cache_max_entries: int
+    foods_cache_ttl: float
+
+    # レシピ
+    recipe_cache_max_entries: int
+    recipe_cache_ttl: float
+    recipe_max_variants: int
+
+    # 通知
+    notification_hour: int
+    notification_tz: str
+    notification_sender: str | None
+    notification_tick_seconds: float
+    notification_batch_size: int
+    # 再起動時・送信失敗時に、通知時刻を過ぎた通知を送り直す上限（秒）
+    notification_lookback_seconds: float
+    notification_scheduler_enabled: bool
+    notification_settings_cache_max_entries: int
+    notification_settings_cache_ttl: float
+
+    # レスポンスの圧縮（この大きさ以上の本文だけ圧縮する。brotliはモジュールがある場合のみ）
+    compression_min_size: int
+    compression_gzip_level: int
+    compression_brotli_quality: int
+
+    # 監視・ログ
+    metrics_token: str | None
+    log_level: str
+    log_debug_sample_rate: float
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        # 開発環境では.envから読み込む（既に設定されている環境変数は上書きしない）
+        load_dotenv()
+        return cls(
+            supabase_url=_str("SUPABASE_URL"),
+            supabase_service_key=_str("SUPABASE_SERVICE_KEY"),
+            supabase_pool_size=_int("SUPABASE_POOL_SIZE", 20),
+            supabase_timeout=_float("SUPABASE_TIMEOUT", 10),
+            supabase_connect_timeout=_float("SUPABASE_CONNECT_TIMEOUT", 5),
+            supabase_keepalive_expiry=_float("SUPABASE_KEEPALIVE_EXPIRY", 60),
+            supabase_http2=_flag("SUPABASE_HTTP2", True),
+            cache_backend=_str("CACHE_BACKEND"),
+            cache_path=_str("CACHE_PATH", os.path.join(tempfile.gettempdir(), "app-cache.sqlite3")),
+            cache_threads=_int("CACHE_THREADS", 4),
+            cache_busy_timeout=_float("CACHE_BUSY_TIMEOUT", 0.1),
+            jwt_secret=_str("JWT_SECRET"),
+            auth_cache_max_entries=_int("AUTH_CACHE_MAX_ENTRIES", 4096),
+            auth_cache_ttl=_float("AUTH_CACHE_TTL", 300),
+            google_credentials_json=_str("GOOGLE_APPLICATION_CREDENTIALS_JSON"),
+            google_credentials_path=_str("GOOGLE_APPLICATION_CREDENTIALS"),
+            vision_api_endpoint=_str("VISION_API_ENDPOINT"),
+            vision_api_insecure=_flag("VISION_API_INSECURE", False),
+            gemini_api_key=_str("GEMINI_API_KEY"),
+            gemini_api_endpoint=_str("GEMINI_API_ENDPOINT"),
+            gemini_api_insecure=_flag("GEMINI_API_INSECURE", False),
+            ai_clients_preload=_str("AI_CLIENTS_PRELOAD", "background"),
+            ai_clients_warmup=_flag("AI_CLIENTS_WARMUP", True),
+            upstream_limits=_limits(
+                "UPSTREAM_LIMITS",
+                "gemini-1.5-pro=rpm:360,tpm:4000000;gemini-1.5-flash=rpm:1000,tpm:4000000;vision=rpm:1800",
+            ),
+            admission_max_queue=_int("ADMISSION_MAX_QUEUE", 32),
+            admission_max_queue_per_user=_int("ADMISSION_MAX_QUEUE_PER_USER", 8),
+            admission_max_wait=_float("ADMISSION_MAX_WAIT", 10),
+            admission_retries=_int("ADMISSION_RETRIES", 3),
+            admission_backoff_base=_float("ADMISSION_BACKOFF_BASE", 0.5),
+            admission_backoff_max=_float("ADMISSION_BACKOFF_MAX", 8),
+            ocr_max_concurrency=_int("OCR_MAX_CONCURRENCY", 4),
+            ocr_max_queue=_int("OCR_MAX_QUEUE", 16),
+            ocr_thread_pool_size=_optional_int("OCR_THREAD_POOL_SIZE"),
+            ocr_retry_after=_int("OCR_RETRY_AFTER", 5),
+            ocr_batch_max_images=_int("OCR_BATCH_MAX_IMAGES", 20),
+            ocr_batch_gemini_concurrency=_int("OCR_BATCH_GEMINI_CONCURRENCY", 4),
+            ocr_cache_max_entries=_int("OCR_CACHE_MAX_ENTRIES", 512),
+            ocr_cache_ttl=_float("OCR_CACHE_TTL", 7 * 24 * 3600),
+            ocr_cache_dir=_str("OCR_CACHE_DIR"),
+            ocr_cache_backend=_str("OCR_CACHE_BACKEND", _str("CACHE_BACKEND")),
+            ocr_cache_disk_max_entries=_int("OCR_CACHE_DISK_MAX_ENTRIES", 10000),
+            ocr_local_date_min_confidence=_float("OCR_LOCAL_DATE_MIN_CONFIDENCE", 0.85),
+            ocr_local_category_min_confidence=_float("OCR_LOCAL_CATEGORY_MIN_CONFIDENCE", 0.8),
+            category_learned_max_entries=_int("CATEGORY_LEARNED_MAX_ENTRIES", 10000),
+            category_shared_min_users=_int("CATEGORY_SHARED_MIN_USERS", 3),
+            ocr_model_tiers=tuple(m.strip() for m in _str("OCR_MODEL_TIERS", "gemini-1.5-flash,gemini-1.5-pro").split(",")),
+            ocr_hedge=_flag("OCR_HEDGE", True),
+            ocr_hedge_quantile=_float("OCR_HEDGE_QUANTILE", 0.95),
+            ocr_hedge_min_samples=_int("OCR_HEDGE_MIN_SAMPLES", 20),
+            ocr_latency_budget=_float("OCR_LATENCY_BUDGET", 20),
+            ocr_image_max_edge=_int("OCR_IMAGE_MAX_EDGE", 2048),
+            gemini_image_max_edge=_int("GEMINI_IMAGE_MAX_EDGE", 1024),
+            stored_image_max_edge=_int("STORED_IMAGE_MAX_EDGE", 1600),
+            ocr_jpeg_quality=_int("OCR_JPEG_QUALITY", 90),
+            stored_jpeg_quality=_int("STORED_JPEG_QUALITY", 82),
+            image_passthrough_max_bytes=_int("IMAGE_PASSTHROUGH_MAX_BYTES", 512 * 1024),
+            foods_default_limit=_int("FOODS_DEFAULT_LIMIT", 200),
+            foods_max_limit=_int("FOODS_MAX_LIMIT", 500),
+            foods_bulk_max_items=_int("FOODS_BULK_MAX_ITEMS", 500),
+            foods_cache_backend=_str("FOODS_CACHE_BACKEND", _str("CACHE_BACKEND")),
+            foods_cache_max_entries=_int("FOODS_CACHE_MAX_ENTRIES", 4096),
+            foods_cache_ttl=_float("FOODS_CACHE_TTL", 300),
+            recipe_cache_max_entries=_int("RECIPE_CACHE_MAX_ENTRIES", 1024),
+            recipe_cache_ttl=_float("RECIPE_CACHE_TTL", 24 * 3600),
+            recipe_max_variants=_int("RECIPE_MAX_VARIANTS", 3),
+            notification_hour=_int("NOTIFICATION_HOUR", 9),
+            notification_tz=_str("NOTIFICATION_TZ", "Asia/Tokyo"),
+            notification_sender=_str("NOTIFICATION_SENDER"),
+            notification_tick_seconds=_float("NOTIFICATION_TICK_SECONDS", 60),
+            notification_batch_size=_int("NOTIFICATION_BATCH_SIZE", 500),
+            notification_lookback_seconds=_float("NOTIFICATION_LOOKBACK_SECONDS", 6 * 3600),
+            notification_scheduler_enabled=_flag("NOTIFICATION_SCHEDULER_ENABLED", False),
+            notification_settings_cache_max_entries=_int("NOTIFICATION_SETTINGS_CACHE_MAX_ENTRIES", 10000),
+            notification_settings_cache_ttl=_float("NOTIFICATION_SETTINGS_CACHE_TTL", 600),
+            compression_min_size=_int("COMPRESSION_MIN_SIZE", 1024),
+            compression_gzip_level=_int("COMPRESSION_GZIP_LEVEL", 5),
+            compression_brotli_quality=_int("COMPRESSION_BROTLI_QUALITY", 4),
+            metrics_token=_str("METRICS_TOKEN"),
+            log_level=_str("LOG_LEVEL", "INFO").upper(),
+            log_debug_sample_rate=_float("LOG_DEBUG_SAMPLE_RATE", 0.01),
+        )
+
+
+settings = Settings.from_env()
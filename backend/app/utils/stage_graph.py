@@ -0,0 +1,59 @@
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, Tuple
+from app.utils.metrics import pipeline_stage_duration
+
+
+class StageGraph:
+    """依存関係のある非同期ステージを、依存先が完了したものから並行に実行する。
+
+    add() でステージを登録し、after に指定したステージの結果が引数として順に渡される。
+    いずれかのステージが失敗した場合は実行中の他のステージをキャンセルし、その例外を送出する。
+    各ステージの所要時間（依存先の完了から自身の完了まで）は timings に記録される。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._stages: Dict[str, Tuple[Callable[..., Awaitable[Any]], Tuple[str, ...]]] = {}
+        self.timings: Dict[str, float] = {}
+
+    def add(self, name: str, func: Callable[..., Awaitable[Any]], after: Iterable[str] = ()) -> "StageGraph":
+        after = tuple(after)
+        # 依存先は先に登録されている必要がある（循環を作れないようにする）
+        unknown = [dep for dep in after if dep not in self._stages]
+        if unknown:
+            raise ValueError(f"未登録のステージに依存しています: {', '.join(unknown)}")
+        self._stages[name] = (func, after)
+        return self
+
+    async def run(self) -> Dict[str, Any]:
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str, func: Callable[..., Awaitable[Any]], after: Tuple[str, ...]):
+            inputs = [await tasks[dep] for dep in after]
+            start = time.perf_counter()
+            result = await func(*inputs)
+            self.timings[name] = time.perf_counter() - start
+            pipeline_stage_duration.observe(self.timings[name], pipeline=self.name, stage=name)
+            return result
+
+        for name, (func, after) in self._stages.items():
+            tasks[name] = asyncio.ensure_future(run_stage(name, func, after))
+
+        try:
+            done, pending = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+            failed = next((task for task in done if not task.cancelled() and task.exception() is not None), None)
+            if failed is not None:
+                raise failed.exception()
+        finally:
+            # 失敗・キャンセル時は残りのステージを止め、例外を回収しておく
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        return {name: task.result() for name, task in tasks.items()}
+
+    @property
+    def timings_ms(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()}
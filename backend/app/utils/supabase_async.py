@@ -0,0 +1,128 @@
+# app/utils/supabase_async.py
+
+import time
+import httpx
+from postgrest import AsyncPostgrestClient, AsyncRequestBuilder
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from storage3 import AsyncStorageClient
+from app.utils.metrics import upstream_duration, upstream_requests
+from app.utils.settings import settings
+
+SUPABASE_POOL_SIZE = settings.supabase_pool_size
+SUPABASE_TIMEOUT = settings.supabase_timeout
+SUPABASE_CONNECT_TIMEOUT = settings.supabase_connect_timeout
+SUPABASE_KEEPALIVE_EXPIRY = settings.supabase_keepalive_expiry
+SUPABASE_HTTP2 = settings.supabase_http2
+
+
+class _InstrumentedTransport(httpx.AsyncBaseTransport):
+    """上流（postgrest / storage）ごとの呼び出し時間と成否をメトリクスに記録する"""
+
+    def __init__(self, upstream: str, transport: httpx.AsyncBaseTransport):
+        self.upstream = upstream
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self._transport.handle_async_request(request)
+            if response.status_code < 500:
+                outcome = "ok"
+            return response
+        finally:
+            upstream_duration.observe(time.perf_counter() - start, upstream=self.upstream)
+            upstream_requests.inc(upstream=self.upstream, outcome=outcome)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def _pooled_session(base_url: str, headers: dict, timeout, verify: bool = True, upstream: str = "postgrest") -> httpx.AsyncClient:
+    """キープアライブ付きのHTTP/2接続プールを持つhttpxクライアント"""
+    transport = httpx.AsyncHTTPTransport(
+        verify=verify,
+        http2=SUPABASE_HTTP2,
+        limits=httpx.Limits(
+            max_connections=SUPABASE_POOL_SIZE,
+            max_keepalive_connections=SUPABASE_POOL_SIZE,
+            keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+        ),
+    )
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT),
+        follow_redirects=True,
+        transport=_InstrumentedTransport(upstream, transport),
+    )
+
+
+class _PooledPostgrestClient(AsyncPostgrestClient):
+    def create_session(self, base_url, headers, timeout, verify=True):
+        return _pooled_session(base_url, headers, timeout, verify)
+
+
+class _PooledStorageClient(AsyncStorageClient):
+    def _create_session(self, base_url, headers, timeout, verify=True):
+        return _pooled_session(base_url, headers, timeout, verify, upstream="storage")
+
+
+class AsyncSupabase:
+    """PostgREST / Storage を非同期で呼び出すためのクライアント。
+
+    接続プールはFastAPIのlifespanで start() / close() する。
+    start() 前に使われた場合は初回アクセス時に作成する。
+    """
+
+    def __init__(self, url: str | None = None, key: str | None = None):
+        self.url = url
+        self.key = key
+        self._postgrest: AsyncPostgrestClient | None = None
+        self._storage: AsyncStorageClient | None = None
+
+    def _auth_headers(self) -> dict:
+        self.url = self.url or settings.supabase_url
+        self.key = self.key or settings.supabase_service_key
+        if not self.url or not self.key:
+            raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in the environment variables")
+        return {"apiKey": self.key, "Authorization": f"Bearer {self.key}"}
+
+    def start(self):
+        headers = self._auth_headers()
+        if self._postgrest is None:
+            self._postgrest = _PooledPostgrestClient(
+                f"{self.url}/rest/v1",
+                headers={**DEFAULT_POSTGREST_CLIENT_HEADERS, **headers},
+            )
+        if self._storage is None:
+            self._storage = _PooledStorageClient(f"{self.url}/storage/v1/", headers)
+
+    async def close(self):
+        if self._postgrest is not None:
+            await self._postgrest.aclose()
+            self._postgrest = None
+        if self._storage is not None:
+            await self._storage.aclose()
+            self._storage = None
+
+    @property
+    def postgrest(self) -> AsyncPostgrestClient:
+        if self._postgrest is None:
+            self.start()
+        return self._postgrest
+
+    @property
+    def storage(self) -> AsyncStorageClient:
+        if self._storage is None:
+            self.start()
+        return self._storage
+
+    def table(self, table_name: str) -> AsyncRequestBuilder:
+        return self.postgrest.from_(table_name)
+
+    def rpc(self, fn: str, params: dict):
+        return self.postgrest.rpc(fn, params)
+
+
+supabase_async = AsyncSupabase()
@@ -1,18 +1,25 @@
 # app/utils/supabase_client.py
 
-from supabase import create_client, Client
-import os
+import threading
+from typing import TYPE_CHECKING
+from app.utils.settings import settings
 
-# 開発環境用のload_dotenvを削除
+if TYPE_CHECKING:
+    from supabase import Client
 
-supabase_url: str = os.environ.get("SUPABASE_URL")
-supabase_service_key: str = os.environ.get("SUPABASE_SERVICE_KEY")
+_lock = threading.Lock()
+_client: "Client | None" = None
 
-print("環境変数の値:")
-print("SUPABASE_URL:", supabase_url)
-print("Supabase Service Key (first 10 chars):", supabase_service_key[:10] + "...")
 
-if not supabase_url or not supabase_service_key:
-    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in the environment variables")
+def get_supabase() -> "Client":
+    """同期版のSupabaseクライアント。初めて呼ばれたときに作成する（APIルートでは supabase_async を使う）"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                if not settings.supabase_url or not settings.supabase_service_key:
+                    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in the environment variables")
+                from supabase import create_client
 
-supabase: Client = create_client(supabase_url, supabase_service_key)
+                _client = create_client(settings.supabase_url, settings.supabase_service_key)
+    return _client
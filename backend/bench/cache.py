@@ -0,0 +1,54 @@
+"""キャッシュの保存先（CACHE_BACKEND）ごとに、ワーカー数を変えてヒット率とメモリを比較する。
+
+    python -m bench.cache                                # memory / sqlite × 1, 4, 8 ワーカー
+    python -m bench.cache --workers 1 --workers 4 -d 20 --backend sqlite
+
+組み合わせごとに bench.run を実行し、キャッシュが効くシナリオについて
+1リクエストあたりの上流（フェイク）の呼び出し回数、p50、ワーカーを含むRSSの合計を表示する。
+ワーカーごとのキャッシュではワーカー数に比例してミスが増えるため、上流の呼び出し回数で比較する。
+"""
+
+import sys
+import json
+import argparse
+import tempfile
+from pathlib import Path
+
+from bench import run
+
+DEFAULT_SCENARIOS = ["foods_list", "foods_summary", "notifications_get", "recipes"]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="キャッシュの保存先とワーカー数の比較")
+    parser.add_argument("--backend", action="append", help="比較する CACHE_BACKEND（既定は memory と sqlite）")
+    parser.add_argument("--workers", type=int, action="append", help="ワーカー数（既定は 1, 4, 8）")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(run.SCENARIOS))
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-d", "--duration", type=float, default=10)
+    args = parser.parse_args(argv)
+
+    output_dir = Path(tempfile.mkdtemp(prefix="bench-cache-"))
+    scenarios = args.scenario or DEFAULT_SCENARIOS
+    rows = []
+    for backend in args.backend or ["memory", "sqlite"]:
+        for workers in args.workers or [1, 4, 8]:
+            output = output_dir / f"{backend}-{workers}.json"
+            run_args = ["--workers", str(workers), "--cache-backend", backend, "-c", str(args.concurrency), "-d", str(args.duration), "--output", str(output)]
+            for scenario in scenarios:
+                run_args += ["-s", scenario]
+            run.main(run_args)
+            report = json.loads(output.read_text())
+            for name, result in report["results"].items():
+                rows.append((backend, workers, name, result))
+
+    print()
+    print(f"{'backend':<10}{'workers':>8}  {'scenario':<20}{'upstream/req':>13}{'p50':>9}{'rss MB':>9}")
+    print("-" * 69)
+    for backend, workers, name, result in rows:
+        print(f"{backend:<10}{workers:>8}  {name:<20}{result['upstream_per_request']:>13}{result['p50_ms']:>9}{str(result['rss_max_mb']):>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""OCRテキストからのカテゴリ推定（app/services/category_classifier.py）の精度と速度を、ラベル付きコーパスで計測する。
+
+    python -m bench.category             # 精度・Geminiを省略できる割合・1件あたりの処理時間を表示する
+    python -m bench.category -v          # 誤りと確信度の低いものも表示する
+
+コーパス（bench/category_corpus.jsonl）は1行1件で、{"text": OCRテキスト, "name": 登録される商品名, "expected": カテゴリ}。
+学習前と、各商品をユーザーが一度登録した（learn() した）後に、そのユーザーと別のユーザーで計測する。
+確信度が閾値以上のもののうち、正解の割合（precision）が --min-precision を下回るか、
+あるユーザーの登録がシードのキーワードや別のユーザーの結果（商品名）に影響した場合は終了コード1で終わる。
+"""
+
+import sys
+import json
+import time
+import argparse
+
+from app.services.category_classifier import CategoryClassifier
+from app.utils.settings import settings
+from bench.run import BENCH_DIR
+
+DEFAULT_CORPUS = BENCH_DIR / "category_corpus.jsonl"
+
+
+def evaluate(classifier: CategoryClassifier, corpus: list, threshold: float, verbose: bool, user_id: str | None = None) -> dict:
+    correct = confident = confident_correct = named = 0
+    for case in corpus:
+        result = classifier.classify(case["text"], user_id)
+        is_confident = result.confidence >= threshold
+        correct += result.category == case["expected"]
+        confident += is_confident
+        confident_correct += is_confident and result.category == case["expected"]
+        named += is_confident and result.name is not None
+
+        if verbose and (result.category != case["expected"] or not is_confident):
+            mark = "NG " if result.category != case["expected"] else "low"
+            print(f"{mark} {result.confidence:>5.2f} {result.category:<6} expected={case['expected']:<6} {case['text']!r}")
+
+    # 長めのテキストで1件あたりの処理時間を計る
+    text = "\n".join(case["text"] for case in corpus[:5])
+    repeat = 2000
+    start = time.perf_counter()
+    for _ in range(repeat):
+        classifier.classify(text, user_id)
+    elapsed_us = (time.perf_counter() - start) / repeat * 1e6
+
+    total = len(corpus)
+    return {
+        "accuracy": correct / total,
+        "coverage": confident / total,
+        "precision": confident_correct / confident if confident else 1.0,
+        "named": named / total,
+        "us_per_text": elapsed_us,
+        "text_length": len(text),
+    }
+
+
+def report(label: str, result: dict, threshold: float):
+    print(f"[{label}]")
+    print(f"  accuracy:            {result['accuracy']:.1%}  (確信度によらず最もスコアの高いカテゴリ)")
+    print(f"  confident coverage:  {result['coverage']:.1%}  (確信度 >= {threshold})")
+    print(f"  confident precision: {result['precision']:.1%}")
+    print(f"  with known name:     {result['named']:.1%}  (商品名も分かり、賞味期限が読めればGeminiを省略できる)")
+    print(f"  classify:            {result['us_per_text']:.0f} us / {result['text_length']} 文字")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="カテゴリ推定の精度の計測")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS))
+    parser.add_argument("--threshold", type=float, default=settings.ocr_local_category_min_confidence, help="推定結果を使う確信度の下限")
+    parser.add_argument("--min-precision", type=float, default=0.95)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    classifier = CategoryClassifier()
+    cold = evaluate(classifier, corpus, args.threshold, args.verbose)
+    report("学習前", cold, args.threshold)
+
+    for case in corpus:
+        classifier.learn("bench-user", case["name"], case["expected"])
+    learned = evaluate(classifier, corpus, args.threshold, args.verbose, "bench-user")
+    report("登録後", learned, args.threshold)
+    other = evaluate(classifier, corpus, args.threshold, args.verbose, "other-user")
+    report("登録後（別のユーザー）", other, args.threshold)
+
+    results = (("学習前", cold), ("登録後", learned), ("登録後（別のユーザー）", other))
+    failures = [f"{label}: confident precision < {args.min_precision:.1%}" for label, result in results if result["precision"] < args.min_precision]
+    if other["named"]:
+        failures.append("別のユーザーに登録した商品名が返されました")
+    failures += isolation_failures()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+def isolation_failures() -> list:
+    """1人のユーザーの登録（誤りや個人的な表記を含む）が、他のユーザーの推定を変えないことを確認する"""
+    classifier = CategoryClassifier(min_shared_users=3)
+    milk = "種類別 牛乳 成分無調整"
+    yogurt = "ヨーグルト 賞味期限 24.11.02"
+    before = classifier.classify(milk).category, classifier.classify(yogurt).category
+    for _ in range(3):
+        classifier.learn("user-a", "牛乳", "肉類")
+        classifier.learn("user-a", "賞味期限", "肉類")
+
+    failures = []
+    for user_id in (None, "user-b"):
+        after = classifier.classify(milk, user_id), classifier.classify(yogurt, user_id)
+        if (after[0].category, after[1].category) != before:
+            failures.append(f"user-a の登録で {user_id or '未ログイン'} のカテゴリが変わりました")
+        if any(result.name for result in after):
+            failures.append(f"user-a の商品名が {user_id or '未ログイン'} に返されました")
+
+    # 別々のユーザーが同じカテゴリで登録した商品名は、重みだけを共有する
+    for user_id in ("user-b", "user-c", "user-d"):
+        classifier.learn(user_id, "特選ミルクプリン", "その他")
+    shared = classifier.classify("特選ミルクプリン 要冷蔵", "user-e")
+    if shared.category != "その他" or shared.name is not None:
+        failures.append(f"複数のユーザーが登録した商品名の共有が期待と異なります: {shared}")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(main())
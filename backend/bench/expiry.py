@@ -0,0 +1,63 @@
+"""OCRテキストからの賞味期限の読み取り（app/services/expiry_parser.py）の精度を、ラベル付きコーパスで計測する。
+
+    python -m bench.expiry               # 精度とGeminiを省略できる割合を表示する
+    python -m bench.expiry -v            # 誤りと確信度の低いものも表示する
+
+コーパス（bench/expiry_corpus.jsonl）は1行1件で、{"text": OCRテキスト, "expected": "YYYY-MM-DD" または null}。
+確信度が閾値以上のもののうち、正解の割合（precision）が --min-precision を下回ると終了コード1で終わる。
+"""
+
+import sys
+import json
+import argparse
+from datetime import date
+
+from app.services.expiry_parser import extract_expiration_date
+from app.utils.settings import settings
+from bench.run import BENCH_DIR
+
+DEFAULT_CORPUS = BENCH_DIR / "expiry_corpus.jsonl"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="賞味期限の読み取り精度の計測")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS))
+    parser.add_argument("--threshold", type=float, default=settings.ocr_local_date_min_confidence, help="Geminiを省略する確信度の下限")
+    # コーパスの日付が「現実的な範囲」に入るよう、基準日を固定する
+    parser.add_argument("--today", type=date.fromisoformat, default=date(2024, 6, 1))
+    parser.add_argument("--min-precision", type=float, default=0.98)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    correct = confident = confident_correct = 0
+    for case in corpus:
+        result = extract_expiration_date(case["text"], today=args.today)
+        answer = result.isoformat() if result else None
+        is_confident = result is not None and result.confidence >= args.threshold
+        correct += answer == case["expected"]
+        confident += is_confident
+        confident_correct += is_confident and answer == case["expected"]
+
+        if args.verbose and (answer != case["expected"] or not is_confident):
+            mark = "NG " if answer != case["expected"] else "low"
+            confidence = f"{result.confidence:.2f}" if result else "-"
+            print(f"{mark} {confidence:>5} {str(answer):<11} expected={case['expected']}  {case['text']!r}")
+
+    total = len(corpus)
+    precision = confident_correct / confident if confident else 1.0
+    print(f"cases:              {total}")
+    print(f"accuracy:           {correct / total:.1%}  (確信度によらず最も確からしい候補)")
+    print(f"gemini skip rate:   {confident / total:.1%}  (確信度 >= {args.threshold})")
+    print(f"confident precision:{precision:>7.1%}")
+
+    if precision < args.min_precision:
+        print(f"FAIL confident precision {precision:.1%} < {args.min_precision:.1%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
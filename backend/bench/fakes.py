@@ -0,0 +1,457 @@
+"""ベンチマーク用のローカルフェイクサーバー。
+
+- PostgREST / Storage（HTTP, uvicorn）: インメモリのテーブルでクエリを処理する
+- Vision（gRPC, 非TLS）: BatchAnnotateImages に固定のテキスト検出結果を返す
+- Gemini（gRPC, 非TLS）: GenerateContent / StreamGenerateContent に固定のテキストを返す
+
+各サーバーは遅延（latency + jitter）とエラーの発生率を個別に設定できる。
+上流ごとの呼び出し回数は GET /__stats で返す（キャッシュのヒット率の計測用）。
+
+    python -m bench.fakes --supabase-port 54321 --vision-port 50051 --gemini-port 50052
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from collections import Counter
+from concurrent import futures
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+
+import grpc
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from google.cloud import vision_v1
+from google.ai import generativelanguage as glm
+
+# OCR・レシピの固定レスポンス
+FAKE_OCR_TEXT = "明治ブルガリアヨーグルト\n賞味期限 2030.11.05\n要冷蔵"
+FAKE_OCR_ANSWER = "商品名: 明治ブルガリアヨーグルト\n賞味期限:2030-11-05\nカテゴリ: 乳製品\n"
+FAKE_RECIPE = (
+    "name: 野菜たっぷりオムレツ\n"
+    "cooking_time: 15分\n"
+    "difficulty: 初級\n"
+    "ingredients:\n"
+    "- 卵 2個\n"
+    "- 玉ねぎ 1/4個\n"
+    "- ピーマン 1個\n"
+    "steps:\n"
+    "1. 野菜をみじん切りにする\n"
+    "2. 卵を溶きほぐし、野菜を加える\n"
+    "3. フライパンで焼き、形を整える\n"
+    "tips:\n"
+    "- 弱火でじっくり焼くとふんわり仕上がります\n"
+    "- チーズを加えてもおいしいです\n"
+)
+CATEGORIES = ["野菜", "果物", "乳製品", "肉類", "魚介類", "穀物", "調味料", "飲料", "冷凍食品", "卵", "その他"]
+
+# 上流ごとの呼び出し回数（"GET foods", "rpc food_summary", "gemini" など）
+UPSTREAM_CALLS: Counter = Counter()
+
+
+@dataclass
+class Fault:
+    """遅延とエラーの注入設定。
+
+    throttle_period_s ごとに、最初の throttle_for_s 秒間はクォータ超過（429 / RESOURCE_EXHAUSTED）を返す。
+    stall_rate の割合の呼び出しは latency_ms の10倍かかる（テールレイテンシ）。
+    """
+    latency_ms: float = 0
+    jitter_ms: float = 0
+    error_rate: float = 0
+    throttle_period_s: float = 0
+    throttle_for_s: float = 0
+    stall_rate: float = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def delay(self) -> float:
+        latency = self.latency_ms * 10 if self.stall_rate > 0 and random.random() < self.stall_rate else self.latency_ms
+        return max(0.0, latency + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+    def throttled(self) -> bool:
+        if not self.throttle_period_s:
+            return False
+        return (time.monotonic() - self.started) % self.throttle_period_s < self.throttle_for_s
+
+
+# ---------------------------------------------------------------------------
+# PostgREST / Storage
+# ---------------------------------------------------------------------------
+
+def seed_foods(user_ids, foods_per_user: int) -> list:
+    today = date.today()
+    rows = []
+    for user_id in user_ids:
+        for i in range(foods_per_user):
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "name": f"食品{i:04d}",
+                "expiration_date": (today + timedelta(days=random.randint(-10, 60))).isoformat(),
+                "category": random.choice(CATEGORIES),
+                "image_url": None,
+            })
+    return rows
+
+
+def _split_top_level(text: str) -> list:
+    """カンマ区切りを括弧の入れ子を考慮して分割する"""
+    parts, depth, current = [], 0, ""
+    for ch in text:
+        if ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        depth += ch == "("
+        depth -= ch == ")"
+        current += ch
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _like_pattern(operand: str) -> str:
+    """LIKEのパターン（* と % は任意の文字列、_ は1文字、\\ でエスケープ）を正規表現に変換する"""
+    pattern, chars = "", iter(operand)
+    for ch in chars:
+        if ch == "\\":
+            pattern += re.escape(next(chars, ""))
+        elif ch in "*%":
+            pattern += ".*"
+        elif ch == "_":
+            pattern += "."
+        else:
+            pattern += re.escape(ch)
+    return pattern
+
+
+def _compare(value, op: str, operand: str) -> bool:
+    if op == "is":
+        return value is None if operand == "null" else str(value).lower() == operand
+    if value is None:
+        return False
+    value = str(value)
+    if op == "eq":
+        return value == operand
+    if op == "neq":
+        return value != operand
+    if op == "gt":
+        return value > operand
+    if op == "gte":
+        return value >= operand
+    if op == "lt":
+        return value < operand
+    if op == "lte":
+        return value <= operand
+    if op == "in":
+        return value in [v.strip('"') for v in operand.strip("()").split(",")]
+    if op in ("like", "ilike"):
+        return re.fullmatch(_like_pattern(operand), value, re.IGNORECASE if op == "ilike" else 0) is not None
+    raise ValueError(f"unsupported operator: {op}")
+
+
+def _logic(expr: str):
+    """or=(...) / and(...) の条件式を述語に変換する"""
+    match = re.fullmatch(r"(and|or)\((.*)\)", expr)
+    if match:
+        children = [_logic(part) for part in _split_top_level(match.group(2))]
+        combine = all if match.group(1) == "and" else any
+        return lambda row: combine(child(row) for child in children)
+    column, op, operand = expr.split(".", 2)
+    return lambda row: _compare(row.get(column), op, operand)
+
+
+def _filters(request: Request) -> list:
+    predicates = []
+    for key, value in request.query_params.multi_items():
+        if key in ("select", "order", "limit", "offset", "on_conflict", "columns"):
+            continue
+        if key in ("or", "and"):
+            predicates.append(_logic(f"{key}{value}"))
+            continue
+        op, _, operand = value.partition(".")
+        negate = op == "not"
+        if negate:
+            op, _, operand = operand.partition(".")
+        predicate = (lambda column, op, operand: lambda row: _compare(row.get(column), op, operand))(key, op, operand)
+        predicates.append((lambda p: lambda row: not p(row))(predicate) if negate else predicate)
+    return predicates
+
+
+def _project(rows: list, select: str | None) -> list:
+    if not select or select == "*":
+        return [dict(row) for row in rows]
+    columns = [c.strip() for c in select.split(",")]
+    return [{c: row.get(c) for c in columns} for row in rows]
+
+
+def food_summary(rows: list, target_user_id: str, today: str, soon_days: int = 7, top_k: int = 5) -> dict:
+    """supabase/migrations の food_summary RPC と同じ集計"""
+    soon = (date.fromisoformat(today) + timedelta(days=soon_days)).isoformat()
+    categories: dict = {}
+    upcoming = []
+    for row in rows:
+        if row["user_id"] != target_user_id:
+            continue
+        expiration_date = row["expiration_date"]
+        bucket = "expired" if expiration_date < today else "today" if expiration_date == today else "this_week" if expiration_date <= soon else "later"
+        counts = categories.setdefault(row["category"], {"category": row["category"], "expired": 0, "today": 0, "this_week": 0, "later": 0, "total": 0})
+        counts[bucket] += 1
+        counts["total"] += 1
+        if expiration_date >= today:
+            upcoming.append(row)
+    upcoming.sort(key=lambda row: (row["expiration_date"], row["id"]))
+    columns = ("id", "name", "expiration_date", "category", "image_url")
+    return {
+        "categories": [categories[c] for c in sorted(categories, key=lambda c: (c is None, c or ""))],
+        "expiring_soon": [{c: row.get(c) for c in columns} for row in upcoming[:top_k]],
+    }
+
+
+class FakeSupabase:
+    """PostgREST / Storage のうち、このアプリが使うAPIだけを実装したフェイク"""
+
+    def __init__(self, fault: Fault, storage_fault: Fault | None = None):
+        self.fault = fault
+        self.storage_fault = storage_fault or fault
+        self.tables: dict[str, list] = {"foods": [], "notification_settings": []}
+        self.objects: dict[str, bytes] = {}
+        self.app = Starlette(routes=[
+            Route("/rest/v1/rpc/{fn}", self.rpc, methods=["POST"]),
+            Route("/rest/v1/{table}", self.table, methods=["GET", "POST", "PATCH", "DELETE"]),
+            Route("/storage/v1/object/{path:path}", self.storage, methods=["POST", "PUT", "GET", "DELETE"]),
+            Route("/__seed", self.seed, methods=["POST"]),
+            Route("/__stats", self.upstream_stats, methods=["GET"]),
+        ])
+
+    async def _inject(self, fault: Fault) -> Response | None:
+        if fault.throttled():
+            return JSONResponse({"message": "rate limit exceeded", "code": "FAKE"}, status_code=429)
+        await asyncio.sleep(fault.delay())
+        if fault.should_fail():
+            return JSONResponse({"message": "injected failure", "code": "FAKE"}, status_code=503)
+        return None
+
+    async def seed(self, request: Request):
+        body = await request.json()
+        rows = seed_foods(body["user_ids"], body.get("foods_per_user", 100))
+        self.tables["foods"] = rows
+        return JSONResponse({"foods": len(rows)})
+
+    async def upstream_stats(self, request: Request):
+        return JSONResponse(dict(UPSTREAM_CALLS))
+
+    async def rpc(self, request: Request):
+        UPSTREAM_CALLS[f"rpc {request.path_params['fn']}"] += 1
+        if (failure := await self._inject(self.fault)) is not None:
+            return failure
+        if request.path_params["fn"] == "food_summary":
+            return JSONResponse(food_summary(self.tables["foods"], **await request.json()))
+        return JSONResponse([])
+
+    async def table(self, request: Request):
+        UPSTREAM_CALLS[f"{request.method} {request.path_params['table']}"] += 1
+        if (failure := await self._inject(self.fault)) is not None:
+            return failure
+        rows = self.tables.setdefault(request.path_params["table"], [])
+        prefer = request.headers.get("prefer", "")
+
+        if request.method == "POST":
+            body = await request.json()
+            items = body if isinstance(body, list) else [body]
+            conflict = request.query_params.get("on_conflict")
+            result = []
+            for item in items:
+                existing = None
+                if conflict:
+                    existing = next((row for row in rows if all(str(row.get(c)) == str(item.get(c)) for c in conflict.split(","))), None)
+                if existing is not None:
+                    existing.update(item)
+                    result.append(existing)
+                else:
+                    # 列のデフォルト値（id, created_at）を補う
+                    row = {"id": str(uuid.uuid4()), "created_at": datetime.now(timezone.utc).isoformat(), **item}
+                    rows.append(row)
+                    result.append(row)
+            return JSONResponse(_project(result, request.query_params.get("select")), status_code=201)
+
+        predicates = _filters(request)
+        matched = [row for row in rows if all(p(row) for p in predicates)]
+
+        if request.method == "PATCH":
+            body = await request.json()
+            for row in matched:
+                row.update(body)
+            return JSONResponse(_project(matched, request.query_params.get("select")))
+
+        if request.method == "DELETE":
+            self.tables[request.path_params["table"]] = [row for row in rows if row not in matched]
+            return JSONResponse(_project(matched, request.query_params.get("select")))
+
+        for clause in reversed((request.query_params.get("order") or "").split(",")):
+            if clause:
+                column, _, direction = clause.partition(".")
+                matched.sort(key=lambda row: (row.get(column) is None, str(row.get(column))), reverse=direction.startswith("desc"))
+        total = len(matched)
+        offset = int(request.query_params.get("offset", 0))
+        limit = request.query_params.get("limit")
+        page = matched[offset:offset + int(limit) if limit else None]
+        headers = {}
+        if "count=exact" in prefer:
+            headers["Content-Range"] = f"{offset}-{offset + len(page) - 1}/{total}"
+        return JSONResponse(_project(page, request.query_params.get("select")), headers=headers)
+
+    async def storage(self, request: Request):
+        path = request.path_params["path"]
+        if request.method == "GET":
+            data = self.objects.get(path.removeprefix("public/"))
+            return Response(data, media_type="image/jpeg") if data is not None else JSONResponse({"message": "not found"}, status_code=404)
+        if (failure := await self._inject(self.storage_fault)) is not None:
+            return failure
+        if request.method == "DELETE":
+            # remove: DELETE /object/{bucket} に {"prefixes": [...]}
+            removed = [name for name in (await request.json())["prefixes"] if self.objects.pop(f"{path}/{name}", None) is not None]
+            return JSONResponse([{"name": name} for name in removed])
+        self.objects[path] = await request.body()
+        return JSONResponse({"Key": path})
+
+
+# ---------------------------------------------------------------------------
+# Vision / Gemini（gRPC）
+# ---------------------------------------------------------------------------
+
+def _grpc_inject(fault: Fault, context):
+    if fault.throttled():
+        context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "quota exceeded")
+    time.sleep(fault.delay())
+    if fault.should_fail():
+        context.abort(grpc.StatusCode.UNAVAILABLE, "injected failure")
+
+
+def vision_handler(fault: Fault) -> grpc.GenericRpcHandler:
+    def batch_annotate_images(request, context):
+        UPSTREAM_CALLS["vision"] += 1
+        _grpc_inject(fault, context)
+        annotation = vision_v1.EntityAnnotation(description=FAKE_OCR_TEXT, locale="ja")
+        responses = [vision_v1.AnnotateImageResponse(text_annotations=[annotation]) for _ in request.requests]
+        return vision_v1.BatchAnnotateImagesResponse(responses=responses)
+
+    return grpc.method_handlers_generic_handler("google.cloud.vision.v1.ImageAnnotator", {
+        "BatchAnnotateImages": grpc.unary_unary_rpc_method_handler(
+            batch_annotate_images,
+            request_deserializer=vision_v1.BatchAnnotateImagesRequest.deserialize,
+            response_serializer=vision_v1.BatchAnnotateImagesResponse.serialize,
+        ),
+    })
+
+
+def _gemini_text(request) -> str:
+    prompt = "".join(part.text for content in request.contents for part in content.parts)
+    return FAKE_OCR_ANSWER if "商品名" in prompt else FAKE_RECIPE
+
+
+def _gemini_response(text: str, prompt_tokens: int, candidate_tokens: int):
+    return glm.GenerateContentResponse(
+        candidates=[glm.Candidate(
+            content=glm.Content(role="model", parts=[glm.Part(text=text)]),
+            finish_reason=glm.Candidate.FinishReason.STOP,
+            index=0,
+        )],
+        usage_metadata=glm.GenerateContentResponse.UsageMetadata(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=candidate_tokens,
+            total_token_count=prompt_tokens + candidate_tokens,
+        ),
+    )
+
+
+def gemini_handler(fault: Fault, chunk_size: int = 40) -> grpc.GenericRpcHandler:
+    def generate_content(request, context):
+        UPSTREAM_CALLS["gemini"] += 1
+        _grpc_inject(fault, context)
+        text = _gemini_text(request)
+        return _gemini_response(text, 300, len(text))
+
+    def stream_generate_content(request, context):
+        UPSTREAM_CALLS["gemini"] += 1
+        text = _gemini_text(request)
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        if fault.throttled():
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "quota exceeded")
+        # 遅延は最初のチャンクまでと、残りのチャンクに分けて発生させる
+        first_delay = fault.delay()
+        time.sleep(first_delay / 2)
+        if fault.should_fail():
+            context.abort(grpc.StatusCode.UNAVAILABLE, "injected failure")
+        for index, chunk in enumerate(chunks):
+            if index:
+                time.sleep(first_delay / 2 / max(1, len(chunks) - 1))
+            last = index == len(chunks) - 1
+            yield _gemini_response(chunk, 300 if last else 0, len(text) if last else 0)
+
+    return grpc.method_handlers_generic_handler("google.ai.generativelanguage.v1beta.GenerativeService", {
+        "GenerateContent": grpc.unary_unary_rpc_method_handler(
+            generate_content,
+            request_deserializer=glm.GenerateContentRequest.deserialize,
+            response_serializer=glm.GenerateContentResponse.serialize,
+        ),
+        "StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+            stream_generate_content,
+            request_deserializer=glm.GenerateContentRequest.deserialize,
+            response_serializer=glm.GenerateContentResponse.serialize,
+        ),
+    })
+
+
+def serve_grpc(handler: grpc.GenericRpcHandler, port: int, workers: int = 64) -> grpc.Server:
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=workers),
+        options=[("grpc.max_receive_message_length", 32 * 1024 * 1024)],
+    )
+    server.add_generic_rpc_handlers((handler,))
+    server.add_insecure_port(f"127.0.0.1:{port}")
+    server.start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Supabase / Vision / Gemini のローカルフェイクを起動する")
+    parser.add_argument("--supabase-port", type=int, default=54321)
+    parser.add_argument("--vision-port", type=int, default=50051)
+    parser.add_argument("--gemini-port", type=int, default=50052)
+    for name, latency in (("supabase", 15), ("storage", 40), ("vision", 250), ("gemini", 1200)):
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=latency)
+        parser.add_argument(f"--{name}-jitter-ms", type=float, default=latency / 5)
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0)
+        parser.add_argument(f"--{name}-throttle-period-s", type=float, default=0.0)
+        parser.add_argument(f"--{name}-throttle-for-s", type=float, default=0.0)
+        parser.add_argument(f"--{name}-stall-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    def fault(name: str) -> Fault:
+        options = ("latency_ms", "jitter_ms", "error_rate", "throttle_period_s", "throttle_for_s", "stall_rate")
+        return Fault(*(getattr(args, f"{name}_{option}") for option in options))
+
+    vision_server = serve_grpc(vision_handler(fault("vision")), args.vision_port)
+    gemini_server = serve_grpc(gemini_handler(fault("gemini")), args.gemini_port)
+    supabase = FakeSupabase(fault("supabase"), fault("storage"))
+    print(json.dumps({"supabase": args.supabase_port, "vision": args.vision_port, "gemini": args.gemini_port}), flush=True)
+    try:
+        uvicorn.run(supabase.app, host="127.0.0.1", port=args.supabase_port, log_level="warning")
+    finally:
+        vision_server.stop(grace=None)
+        gemini_server.stop(grace=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""画像の前処理（app/services/image_preprocess.py）の処理時間と、上流に送る・保存する画像の大きさを、
+以前の処理（元画像をそのままVisionに送り、フル解像度の画像をGeminiに渡し、既定の品質でJPEGに再エンコードして保存）と比較する。
+
+    python -m bench.preprocess                      # 合成した画像（スマートフォンの写真相当・PNG・小さいJPEG）
+    python -m bench.preprocess --corpus ~/photos    # ディレクトリ内の画像（jpg / jpeg / png / webp）
+
+画像ごとに、以前の処理と preprocess_image のCPU時間（--repeat 回の中央値。他のプロセスの負荷の影響を受けにくい）、
+Vision・Geminiに送るバイト数と保存するバイト数を出力し、最後に合計を出力する。
+Geminiに送る分は、SDKが画像を送信用にエンコードする処理（pil_to_blob）もCPU時間に含める。
+以前の処理で失敗する画像（RGBAのPNGなど）は "error" と表示する。
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from pathlib import Path
+
+from PIL import Image
+from google.generativeai.types.content_types import pil_to_blob
+
+from app.services.image_preprocess import preprocess_image
+
+EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def _photo(width: int, height: int, quality: int, orientation: int = 1) -> bytes:
+    """ノイズの多い写真相当のJPEG（細かい模様は圧縮しにくく、実際の写真に近い大きさになる）"""
+    noise = Image.frombytes("L", (width // 4, height // 4), os.urandom(width * height // 16)).resize((width, height))
+    base = Image.new("RGB", (width, height), tuple(random.randrange(256) for _ in range(3)))
+    img = Image.merge("RGB", [Image.blend(channel, noise, 0.5) for channel in base.split()])
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=quality, exif=exif)
+    return buffer.getvalue()
+
+
+def _screenshot(width: int, height: int) -> bytes:
+    img = Image.new("RGBA", (width, height), (255, 255, 255, 0))
+    img.paste((30, 30, 30, 255), (width // 8, height // 3, width * 7 // 8, height // 3 + height // 10))
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def synthetic_corpus() -> list:
+    random.seed(0)
+    return [
+        ("photo 4032x3024 q95", _photo(4032, 3024, 95)),
+        ("photo 4032x3024 q85 rotated", _photo(4032, 3024, 85, orientation=6)),
+        ("photo 3264x2448 q90", _photo(3264, 2448, 90)),
+        ("photo 1600x1200 q85", _photo(1600, 1200, 85)),
+        ("small jpeg 800x600", _photo(800, 600, 80)),
+        ("png rgba 1284x2778", _screenshot(1284, 2778)),
+    ]
+
+
+def load_corpus(directory: str) -> list:
+    paths = sorted(p for p in Path(directory).expanduser().iterdir() if p.suffix.lower() in EXTENSIONS)
+    return [(p.name, p.read_bytes()) for p in paths]
+
+
+def before(content: bytes) -> dict:
+    """以前の process_image と同じ処理（Visionには元画像、保存用はフル解像度から既定の品質で再エンコード）"""
+    img = Image.open(io.BytesIO(content))
+    img.load()
+    gemini = pil_to_blob(img)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG")
+    return {"vision": len(content), "gemini": len(gemini.data), "stored": len(buffer.getvalue())}
+
+
+def after(content: bytes) -> dict:
+    renditions = preprocess_image(content)
+    gemini = pil_to_blob(renditions.gemini)
+    return {"vision": len(renditions.ocr), "gemini": len(gemini.data), "stored": len(renditions.stored)}
+
+
+def timed(func, content: bytes, repeat: int) -> tuple[float | None, dict | None]:
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.process_time()
+        try:
+            result = func(content)
+        except Exception:
+            return None, None
+        durations.append(time.process_time() - start)
+    return statistics.median(durations) * 1000, result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="画像の前処理の処理時間と大きさの計測")
+    parser.add_argument("--corpus", help="画像のディレクトリ（既定は合成した画像）")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    if not corpus:
+        print("画像が見つかりません", file=sys.stderr)
+        return 1
+
+    def kb(value) -> str:
+        return f"{value / 1024:.0f}" if value is not None else "-"
+
+    keys = ("vision", "gemini", "stored")
+
+    def columns(ms, sizes) -> str:
+        if sizes is None:
+            return f"{'error':>9}" + "".join(f"{'-':>10}" for _ in keys)
+        return f"{ms:>9.1f}" + "".join(f"{kb(sizes[key]):>10}" for key in keys)
+
+    size_header = "".join(f"{key + ' KB':>10}" for key in keys)
+    print(f"{'':<30}{'':>9}  {'before':<39}  after")
+    print(f"{'image':<30}{'input KB':>9}  {'cpu ms':>9}{size_header}  {'cpu ms':>9}{size_header}")
+    totals = {"input": 0, "before": dict.fromkeys(keys, 0), "after": dict.fromkeys(keys, 0), "before_ms": 0.0, "after_ms": 0.0}
+    for name, content in corpus:
+        before_ms, old = timed(before, content, args.repeat)
+        after_ms, new = timed(after, content, args.repeat)
+        print(f"{name[:29]:<30}{kb(len(content)):>9}  {columns(before_ms, old)}  {columns(after_ms, new)}")
+
+        # 合計は両方で処理できた画像だけを数える
+        if old and new:
+            totals["input"] += len(content)
+            totals["before_ms"] += before_ms
+            totals["after_ms"] += after_ms
+            for key in keys:
+                totals["before"][key] += old[key]
+                totals["after"][key] += new[key]
+
+    print(f"{'total':<30}{kb(totals['input']):>9}  {columns(totals['before_ms'], totals['before'])}  {columns(totals['after_ms'], totals['after'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""フェイクのSupabase / Vision / Geminiに対して app.main:app を起動し、シナリオごとの性能を計測する。
+
+    python -m bench.run                                  # すべてのシナリオを実行し、baselineと比較する
+    python -m bench.run -s foods_list -s ocr -c 16 -d 20
+    python -m bench.run --save-baseline                  # 結果を bench/baseline.json に保存する
+
+各シナリオについて p50 / p95 / p99 のレイテンシ、スループット、エラー数、
+アプリのRSS（最大値、ワーカーを含む合計）と、1リクエストあたりの上流（フェイク）の呼び出し回数を出力する。baselineより tolerance 以上悪化した項目があれば終了コード1で終わる。
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+
+import jwt
+import httpx
+
+from bench.scenarios import SCENARIOS, Context
+
+BENCH_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCH_DIR.parent
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+DEFAULT_OUTPUT = BENCH_DIR / "results" / "latest.json"
+JWT_SECRET = "bench-jwt-secret-bench-jwt-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes(pid: int) -> int | None:
+    """プロセスの常駐メモリ（Linuxのみ）"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def tree_rss_bytes(pid: int) -> int | None:
+    """プロセスと、その子孫（uvicornのワーカー）の常駐メモリの合計"""
+    total = rss_bytes(pid)
+    if total is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        children = []
+    return total + sum(tree_rss_bytes(child) or 0 for child in children)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def wait_until_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} が起動しませんでした")
+
+
+async def sample_rss(pid: int, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        value = tree_rss_bytes(pid)
+        if value is not None:
+            samples.append(value)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.2)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def upstream_calls(client: httpx.AsyncClient, fakes_url: str) -> int:
+    response = await client.get(f"{fakes_url}/__stats")
+    return sum(response.json().values())
+
+
+async def run_scenario(name: str, base_url: str, ctx: Context, concurrency: int, duration: float, warmup: int, pid: int, fakes_url: str) -> dict:
+    scenario = SCENARIOS[name]
+    latencies: list = []
+    statuses: dict = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        for _ in range(warmup):
+            await scenario(client, ctx)
+
+        ctx.marks.clear()
+        calls_before = await upstream_calls(client, fakes_url)
+        rss_samples: list = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_rss(pid, rss_samples, stop))
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await scenario(client, ctx)
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+        calls = await upstream_calls(client, fakes_url) - calls_before
+
+    errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+    marks = {}
+    for mark, values in sorted(ctx.marks.items()):
+        marks[f"{mark}_p50_ms"] = round(percentile(values, 50) * 1000, 3)
+        marks[f"{mark}_p95_ms"] = round(percentile(values, 95) * 1000, 3)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "rss_max_mb": round(max(rss_samples) / 2**20, 1) if rss_samples else None,
+        "upstream_per_request": round(calls / len(latencies), 3) if latencies else None,
+        **marks,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """baselineより悪化した項目を返す（レイテンシ・RSSは増加、スループットは減少）"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        # シナリオ内で計測した区間（foods_p95_ms など）もレイテンシとして比較する
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "rss_max_mb", *(key for key in current if key.endswith("_ms") and key[:3] not in ("p50", "p95", "p99"))):
+            if base.get(metric) and current.get(metric) and current[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {base[metric]} -> {current[metric]}")
+        if base.get("throughput_rps") and current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}.throughput_rps: {base['throughput_rps']} -> {current['throughput_rps']}")
+        if current["errors"] > base.get("errors", 0) and current["errors"] > current["requests"] * tolerance / 10:
+            regressions.append(f"{name}.errors: {base.get('errors', 0)} -> {current['errors']}")
+    return regressions
+
+
+def print_table(results: dict, baseline: dict):
+    header = f"{'scenario':<22}{'req':>7}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'rss MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<22}{r['requests']:>7}{r['errors']:>6}{r['throughput_rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{str(r['rss_max_mb']):>9}")
+        base = baseline.get(name)
+        if base:
+            print(f"{'  (baseline)':<22}{base['requests']:>7}{base['errors']:>6}{base['throughput_rps']:>9}{base['p50_ms']:>9}{base['p95_ms']:>9}{base['p99_ms']:>9}{str(base.get('rss_max_mb')):>9}")
+        for metric in (key for key in r if key.endswith("_p50_ms") and key != "p50_ms"):
+            mark = metric.removesuffix("_p50_ms")
+            line = f"  {mark} p50 {r[metric]} ms / p95 {r[f'{mark}_p95_ms']} ms"
+            if base and metric in base:
+                line += f"  (baseline p50 {base[metric]} ms / p95 {base[f'{mark}_p95_ms']} ms)"
+            print(line)
+
+
+def start_process(args: list, env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], cwd=BACKEND_DIR, env=env)
+
+
+async def main_async(args) -> int:
+    ports = {name: free_port() for name in ("supabase", "vision", "gemini", "app")}
+    user_ids = [str(uuid.uuid4()) for _ in range(args.users)]
+    base_env = {key: value for key, value in os.environ.items() if not key.startswith(("SUPABASE_", "GEMINI_", "VISION_", "GOOGLE_"))}
+
+    fake_args = [
+        "-m", "bench.fakes",
+        "--supabase-port", str(ports["supabase"]),
+        "--vision-port", str(ports["vision"]),
+        "--gemini-port", str(ports["gemini"]),
+    ]
+    for name in ("supabase", "storage", "vision", "gemini"):
+        for option in ("latency_ms", "jitter_ms", "error_rate", "throttle_period_s", "throttle_for_s", "stall_rate"):
+            value = getattr(args, f"{name}_{option}")
+            if value is not None:
+                fake_args += [f"--{name}-{option.replace('_', '-')}", str(value)]
+
+    cache_dir = tempfile.mkdtemp(prefix="bench-ocr-cache-")
+    app_env = {
+        **base_env,
+        "SUPABASE_URL": f"http://127.0.0.1:{ports['supabase']}",
+        # supabase-pyはキーがJWT形式かどうかを検証する
+        "SUPABASE_SERVICE_KEY": jwt.encode({"role": "service_role"}, JWT_SECRET, algorithm="HS256"),
+        "SUPABASE_HTTP2": "0",
+        "JWT_SECRET": JWT_SECRET,
+        "GEMINI_API_KEY": "bench",
+        "GEMINI_API_ENDPOINT": f"127.0.0.1:{ports['gemini']}",
+        "GEMINI_API_INSECURE": "1",
+        "VISION_API_ENDPOINT": f"127.0.0.1:{ports['vision']}",
+        "VISION_API_INSECURE": "1",
+        "OCR_CACHE_DIR": cache_dir,
+        "CACHE_BACKEND": args.cache_backend,
+        "CACHE_PATH": os.path.join(cache_dir, "cache.sqlite3"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        "NOTIFICATION_SCHEDULER_ENABLED": "0",
+    }
+    app_args = ["-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(ports["app"]), "--log-level", "warning"]
+    if args.workers > 1:
+        app_args += ["--workers", str(args.workers)]
+
+    fakes = start_process(fake_args, base_env)
+    app = None
+    try:
+        await wait_until_ready(f"http://127.0.0.1:{ports['supabase']}/rest/v1/rpc/ping")
+        async with httpx.AsyncClient() as client:
+            await client.post(f"http://127.0.0.1:{ports['supabase']}/__seed", json={"user_ids": user_ids, "foods_per_user": args.foods_per_user})
+
+        app = start_process(app_args, app_env)
+        base_url = f"http://127.0.0.1:{ports['app']}"
+        await wait_until_ready(f"{base_url}/")
+
+        ctx = Context(jwt_secret=JWT_SECRET, user_ids=user_ids, unique_images=not args.repeat_images)
+        results = {}
+        for name in args.scenario or list(SCENARIOS):
+            print(f"running {name} (concurrency={args.concurrency}, duration={args.duration}s)", file=sys.stderr)
+            results[name] = await run_scenario(
+                name, base_url, ctx, args.concurrency, args.duration, args.warmup, app.pid, f"http://127.0.0.1:{ports['supabase']}"
+            )
+    finally:
+        for process in (app, fakes):
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "workers": args.workers,
+            "cache_backend": args.cache_backend,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+
+    baseline_path = Path(args.baseline)
+    baseline = {}
+    if baseline_path.exists() and not args.save_baseline:
+        stored = json.loads(baseline_path.read_text())
+        # 同時接続数・ワーカー数が異なる結果とは比較しない
+        if all(stored["meta"].get(key) == report["meta"][key] for key in ("concurrency", "workers")):
+            baseline = stored["results"]
+        else:
+            print("baselineと同時接続数・ワーカー数が異なるため比較しません", file=sys.stderr)
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+        print(f"baselineを保存しました: {baseline_path}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="オフラインベンチマーク")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS), help="実行するシナリオ（複数指定可、既定はすべて）")
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("-d", "--duration", type=float, default=10, help="シナリオごとの計測時間（秒）")
+    parser.add_argument("--warmup", type=int, default=3, help="計測前に実行するリクエスト数")
+    parser.add_argument("--workers", type=int, default=1, help="uvicornのワーカー数")
+    parser.add_argument("--cache-backend", default="memory", help="CACHE_BACKEND（memory / sqlite / module:ClassName）")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--foods-per-user", type=int, default=200)
+    parser.add_argument("--repeat-images", action="store_true", help="OCRで毎回同じ画像を送る（キャッシュ込みの計測）")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT))
+    parser.add_argument("--tolerance", type=float, default=0.2, help="baselineからの悪化を許容する割合")
+    for name in ("supabase", "storage", "vision", "gemini"):
+        parser.add_argument(f"--{name}-latency-ms", type=float)
+        parser.add_argument(f"--{name}-jitter-ms", type=float)
+        parser.add_argument(f"--{name}-error-rate", type=float)
+        parser.add_argument(f"--{name}-throttle-period-s", type=float, help="この秒数ごとに、--*-throttle-for-s 秒間クォータ超過を返す")
+        parser.add_argument(f"--{name}-throttle-for-s", type=float)
+        parser.add_argument(f"--{name}-stall-rate", type=float, help="この割合の呼び出しを通常の10倍遅くする")
+    args = parser.parse_args(argv)
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
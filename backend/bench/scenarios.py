@@ -0,0 +1,188 @@
+"""ベンチマークのシナリオ（ルートごとに1リクエスト分の処理を定義する）"""
+
+import io
+import time
+import asyncio
+import uuid
+import random
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List
+
+import jwt
+import httpx
+from PIL import Image
+
+INGREDIENTS = ["卵", "玉ねぎ", "ピーマン", "にんじん", "豚肉", "鶏肉", "豆腐", "キャベツ", "じゃがいも", "トマト"]
+
+
+@dataclass
+class Context:
+    """シナリオ間で共有する情報（ユーザーのトークンなど）"""
+    jwt_secret: str
+    user_ids: List[str]
+    unique_images: bool = True
+    # シナリオの中で計測した区間（秒）。run_scenario が "<名前>_p50_ms" などとして集計する
+    marks: Dict[str, List[float]] = field(default_factory=dict)
+    _tokens: Dict[str, str] = field(default_factory=dict)
+    _image: bytes | None = None
+
+    def mark(self, name: str, seconds: float):
+        self.marks.setdefault(name, []).append(seconds)
+
+    def auth(self) -> Dict[str, str]:
+        user_id = random.choice(self.user_ids)
+        token = self._tokens.get(user_id)
+        if token is None:
+            token = jwt.encode(
+                {"sub": user_id, "email": f"{user_id[:8]}@example.com", "exp": int(time.time()) + 24 * 3600},
+                self.jwt_secret,
+                algorithm="HS256",
+            )
+            self._tokens[user_id] = token
+        return {"Authorization": f"Bearer {token}"}
+
+    def image(self) -> bytes:
+        # 同じ画像はOCRキャッシュに当たるため、既定ではリクエストごとに異なる画像を作る
+        if self._image is not None and not self.unique_images:
+            return self._image
+        img = Image.new("RGB", (1600, 1200), tuple(random.randrange(256) for _ in range(3)))
+        img.putpixel((random.randrange(1600), random.randrange(1200)), (0, 0, 0))
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=85)
+        self._image = buffer.getvalue()
+        return self._image
+
+
+Scenario = Callable[[httpx.AsyncClient, Context], Awaitable[httpx.Response]]
+
+
+async def foods_list(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get("/api/foods/", params={"limit": 50}, headers=ctx.auth())
+
+
+async def foods_list_filtered(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    params = {"limit": 50, "expiring_within_days": random.randint(1, 14), "fields": "id,name,expiration_date"}
+    return await client.get("/api/foods/", params=params, headers=ctx.auth())
+
+
+async def foods_summary(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get("/api/foods/summary", headers=ctx.auth())
+
+
+async def foods_create(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    food = {
+        "name": f"ベンチ食品{uuid.uuid4().hex[:6]}",
+        "expiration_date": "2030-01-01",
+        "category": random.choice(["野菜", "乳製品", "肉類"]),
+    }
+    return await client.post("/api/foods/", json=food, headers=ctx.auth())
+
+
+def foods_bulk(size: int) -> Scenario:
+    """size件を一括登録するシナリオ。1件あたりの登録時間を "per_row" として記録する
+
+    登録した食品は計測の外で一括削除し、フェイクの行数が増え続けないようにする。
+    """
+    async def scenario(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+        items = [{
+            "name": f"一括ベンチ{uuid.uuid4().hex[:6]}",
+            "expiration_date": "2030-01-01",
+            "category": random.choice(["野菜", "乳製品", "肉類"]),
+        } for _ in range(size)]
+        headers = ctx.auth()
+        start = time.perf_counter()
+        response = await client.post("/api/foods/bulk", json={"items": items}, headers=headers)
+        ctx.mark("per_row", (time.perf_counter() - start) / size)
+        if response.status_code == 200:
+            ids = [result["id"] for result in response.json()["results"] if result["status"] == "created"]
+            cleanup = await client.post("/api/foods/bulk/delete", json={"ids": ids}, headers=headers)
+            cleanup.raise_for_status()
+        return response
+    return scenario
+
+
+async def ocr(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    files = {"image": ("bench.jpg", ctx.image(), "image/jpeg")}
+    return await client.post("/api/image/ocr", files=files, headers=ctx.auth())
+
+
+async def ocr_date_only(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    files = {"image": ("bench.jpg", ctx.image(), "image/jpeg")}
+    return await client.post("/api/image/ocr", params={"details": "false"}, files=files, headers=ctx.auth())
+
+
+async def ocr_batch(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    files = [("images", (f"bench{i}.jpg", ctx.image(), "image/jpeg")) for i in range(4)]
+    async with client.stream("POST", "/api/image/ocr/batch", files=files, headers=ctx.auth()) as response:
+        await response.aread()
+    return response
+
+
+async def recipes(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    body = {"ingredients": random.sample(INGREDIENTS, 3)}
+    return await client.post("/api/foods/recipes", json=body, headers=ctx.auth())
+
+
+async def recipes_stream(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    """最初のSSEイベント（data: 行）までの時間を "first_event" として記録する"""
+    body = {"ingredients": random.sample(INGREDIENTS, 3), "variety": True}
+    start = time.perf_counter()
+    async with client.stream("POST", "/api/foods/recipes/stream", json=body, headers=ctx.auth()) as response:
+        first_event = None
+        async for line in response.aiter_lines():
+            if first_event is None and line.startswith("data:"):
+                first_event = time.perf_counter() - start
+        if first_event is not None:
+            ctx.mark("first_event", first_event)
+    return response
+
+
+async def ocr_with_foods(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    """OCRを1件実行し、その間に食品一覧を繰り返し取得する。
+
+    OCRで実行枠が埋まっている間の食品一覧のレイテンシを "foods" として記録する
+    （OCRがイベントループや接続を塞いでいないかの確認用）。
+    """
+    done = asyncio.Event()
+
+    async def foods_while_ocr():
+        while not done.is_set():
+            start = time.perf_counter()
+            response = await foods_list(client, ctx)
+            if response.status_code == 200:
+                ctx.mark("foods", time.perf_counter() - start)
+
+    poller = asyncio.create_task(foods_while_ocr())
+    try:
+        return await ocr(client, ctx)
+    finally:
+        done.set()
+        await poller
+
+
+async def notifications_get(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get("/api/notifications/", headers=ctx.auth())
+
+
+async def notifications_update(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    body = {"timing": random.choice(["on_expiry_date", "one_day_before", "three_days_before"])}
+    return await client.put("/api/notifications/", json=body, headers=ctx.auth())
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "foods_list": foods_list,
+    "foods_list_filtered": foods_list_filtered,
+    "foods_summary": foods_summary,
+    "foods_create": foods_create,
+    "foods_bulk_10": foods_bulk(10),
+    "foods_bulk_100": foods_bulk(100),
+    "foods_bulk_500": foods_bulk(500),
+    "ocr": ocr,
+    "ocr_date_only": ocr_date_only,
+    "ocr_batch": ocr_batch,
+    "ocr_with_foods": ocr_with_foods,
+    "recipes": recipes,
+    "recipes_stream": recipes_stream,
+    "notifications_get": notifications_get,
+    "notifications_update": notifications_update,
+}
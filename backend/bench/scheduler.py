@@ -0,0 +1,140 @@
+"""期限通知スケジューラ（app/services/notification_scheduler.py）を、ローカルのPostgresに大量の食品を登録して計測する。
+
+    supabase start                                   # ローカルのPostgres + PostgREST（supabase/migrations を適用済み）
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_SERVICE_KEY=... python -m bench.scheduler
+    python -m bench.scheduler --users 1000 --foods 10000 --repeat 5
+
+--users 人分の通知設定と、合計 --foods 件の食品（賞味期限は今日の前後に分散）を登録し、
+- 通知が集中する時間窓（NOTIFICATION_HOUR 時から NOTIFICATION_TICK_SECONDS 秒）と、通知のない時間窓での fetch_due_notifications
+- 集中する時刻での ExpiryNotificationScheduler.tick（取得・ヒープ・FakeNotificationSender への送信）
+の p50 / p95 と件数を出力する。
+foods.user_id / notification_settings.user_id に auth.users への外部キー制約がある場合は、ローカルのDBで外してから実行する。
+登録したデータは最後に削除する（--keep で残す）。
+"""
+
+import sys
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import statistics
+from datetime import date, datetime, time as dt_time, timedelta
+from zoneinfo import ZoneInfo
+
+import httpx
+
+from app.services.notification_scheduler import ExpiryNotificationScheduler, FakeNotificationSender, fetch_due_notifications
+from app.utils.settings import settings
+from bench.fakes import CATEGORIES
+
+INSERT_CHUNK = 1000
+DELETE_CHUNK = 200
+TIMINGS = ("on_expiry_date", "one_day_before", "three_days_before")
+NAME_PREFIX = "通知ベンチ"
+
+
+def seed(client: httpx.Client, user_ids: list, foods: int, days: int):
+    today = date.today()
+    settings_rows = [{
+        "user_id": user_id,
+        "enabled": random.random() < 0.9,
+        "timing": random.choice(TIMINGS),
+        "voice_enabled": True,
+    } for user_id in user_ids]
+    for start in range(0, len(settings_rows), INSERT_CHUNK):
+        client.post(
+            "/rest/v1/notification_settings", json=settings_rows[start:start + INSERT_CHUNK], headers={"Prefer": "return=minimal"}
+        ).raise_for_status()
+
+    # 1M件を一度にメモリに載せないよう、INSERT_CHUNK 件ずつ作って登録する
+    for start in range(0, foods, INSERT_CHUNK):
+        rows = [{
+            "id": str(uuid.uuid4()),
+            "user_id": random.choice(user_ids),
+            "name": f"{NAME_PREFIX}{i:07d}",
+            "expiration_date": (today + timedelta(days=random.randint(-days, days))).isoformat(),
+            "category": random.choice(CATEGORIES),
+            "image_url": None,
+        } for i in range(start, min(foods, start + INSERT_CHUNK))]
+        client.post("/rest/v1/foods", json=rows, headers={"Prefer": "return=minimal"}).raise_for_status()
+
+
+def cleanup(client: httpx.Client, user_ids: list):
+    client.delete("/rest/v1/foods", params={"name": f"like.{NAME_PREFIX}*"}).raise_for_status()
+    for start in range(0, len(user_ids), DELETE_CHUNK):
+        ids = ",".join(user_ids[start:start + DELETE_CHUNK])
+        client.delete("/rest/v1/notification_settings", params={"user_id": f"in.({ids})"}).raise_for_status()
+
+
+async def measure(run, repeat: int) -> dict:
+    count = await run()  # 接続とプランのキャッシュを温める
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = await run()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    return {
+        "p50_ms": statistics.median(durations) * 1000,
+        "p95_ms": durations[min(len(durations) - 1, int(0.95 * len(durations)))] * 1000,
+        "count": count,
+    }
+
+
+async def run_all(repeat: int) -> dict:
+    interval = timedelta(seconds=settings.notification_tick_seconds)
+    # 通知は NOTIFICATION_HOUR 時ちょうどに集中するため、明日のその時刻を含む窓が最も重い
+    peak = datetime.combine(date.today() + timedelta(days=1), dt_time(settings.notification_hour), ZoneInfo(settings.notification_tz))
+    quiet = peak + timedelta(hours=6)
+
+    async def fetch(window_start: datetime) -> int:
+        return len(await fetch_due_notifications(window_start, window_start + interval))
+
+    async def tick() -> int:
+        scheduler = ExpiryNotificationScheduler(
+            FakeNotificationSender(), interval=settings.notification_tick_seconds, batch_size=settings.notification_batch_size
+        )
+        return await scheduler.tick(now=peak)
+
+    return {
+        "fetch (peak window)": await measure(lambda: fetch(peak), repeat),
+        "fetch (quiet window)": await measure(lambda: fetch(quiet), repeat),
+        "tick (peak)": await measure(tick, repeat),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="期限通知スケジューラのベンチマーク")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--foods", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=60, help="賞味期限を今日の前後何日に分散させるか")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--keep", action="store_true", help="登録したデータを削除しない")
+    args = parser.parse_args(argv)
+
+    if not settings.supabase_url or not settings.supabase_service_key:
+        print("SUPABASE_URL と SUPABASE_SERVICE_KEY を設定してください", file=sys.stderr)
+        return 2
+
+    key = settings.supabase_service_key
+    user_ids = [str(uuid.uuid4()) for _ in range(args.users)]
+    with httpx.Client(base_url=settings.supabase_url, headers={"apikey": key, "Authorization": f"Bearer {key}"}, timeout=300) as client:
+        start = time.perf_counter()
+        seed(client, user_ids, args.foods, args.days)
+        print(f"seeded {args.users} users / {args.foods} foods in {time.perf_counter() - start:.0f}s", file=sys.stderr)
+        try:
+            results = asyncio.run(run_all(args.repeat))
+        finally:
+            if not args.keep:
+                cleanup(client, user_ids)
+
+    print(f"{args.users} users / {args.foods} foods, window={settings.notification_tick_seconds:.0f}s, repeat={args.repeat}")
+    print(f"{'step':<22} {'p50 ms':>9} {'p95 ms':>9} {'count':>8}")
+    for name, result in results.items():
+        print(f"{name:<22} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['count']:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""食品一覧のレスポンスの組み立て方ごとに、シリアライズのCPU時間と転送量を比較する。
+
+    python -m bench.serialization                  # 10 / 1,000 / 10,000 件
+    python -m bench.serialization --items 500 --repeat 50
+
+- response_model: List[FoodListItem] で検証し、標準のjsonで書き出す（FastAPIの既定の経路）
+- orjson: DBの行を検証せずにorjsonで書き出す（read_foods の経路）
+転送量は無圧縮と、CompressionMiddleware と同じ設定の gzip / br（brotliがある場合）で計測する。
+"""
+
+import sys
+import json
+import time
+import uuid
+import argparse
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+
+from app.schemas.food import FoodListItem
+from app.utils.compression import CompressionMiddleware
+from app.utils.settings import settings
+from bench.fakes import seed_foods
+
+FOODS = TypeAdapter(List[FoodListItem])
+
+
+def via_response_model(rows: list) -> bytes:
+    content = FOODS.dump_python(FOODS.validate_python(rows), mode="json", exclude_unset=True)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def via_orjson(rows: list) -> bytes:
+    return orjson.dumps(rows)
+
+
+def timed(func, arg, repeat: int) -> tuple[float, object]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(arg)
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="レスポンスのシリアライズと圧縮の計測")
+    parser.add_argument("--items", type=int, action="append", help="一覧の件数（既定は 10, 1000, 10000）")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    compressors = CompressionMiddleware(
+        None,
+        gzip_level=settings.compression_gzip_level,
+        brotli_quality=settings.compression_brotli_quality,
+    ).compressors
+
+    print(f"{'items':>6}  {'method':<15}{'ms':>9}{'speedup':>9}")
+    sizes = []
+    for items in args.items or [10, 1000, 10000]:
+        rows = seed_foods([str(uuid.uuid4())], items)
+        repeat = max(1, args.repeat * 1000 // max(items, 1000))
+        baseline_ms, body = timed(via_response_model, rows, repeat)
+        orjson_ms, fast_body = timed(via_orjson, rows, repeat)
+        if json.loads(body) != json.loads(fast_body):
+            print(f"FAIL {items}件: 2つの経路の結果が一致しません")
+            return 1
+        print(f"{items:>6}  {'response_model':<15}{baseline_ms:>9.3f}{'':>9}")
+        print(f"{items:>6}  {'orjson':<15}{orjson_ms:>9.3f}{baseline_ms / orjson_ms:>8.1f}x")
+
+        encoded = {"identity": (0.0, len(fast_body))}
+        for encoding, compress in compressors.items():
+            ms, compressed = timed(compress, fast_body, repeat)
+            encoded[encoding] = (ms, len(compressed))
+        sizes.append((items, encoded))
+
+    print()
+    print(f"{'items':>6}  {'encoding':<10}{'bytes':>11}{'ratio':>8}{'ms':>9}")
+    for items, encoded in sizes:
+        raw = encoded["identity"][1]
+        for encoding, (ms, size) in encoded.items():
+            print(f"{items:>6}  {encoding:<10}{size:>11}{size / raw:>8.1%}{ms:>9.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
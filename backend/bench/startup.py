@@ -0,0 +1,157 @@
+"""起動時間の計測と回帰チェック。
+
+    python -m bench.startup                  # import時間の内訳・起動時間を表示し、baselineと比較する
+    python -m bench.startup --save-baseline  # 結果を bench/startup_baseline.json に保存する
+
+次の場合に終了コード1で終わる。
+- app.main のimport時に、遅延読み込みにしているSDK（gRPC・Vision・Gemini・PIL・supabase）が読み込まれた
+- Google Cloudの認証情報がない状態でアプリが起動しない
+- import時間・起動時間が baseline より tolerance 以上悪化した
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+import httpx
+
+from bench.run import BACKEND_DIR, BENCH_DIR, free_port
+
+DEFAULT_BASELINE = BENCH_DIR / "startup_baseline.json"
+
+# app.main のimport時に読み込まれてはいけないモジュール
+LAZY_MODULES = ("grpc", "google.cloud.vision", "google.generativeai", "google.ai.generativelanguage", "PIL", "supabase")
+
+
+def clean_env() -> dict:
+    """Google Cloud・Supabaseの設定を含まない環境（CRUDのみの構成を想定）"""
+    env = {key: value for key, value in os.environ.items() if not key.startswith(("GOOGLE_", "GEMINI_", "VISION_", "SUPABASE_"))}
+    env.update({
+        "SUPABASE_URL": "http://127.0.0.1:9",
+        "SUPABASE_SERVICE_KEY": "startup-check",
+        "JWT_SECRET": "startup-check",
+        "LOG_LEVEL": "WARNING",
+    })
+    return env
+
+
+def import_report(env: dict) -> list:
+    """python -X importtime の結果を (モジュール, 自身の時間ms, 累積ms) のリストで返す"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line.removeprefix("import time:").split("|")
+        rows.append((module.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return rows
+
+
+def import_once(env: dict) -> tuple:
+    """app.main のimport時間（ms）と、読み込まれた遅延対象のモジュールを返す"""
+    code = (
+        "import time, sys, json\n"
+        "start = time.perf_counter()\n"
+        "import app.main\n"
+        "elapsed = (time.perf_counter() - start) * 1000\n"
+        f"loaded = [m for m in {LAZY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'ms': elapsed, 'loaded': loaded}))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    return data["ms"], data["loaded"]
+
+
+def time_to_ready(env: dict, timeout: float = 60) -> float:
+    """uvicornでアプリを起動し、最初のリクエストに応答するまでの時間（ms）"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        deadline = start + timeout
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"アプリが終了しました (exit code {process.returncode})")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                    return (time.perf_counter() - start) * 1000
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.02)
+        raise TimeoutError("アプリが起動しませんでした")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="起動時間の計測と回帰チェック")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="計測の回数（中央値を使う）")
+    parser.add_argument("--top", type=int, default=15, help="import時間の内訳を表示する件数")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="baselineからの悪化を許容する割合")
+    args = parser.parse_args(argv)
+
+    env = clean_env()
+    failures = []
+
+    rows = import_report(env)
+    print(f"{'module':<60}{'self ms':>10}{'total ms':>10}")
+    for module, self_ms, cumulative_ms in sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]:
+        print(f"{module:<60}{self_ms:>10.1f}{cumulative_ms:>10.1f}")
+    print()
+
+    import_times = []
+    for _ in range(args.repeat):
+        elapsed, loaded = import_once(env)
+        import_times.append(elapsed)
+        if loaded:
+            failures.append(f"app.main のimport時に読み込まれています: {', '.join(loaded)}")
+            break
+
+    ready_times = []
+    try:
+        for _ in range(args.repeat):
+            ready_times.append(time_to_ready(env))
+    except (RuntimeError, TimeoutError) as e:
+        failures.append(f"Google Cloudの認証情報なしで起動できません: {e}")
+
+    results = {
+        "import_ms": round(statistics.median(import_times), 1),
+        "ready_ms": round(statistics.median(ready_times), 1) if ready_times else None,
+    }
+    print(f"import app.main: {results['import_ms']} ms")
+    print(f"time to ready:   {results['ready_ms']} ms")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"baselineを保存しました: {baseline_path}")
+    elif baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        for key, value in results.items():
+            if value is not None and baseline.get(key) and value > baseline[key] * (1 + args.tolerance):
+                failures.append(f"{key}: {baseline[key]} -> {value}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""食品の集計RPC（food_summary）と、全件取得してクライアントで集計する方法を、ローカルのPostgresで比較する。
+
+    supabase start                                   # ローカルのPostgres + PostgREST（supabase/migrations を適用済み）
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_SERVICE_KEY=... python -m bench.summary
+    python -m bench.summary --items 10000 --repeat 50 --user-id <auth.usersに存在するID>
+
+--items 件の食品を1ユーザー分登録し、それぞれの方法の p50 / p95 レイテンシとレスポンスの大きさを出力する。
+RPCの結果がフェイク（bench/fakes.py）の集計と一致しない場合は終了コード1で終わる。
+登録した食品は最後に削除する（--keep で残す）。
+"""
+
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import statistics
+from datetime import date, timedelta
+
+import httpx
+
+from bench.fakes import CATEGORIES, food_summary
+
+INSERT_CHUNK = 1000
+
+
+def seed(client: httpx.Client, user_id: str, items: int) -> list:
+    today = date.today()
+    rows = [{
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "name": f"集計ベンチ{i:05d}",
+        "expiration_date": (today + timedelta(days=random.randint(-30, 90))).isoformat(),
+        "category": random.choice(CATEGORIES),
+        "image_url": None,
+    } for i in range(items)]
+    for start in range(0, len(rows), INSERT_CHUNK):
+        client.post("/rest/v1/foods", json=rows[start:start + INSERT_CHUNK], headers={"Prefer": "return=minimal"}).raise_for_status()
+    return rows
+
+
+def measure(request, repeat: int) -> dict:
+    request()  # 接続とプランのキャッシュを温める
+    durations = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = request()
+        durations.append(time.perf_counter() - start)
+        response.raise_for_status()
+        size = len(response.content)
+    durations.sort()
+    return {
+        "p50_ms": statistics.median(durations) * 1000,
+        "p95_ms": durations[min(len(durations) - 1, int(0.95 * len(durations)))] * 1000,
+        "bytes": size,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="食品の集計RPCのベンチマーク")
+    parser.add_argument("--url", default=os.getenv("SUPABASE_URL", "http://127.0.0.1:54321"))
+    parser.add_argument("--key", default=os.getenv("SUPABASE_SERVICE_KEY", ""))
+    parser.add_argument("--user-id", default=None, help="食品を登録するユーザー（foods.user_id に外部キー制約がある場合は既存のユーザーを指定する）")
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--keep", action="store_true", help="登録した食品を削除しない")
+    args = parser.parse_args(argv)
+
+    user_id = args.user_id or str(uuid.uuid4())
+    headers = {"apikey": args.key, "Authorization": f"Bearer {args.key}"} if args.key else {}
+    params = {"target_user_id": user_id, "today": date.today().isoformat(), "soon_days": 7, "top_k": 5}
+
+    with httpx.Client(base_url=args.url, headers=headers, timeout=60) as client:
+        rows = seed(client, user_id, args.items)
+        try:
+            summary = client.post("/rest/v1/rpc/food_summary", json=params)
+            summary.raise_for_status()
+            expected = food_summary(rows, **params)
+            matches = summary.json() == expected
+
+            results = {
+                "rpc food_summary": measure(lambda: client.post("/rest/v1/rpc/food_summary", json=params), args.repeat),
+                "select all foods": measure(lambda: client.get("/rest/v1/foods", params={
+                    "select": "id,name,expiration_date,category,image_url",
+                    "user_id": f"eq.{user_id}",
+                    "order": "expiration_date,id",
+                }), args.repeat),
+            }
+        finally:
+            if not args.keep:
+                client.delete("/rest/v1/foods", params={"user_id": f"eq.{user_id}"}).raise_for_status()
+
+    print(f"{args.items} items / user, repeat={args.repeat}")
+    print(f"{'method':<20} {'p50 ms':>9} {'p95 ms':>9} {'bytes':>10}")
+    for name, result in results.items():
+        print(f"{name:<20} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['bytes']:>10}")
+    if not matches:
+        print("FAIL food_summary の結果がフェイクの集計と一致しません")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""PostgRESTの呼び出し方ごとに、1ワーカー（1イベントループ）あたりのスループットを比較する。
+
+    python -m bench.supabase_pool                                   # フェイクのSupabase（bench/fakes.py）に対して計測
+    python -m bench.supabase_pool -c 32 -d 10 --latency-ms 30
+    SUPABASE_URL=https://<project>.supabase.co SUPABASE_SERVICE_KEY=... python -m bench.supabase_pool --url-from-env --user-id <ID>
+
+- sync client: 同期版のクライアント（get_supabase）を async の処理から直接呼ぶ（以前のルートと同じく、応答までイベントループを止める）
+- async pooled (HTTP/1.1) / async pooled (HTTP/2): supabase_async（キープアライブ付きの接続プール）
+
+それぞれ別のプロセスで、--concurrency 個のタスクから食品一覧のクエリを --duration 秒間送り続け、rps と p50 / p95 を出力する。
+フェイクはHTTP/1.1のみのため、HTTP/2はTLSでHTTP/2に対応したエンドポイント（--url-from-env）でのみ実際に使われる。
+実際に使われたHTTPのバージョンは "negotiated" 列に出力する。
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+import jwt
+import httpx
+
+from bench.run import BACKEND_DIR, JWT_SECRET, free_port, percentile, wait_until_ready
+
+MODES = {
+    "sync client": {"mode": "sync", "http2": "0"},
+    "async pooled (HTTP/1.1)": {"mode": "async", "http2": "0"},
+    "async pooled (HTTP/2)": {"mode": "async", "http2": "1"},
+}
+
+
+async def load(query, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                await query()
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    await query()  # 接続を温める
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+async def negotiated_http_version(url: str, key: str, http2: bool) -> str:
+    async with httpx.AsyncClient(http2=http2, headers={"apikey": key, "Authorization": f"Bearer {key}"}) as client:
+        response = await client.get(f"{url}/rest/v1/foods", params={"select": "id", "limit": 1})
+        return response.http_version
+
+
+async def run_mode(mode: str, user_id: str, concurrency: int, duration: float) -> dict:
+    """環境変数（SUPABASE_URL / SUPABASE_SERVICE_KEY / SUPABASE_HTTP2 / SUPABASE_POOL_SIZE）で設定したクライアントで計測する"""
+    from app.utils.settings import settings
+
+    if mode == "sync":
+        from app.utils.supabase_client import get_supabase
+
+        client = get_supabase()
+
+        async def query():
+            client.table("foods").select("id,name,expiration_date").eq("user_id", user_id).order("expiration_date").limit(50).execute()
+    else:
+        from app.utils.supabase_async import supabase_async as client
+
+        async def query():
+            await client.table("foods").select("id,name,expiration_date").eq("user_id", user_id).order("expiration_date").limit(50).execute()
+
+    result = await load(query, concurrency, duration)
+    result["negotiated"] = await negotiated_http_version(settings.supabase_url, settings.supabase_service_key, settings.supabase_http2)
+    if mode != "sync":
+        await client.close()
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="PostgRESTクライアントの接続プールのスループット比較")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-d", "--duration", type=float, default=5)
+    parser.add_argument("--latency-ms", type=float, default=15, help="フェイクのSupabaseの応答遅延")
+    parser.add_argument("--pool-size", type=int, default=None, help="SUPABASE_POOL_SIZE（既定は設定値）")
+    parser.add_argument("--url-from-env", action="store_true", help="フェイクを起動せず、SUPABASE_URL / SUPABASE_SERVICE_KEY に対して計測する")
+    parser.add_argument("--user-id", default=None)
+    parser.add_argument("--mode", choices=("sync", "async"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        # 計測用の子プロセス（クライアントの設定は起動時の環境変数で決まるため、方法ごとにプロセスを分ける）
+        print(json.dumps(asyncio.run(run_mode(args.mode, args.user_id, args.concurrency, args.duration))))
+        return 0
+
+    env = dict(os.environ)
+    fakes = None
+    user_id = args.user_id or str(uuid.uuid4())
+    if not args.url_from_env:
+        port = free_port()
+        fakes = subprocess.Popen(
+            [sys.executable, "-m", "bench.fakes", "--supabase-port", str(port), "--vision-port", str(free_port()),
+             "--gemini-port", str(free_port()), "--supabase-latency-ms", str(args.latency_ms)],
+            cwd=BACKEND_DIR, stdout=subprocess.DEVNULL,
+        )
+        env["SUPABASE_URL"] = f"http://127.0.0.1:{port}"
+        # supabase-pyはキーがJWT形式かどうかを検証する
+        env["SUPABASE_SERVICE_KEY"] = jwt.encode({"role": "service_role"}, JWT_SECRET, algorithm="HS256")
+    if args.pool_size:
+        env["SUPABASE_POOL_SIZE"] = str(args.pool_size)
+
+    results = {}
+    try:
+        if fakes is not None:
+            asyncio.run(wait_until_ready(f"{env['SUPABASE_URL']}/rest/v1/rpc/ping"))
+            httpx.post(f"{env['SUPABASE_URL']}/__seed", json={"user_ids": [user_id], "foods_per_user": 200}).raise_for_status()
+        for name, mode in MODES.items():
+            print(f"running {name}", file=sys.stderr)
+            output = subprocess.run(
+                [sys.executable, "-m", "bench.supabase_pool", "--mode", mode["mode"], "--user-id", user_id,
+                 "-c", str(args.concurrency), "-d", str(args.duration)],
+                cwd=BACKEND_DIR, env={**env, "SUPABASE_HTTP2": mode["http2"]}, capture_output=True, text=True, check=True,
+            ).stdout
+            results[name] = json.loads(output.strip().splitlines()[-1])
+    finally:
+        if fakes is not None:
+            fakes.terminate()
+            fakes.wait(timeout=10)
+
+    print(f"concurrency={args.concurrency}, duration={args.duration}s" + ("" if args.url_from_env else f", fake latency={args.latency_ms}ms"))
+    print(f"{'client':<26}{'req':>7}{'err':>5}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}  negotiated")
+    for name, r in results.items():
+        print(f"{name:<26}{r['requests']:>7}{r['errors']:>5}{r['rps']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}  {r['negotiated']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
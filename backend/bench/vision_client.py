@@ -0,0 +1,90 @@
+"""Visionの呼び出しについて、プロセスで共有するクライアント（ai_clients.vision_client と同じ作り方）と、
+呼び出しごとにチャネル・クライアントを作る方法のレイテンシを、フェイクのVisionサーバーで比較する。
+
+    python -m bench.vision_client                       # 各200回
+    python -m bench.vision_client --calls 500 --latency-ms 5
+
+呼び出しごとに作る場合は、gRPCが同じ宛先の接続を使い回す場合と、毎回接続する場合（+ new connection）の両方を計測する。
+フェイクはTLS・認証なしのため、差はTCP接続・HTTP/2のハンドシェイクとクライアントの生成の分だけになる。
+本番（TLS + 認証情報の読み込み）ではこれより大きくなる。
+"""
+
+import sys
+import time
+import socket
+import argparse
+import statistics
+
+import grpc
+from google.cloud import vision
+from google.cloud.vision_v1.services.image_annotator.transports import ImageAnnotatorGrpcTransport
+
+from app.utils.ai_clients import GRPC_CHANNEL_OPTIONS
+from bench.fakes import Fault, serve_grpc, vision_handler
+
+
+def create_client(endpoint: str, new_connection: bool = False) -> vision.ImageAnnotatorClient:
+    options = list(GRPC_CHANNEL_OPTIONS)
+    if new_connection:
+        # gRPCは同じ宛先のチャネル間で接続を共有するため、チャネルごとに接続を作らせる
+        options.append(("grpc.use_local_subchannel_pool", 1))
+    channel = grpc.insecure_channel(endpoint, options=options)
+    return vision.ImageAnnotatorClient(transport=ImageAnnotatorGrpcTransport(channel=channel))
+
+
+def measure(call, calls: int) -> dict:
+    call()  # 読み込みと最初の接続を計測から除く
+    durations = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    return {
+        "p50_ms": statistics.median(durations) * 1000,
+        "p95_ms": durations[min(len(durations) - 1, int(0.95 * len(durations)))] * 1000,
+        "mean_ms": statistics.fmean(durations) * 1000,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Visionクライアントの共有・呼び出しごとの生成のレイテンシ比較")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0, help="フェイクVisionの応答遅延")
+    args = parser.parse_args(argv)
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = serve_grpc(vision_handler(Fault(latency_ms=args.latency_ms)), port)
+    endpoint = f"127.0.0.1:{port}"
+    image = vision.Image(content=b"\xff\xd8bench")
+
+    try:
+        shared = create_client(endpoint)
+
+        def per_call(new_connection: bool):
+            client = create_client(endpoint, new_connection)
+            try:
+                client.text_detection(image=image)
+            finally:
+                client.transport.close()
+
+        results = {
+            "shared client": measure(lambda: shared.text_detection(image=image), args.calls),
+            "client per call": measure(lambda: per_call(False), args.calls),
+            "+ new connection": measure(lambda: per_call(True), args.calls),
+        }
+        shared.transport.close()
+    finally:
+        server.stop(grace=None)
+
+    print(f"calls={args.calls}, fake latency={args.latency_ms}ms")
+    print(f"{'method':<18} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}")
+    for name, result in results.items():
+        print(f"{name:<18} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['mean_ms']:>9.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
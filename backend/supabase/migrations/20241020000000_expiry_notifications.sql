@@ -0,0 +1,61 @@
+-- 期限通知スケジューラ用のインデックスとRPC
+-- 通知時刻 = (賞味期限 - notification_settings.timing の日数) の notify_hour 時（tz基準）
+
+create index if not exists foods_expiration_date_idx
+    on public.foods (expiration_date);
+
+create or replace function public.notification_offset_days(timing text)
+returns integer
+language sql
+immutable
+as $$
+    select case timing
+        when 'three_days_before' then 3
+        when 'one_day_before' then 1
+        else 0
+    end;
+$$;
+
+-- window_start <= 通知時刻 < window_end となる食品をまとめて返す。
+-- 賞味期限の範囲で先に絞り込むため、コストはユーザー数ではなく対象の食品数に比例する。
+create or replace function public.due_expiry_notifications(
+    window_start timestamptz,
+    window_end timestamptz,
+    notify_hour integer default 9,
+    tz text default 'Asia/Tokyo'
+)
+returns table (
+    user_id uuid,
+    food_id uuid,
+    name text,
+    category text,
+    expiration_date date,
+    timing text,
+    voice_enabled boolean,
+    notify_at timestamptz
+)
+language sql
+stable
+as $$
+    select *
+    from (
+        select
+            f.user_id,
+            f.id as food_id,
+            f.name,
+            f.category,
+            f.expiration_date,
+            coalesce(s.timing, 'on_expiry_date') as timing,
+            coalesce(s.voice_enabled, true) as voice_enabled,
+            ((f.expiration_date - public.notification_offset_days(coalesce(s.timing, 'on_expiry_date')))::timestamp
+                + make_interval(hours => notify_hour)) at time zone tz as notify_at
+        from public.foods f
+        left join public.notification_settings s on s.user_id = f.user_id
+        where f.expiration_date >= (window_start at time zone tz)::date
+          and f.expiration_date <= (window_end at time zone tz)::date + 3
+          and coalesce(s.enabled, true)
+    ) due
+    where due.notify_at >= window_start
+      and due.notify_at < window_end
+    order by due.notify_at;
+$$;
@@ -0,0 +1,12 @@
+-- 通知設定の部分upsert用のデフォルト値と一意制約
+-- APIは変更されたフィールドだけを送信するため、新規作成時の未指定列はここで補う
+
+alter table public.notification_settings
+    alter column enabled set default true,
+    alter column timing set default 'on_expiry_date',
+    alter column voice_enabled set default true,
+    alter column created_at set default now(),
+    alter column updated_at set default now();
+
+create unique index if not exists notification_settings_user_id_key
+    on public.notification_settings (user_id);
@@ -0,0 +1,50 @@
+-- ダッシュボード用の集計RPCとインデックス
+-- 食品一覧を全件取得せずに、期限の区分ごと・カテゴリごとの件数と、次に期限が来る食品を返す
+
+-- ユーザーごとの期限順の走査用。category を含めて集計をインデックスのみで行えるようにする
+-- （id は一覧APIのカーソル (expiration_date, id) の並び順にも使う）
+create index if not exists foods_user_id_expiration_date_idx
+    on public.foods (user_id, expiration_date, id)
+    include (category);
+
+-- 区分: expired（今日より前） / today（今日） / this_week（明日〜soon_days日後） / later（それ以降）
+-- 件数はカテゴリごとに1行、expiring_soon は今日以降で期限が近い順に top_k 件
+create or replace function public.food_summary(
+    target_user_id uuid,
+    today date,
+    soon_days integer default 7,
+    top_k integer default 5
+)
+returns jsonb
+language sql
+stable
+as $$
+    select jsonb_build_object(
+        'categories', coalesce((
+            select jsonb_agg(to_jsonb(c) order by c.category)
+            from (
+                select
+                    f.category,
+                    count(*) filter (where f.expiration_date < today) as expired,
+                    count(*) filter (where f.expiration_date = today) as today,
+                    count(*) filter (where f.expiration_date > today and f.expiration_date <= today + soon_days) as this_week,
+                    count(*) filter (where f.expiration_date > today + soon_days) as later,
+                    count(*) as total
+                from public.foods f
+                where f.user_id = target_user_id
+                group by f.category
+            ) c
+        ), '[]'::jsonb),
+        'expiring_soon', coalesce((
+            select jsonb_agg(to_jsonb(s) order by s.expiration_date, s.id)
+            from (
+                select f.id, f.name, f.expiration_date, f.category, f.image_url
+                from public.foods f
+                where f.user_id = target_user_id
+                  and f.expiration_date >= today
+                order by f.expiration_date, f.id
+                limit top_k
+            ) s
+        ), '[]'::jsonb)
+    );
+$$;
@@ -0,0 +1,69 @@
+-- 期限通知の対象を、時間窓に入る通知時刻から逆算した賞味期限だけで絞り込む
+-- 以前は窓の開始日〜終了日+3日の食品（約4日分）を毎回走査していたが、通知時刻は1日に1回（notify_hour 時）のため、
+-- 窓が notify_hour 時をまたがない大半の tick では対象の賞味期限がなく、食品を読まずに終わる。
+-- 窓がまたぐ場合も、対象は通知日 + 各タイミングの日数（0 / 1 / 3日）の賞味期限だけになる。
+
+create or replace function public.due_expiry_notifications(
+    window_start timestamptz,
+    window_end timestamptz,
+    notify_hour integer default 9,
+    tz text default 'Asia/Tokyo'
+)
+returns table (
+    user_id uuid,
+    food_id uuid,
+    name text,
+    category text,
+    expiration_date date,
+    timing text,
+    voice_enabled boolean,
+    notify_at timestamptz
+)
+language sql
+stable
+as $$
+    with notify_dates as (
+        -- 窓の中に notify_hour 時（tz基準）が来る日
+        select d::date as notify_date
+        from generate_series(
+            (window_start at time zone tz)::date,
+            (window_end at time zone tz)::date,
+            interval '1 day'
+        ) d
+        where ((d::date)::timestamp + make_interval(hours => notify_hour)) at time zone tz >= window_start
+          and ((d::date)::timestamp + make_interval(hours => notify_hour)) at time zone tz < window_end
+    ),
+    candidates as (
+        select array_agg(n.notify_date + public.notification_offset_days(t.timing)) as expiration_dates
+        from notify_dates n
+        cross join (values ('on_expiry_date'), ('one_day_before'), ('three_days_before')) t (timing)
+    )
+    select *
+    from (
+        select
+            f.user_id,
+            f.id as food_id,
+            f.name,
+            f.category,
+            f.expiration_date,
+            coalesce(s.timing, 'on_expiry_date') as timing,
+            coalesce(s.voice_enabled, true) as voice_enabled,
+            ((f.expiration_date - public.notification_offset_days(coalesce(s.timing, 'on_expiry_date')))::timestamp
+                + make_interval(hours => notify_hour)) at time zone tz as notify_at
+        from public.foods f
+        left join public.notification_settings s on s.user_id = f.user_id
+        -- 対象の日付がない場合（配列がnull）は foods_expiration_date_idx を引かずに0件になる
+        where f.expiration_date = any ((select expiration_dates from candidates))
+          and coalesce(s.enabled, true)
+    ) due
+    where due.notify_at >= window_start
+      and due.notify_at < window_end
+    order by due.notify_at;
+$$;
+
+-- 期限通知スケジューラの送信済みの位置（ウォーターマーク）。再起動時はここから取得を再開する
+create table if not exists public.notification_scheduler_state (
+    name text primary key,
+    delivered_until timestamptz not null,
+    updated_at timestamptz not null default now()
+);
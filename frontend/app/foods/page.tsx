@@ -9,7 +9,7 @@ import { Button } from "../components/ui/button";
 import Link from 'next/link';
 import Image from 'next/image';
 import { RecipeModal } from "@/app/components/Food/RecipeModal";
-import { getNotificationSettings } from '../lib/api';
+import { getAllFoods, getNotificationSettings } from '../lib/api';
 
 interface Food {
   id: string;
@@ -176,10 +176,9 @@ export default function FoodPage() {
     }
 
     if (user) {
-      apiClient
-      .get<Food[]>('/api/foods') // APIから食品データを取得
-      .then((response) => {
-        setFoods(response.data); // データを状態に保存
+      getAllFoods<Food>() // APIから食品データを全ページ分取得
+      .then((data) => {
+        setFoods(data); // データを状態に保存
       })
         .catch((error) => {
           console.error('API Error:', error);
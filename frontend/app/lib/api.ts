@@ -67,6 +67,20 @@ export async function analyzeImage(image: File) {
   }
 }
 
+// 食品一覧はページ単位で返されるため、X-Next-Cursor がなくなるまで続けて取得する
+export async function getAllFoods<T>(): Promise<T[]> {
+  const foods: T[] = [];
+  let cursor: string | undefined;
+  do {
+    const response = await apiClient.get<T[]>('/api/foods', {
+      params: { limit: 500, ...(cursor ? { cursor } : {}) },
+    });
+    foods.push(...response.data);
+    cursor = response.headers['x-next-cursor'];
+  } while (cursor);
+  return foods;
+}
+
 export async function getUserProfile(userId: string) {
   try {
     const response = await apiClient.get(`/api/user/${userId}`);